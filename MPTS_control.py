@@ -5,6 +5,7 @@
 """
 
 from future.builtins import super
+import collections
 import datetime
 import sys
 import logging
@@ -14,6 +15,9 @@ import ctypes
 from PyQt5 import QtCore, QtWidgets, QtGui
 from ui.mainwindow import Ui_MainWindow
 
+import acquisition
+import connection
+import monitor
 import settings
 import storage
 from instruments import laserpowersupply, ophir, phantomv7, spectrometer, tektronix, AlazarTech, I2PS
@@ -50,6 +54,9 @@ class MPTS_Control(QtWidgets.QMainWindow):
     Note: Never modify "mainwindow.py" or "resource_rc.py" manually.
     """
 
+    # Calls a function in the GUI thread, when emitted from another thread
+    callInGui = QtCore.pyqtSignal(object)
+
     def __init__(self):
         super().__init__()
 
@@ -66,6 +73,11 @@ class MPTS_Control(QtWidgets.QMainWindow):
         self.setting_up = True
         self.waiting_trigger = False
         self.saving_data = False
+        self.save_thread = None
+        self.save_worker = None
+        self.trigger_watcher = None
+        self.connecting = set()  # devices with a connection running in the background
+        self.callInGui.connect(self.CallInGui)
 
         # Reload settings from the last session
         self.config = QtCore.QSettings("settings.ini", QtCore.QSettings.IniFormat)
@@ -107,14 +119,20 @@ class MPTS_Control(QtWidgets.QMainWindow):
         # self.Phantom1Init()
         # self.Phantom2Init()
 
+        # Poll the status of the instruments in the background
+        self.StartMonitor()
 
-    @QtCore.pyqtSlot()
-    def refresh(self):
-        if self.ui.checkBoxContinuouslyUpdate.isChecked():
-            self.LaserUpdate()
-            self.TriggerUpdate()
-            self.OphirUpdate()
-            self.I2PSUpdate()
+
+    def StartMonitor(self):
+        """Poll the status of the devices in the background, one thread per device."""
+        self.monitor = monitor.StatusMonitor()
+        self.monitor.add("laser PS", lambda: monitor.readLaserStatus(self.laserPS), self.LaserShowStatus)
+        self.monitor.add("cRio", lambda: monitor.readTriggerStatus(self.cRio), self.TriggerShowStatus)
+        self.monitor.add("Ophir", lambda: monitor.readOphirStatus(self.ophir), self.OphirShowStatus)
+        self.monitor.add("I2PS", lambda: monitor.readI2PSStatus(self.i2ps), self.I2PSShowStatus)
+        self.monitor.setEnabled(self.ui.checkBoxContinuouslyUpdate.isChecked())
+        self.ui.checkBoxContinuouslyUpdate.toggled.connect(self.monitor.setEnabled)
+        self.monitor.start()
 
     @QtCore.pyqtSlot()
     def reloadAutomatic(self):
@@ -123,19 +141,35 @@ class MPTS_Control(QtWidgets.QMainWindow):
             self.LaserCharge()
             self.StartAcquisition()
 
-    @QtCore.pyqtSlot()
-    def wasTriggered(self):
-        """Check if the system was triggered. If so, starts recording proceadure"""
-        mode = self.ui.comboBoxOperationMode.currentIndex()
-        if mode != 2:
-            if self.phantom1.wasTriggered() or self.phantom2.wasTriggered():
-                self.SaveData()
-                return
+    def StartTriggerWatcher(self):
+        """Watch for the trigger in the background: the cameras, or the ADC and the scope in mode 2."""
+        self.trigger_watcher = monitor.TriggerWatcher()
+        if self.ui.comboBoxOperationMode.currentIndex() != 2:
+            self.trigger_watcher.add("Phantom camera 1", self.phantom1.wasTriggered, 0.1)
+            self.trigger_watcher.add("Phantom camera 2", self.phantom2.wasTriggered, 0.1)
         else:
-            if (self.adc is not None and self.adc.wasTriggered()) or (self.scope.isConnected() and self.scope.wasTriggered()):
-                self.SaveData()
-                return
+            if self.adc is not None:
+                self.trigger_watcher.add("ADC", self.adc.wasTriggered, 0.01)
+            if self.scope.connection_status:
+                self.trigger_watcher.add("Scope", self.scope.wasTriggered, 0.2)
+        self.trigger_watcher.triggered.connect(self.Triggered)
+        self.trigger_watcher.start()
+
+    def StopTriggerWatcher(self):
+        if self.trigger_watcher is not None:
+            self.trigger_watcher.stop()
+            self.trigger_watcher = None
+
+    @QtCore.pyqtSlot(float)
+    def Triggered(self, timestamp):
+        """The system was triggered: starts recording proceadure"""
+        if self.waiting_trigger:
+            print("Triggered at %s" % datetime.datetime.fromtimestamp(timestamp).strftime("%H:%M:%S.%f")[:-3])
+            self.SaveData()
 
+    @QtCore.pyqtSlot()
+    def waitingTrigger(self):
+        """Animate the message in the status bar while waiting for the trigger."""
         msg = self.statusBar.currentMessage()
         if len(msg) >= len("Waiting trigger..."):
             self.statusBar.showMessage("Waiting trigger")
@@ -150,7 +184,7 @@ class MPTS_Control(QtWidgets.QMainWindow):
 
         # Laser
         self.ui.pushButtonLaserInit.clicked.connect(self.LaserInit)
-        self.ui.pushButtonLaserApplySettings.clicked.connect(self.LaserApplySettings)
+        self.ui.pushButtonLaserApplySettings.clicked.connect(lambda: self.LaserApplySettings(force=True))
         self.ui.pushButtonLaserCharge.clicked.connect(self.LaserCharge)
         self.ui.pushButtonLaserDump.clicked.connect(self.LaserDump)
         self.ui.pushButtonLaserReset.clicked.connect(self.LaserReset)
@@ -168,7 +202,7 @@ class MPTS_Control(QtWidgets.QMainWindow):
         self.ui.pushButtonTriggerLoadFile.clicked.connect(self.TriggerLoadFile)
         self.ui.pushButtonTriggerSaveFile.clicked.connect(self.TriggerSaveFile)
         self.ui.pushButtonTriggerRetrieveSettings.clicked.connect(self.TriggerRetrieveSettings)
-        self.ui.pushButtonTriggerSendSettings.clicked.connect(self.TriggerApplySettings)
+        self.ui.pushButtonTriggerSendSettings.clicked.connect(lambda: self.TriggerApplySettings(force=True))
         self.ui.pushButtonTriggerInit.clicked.connect(self.TriggerInit)
 
         # Cameras
@@ -182,7 +216,7 @@ class MPTS_Control(QtWidgets.QMainWindow):
         # I2PS
         self.ui.comboBoxI2PSSelectPS.currentIndexChanged.connect(self.I2PSSelectPS)
         self.ui.pushButtonI2PSInit.clicked.connect(self.I2PSInit)
-        self.ui.pushButtonI2PSApplySettings.clicked.connect(self.I2PSApplySettings)
+        self.ui.pushButtonI2PSApplySettings.clicked.connect(lambda: self.I2PSApplySettings(force=True))
         self.ui.pushButtonI2PSReset.clicked.connect(self.I2PSReset)
         self.ui.pushButtonI2PSEnablePS.clicked.connect(self.I2PSEnablePS)
         self.ui.pushButtonI2PSEnablePulse.clicked.connect(self.I2PSEnablePulse)
@@ -193,14 +227,9 @@ class MPTS_Control(QtWidgets.QMainWindow):
 
         self.ui.pushButtonADCInit.clicked.connect(self.ADCInit)
 
-        self.wasTriggeredTimer = QtCore.QTimer(self)
-        self.wasTriggeredTimer.timeout.connect(self.wasTriggered)
-        self.wasTriggeredTimer.setInterval(1000)
-
-        self.refreshTimer = QtCore.QTimer(self)
-        self.refreshTimer.timeout.connect(self.refresh)
-        self.refreshTimer.setInterval(2000)
-        self.refreshTimer.start()
+        self.waitingTriggerTimer = QtCore.QTimer(self)
+        self.waitingTriggerTimer.timeout.connect(self.waitingTrigger)
+        self.waitingTriggerTimer.setInterval(1000)
 
         # Automatic setup in tokamak automatic mode: recharge and reaload after 5 minutes
         self.reloadAutomaticTimer = QtCore.QTimer(self)
@@ -212,23 +241,25 @@ class MPTS_Control(QtWidgets.QMainWindow):
         Save UI settings and stops the running thread gracefully, then exit the application.
         Called when closing the application window.
         """
-        self.refreshTimer.stop()
+        self.monitor.stop()
+        self.StopTriggerWatcher()
+        if self.saving_data:
+            self.save_worker.abort()
+            self.save_thread.wait()
         settings.save_settings(self.config, self.ui)
         # Accept the closing event and close application
         event.accept()
 
+    @QtCore.pyqtSlot(object)
+    def CallInGui(self, func):
+        func()
+
     # Instruments Functions
     def ADCInit(self):
         if self.adc is None:
             self.statusBar.showMessage("Trying to connect with the AlazarTech ADC...", 1000)
             try:
-                self.adc = AlazarTech.Digitizer()
-                self.ui.ADCStatus.setText("Connected")
-                self.ui.ADCName.setText(self.adc.getName())
-                self.ui.ADCSerialNumber.setText(str(self.adc.getSerialNumber()))
-                self.ui.ADCMemory.setText(str(self.adc.getMemorySize()))
-                self.ui.ledStatusADC.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
-                self.ADCUpdateAcquisitionTime()
+                self.ADCConnected(self.ADCOpen(self.config.value("ADC/Boards", 1, type=int), self.config.value("ADC/Backend", "ATSApi", type=str)))
             except:
                 self.adc = None
         else:
@@ -244,6 +275,34 @@ class MPTS_Control(QtWidgets.QMainWindow):
         #    except:
         #        self.adc = None
 
+    def ADCOpen(self, boards, backend):
+        """Open the ADC: a single digitizer or, with more than one board, a group of digitizers acquiring together."""
+        if boards > 1:
+            return AlazarTech.DigitizerGroup([(1, i + 1) for i in range(boards)], backend=backend)
+        return AlazarTech.Digitizer(backend=backend)
+
+    def ADCChannelCount(self):
+        return self.adc.channelCount if self.adc is not None else 2
+
+    def ADCEnabledChannels(self):
+        """Return the enable state of each ADC channel. The channels of the other boards are set in settings.ini."""
+        enabled = [self.ui.ADCCH1Enable.isChecked(), self.ui.ADCCH2Enable.isChecked()]
+        for n in range(3, self.ADCChannelCount() + 1):
+            enabled.append(self.config.value("ADC/CH%dEnable" % n, True, type=bool))
+        return enabled
+
+    def ADCConnected(self, adc):
+        """Update the UI after connecting with the ADC (adc is None if the connection failed)."""
+        if adc is not None:
+            self.adc = adc
+        if self.adc is not None:
+            self.ui.ADCStatus.setText("Connected")
+            self.ui.ADCName.setText(self.adc.getName())
+            self.ui.ADCSerialNumber.setText(str(self.adc.getSerialNumber()))
+            self.ui.ADCMemory.setText(str(self.adc.getMemorySize()))
+            self.ui.ledStatusADC.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
+            self.ADCUpdateAcquisitionTime()
+
     def ADCApplySettings(self):
         if self.adc is not None:
             pass
@@ -251,7 +310,7 @@ class MPTS_Control(QtWidgets.QMainWindow):
             self.adc.AlazarSetCaptureClock(SourceId=1, SampleRateId=AlazarTech.sample_rate_id[self.ui.ADCSampleRate.currentText()])
             # print("ADC: <<%s, id = %d" % (self.ui.ADCSampleRate.currentText(), AlazarTech.sample_rate_id[self.ui.ADCSampleRate.currentText()]))
             # Configure each channel
-            for n in range(2):
+            for n in range(self.adc.channelCount):
                 # Coupling DC, Inpedance 1MOhm
                 self.adc.AlazarInputControl(Channel=n + 1, Coupling=2, InputRange=AlazarTech.input_range[self.ui.ADCInputRange.currentText()], Impedance=1)
                 # Disable BW Limit
@@ -281,34 +340,52 @@ class MPTS_Control(QtWidgets.QMainWindow):
         sample_rate = int(float(self.ui.ADCSampleRate.currentText().replace(" kS/s", "e3").replace(" MS/s", "e6")))
         self.ui.ADCAcquisitionTime.setText("%.3f" % (1e3 * self.ui.ADCRecordLength.value() / sample_rate))
 
+    def ADCEdgeThresholds(self):
+        """Return the (low, high) thresholds, in volts, used to find the edges of the pulses of each ADC channel."""
+        threshold = self.config.value("ADC/EdgeThreshold", 3.0, type=float)
+        hysteresis = self.config.value("ADC/EdgeHysteresis", 0.5, type=float)
+        return {ch: (threshold - hysteresis / 2, threshold + hysteresis / 2) for ch in range(1, self.ADCChannelCount() + 1)}
+
     # Laser fuctions
     def LaserInit(self):
         if not self.laserPS.isConnected():
             self.statusBar.showMessage("Trying to connect with the Laser Power meter...", 1000)
-            self.laserPS.openConnection(self.ui.LaserPSSerialPort.text())
-            if self.laserPS.isConnected():
-                self.ui.ledStatusLaser.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
-                self.ui.LaserPSStatus.setText("Connected")
-            else:
-                self.ui.LaserPSStatus.setText(MESSAGE_NOT_CONNECTED)
-                self.statusBar.showMessage("Error trying to connect with the Laser Power Supply", 1000)
-                self.ui.ledStatusLaser.setPixmap(QtGui.QPixmap(ICON_RED_LED))
+            self.LaserConnected(self.LaserConnect(self.ui.LaserPSSerialPort.text()))
         else:
             self.statusBar.showMessage("Laser Power Supply already connected.", 1000)
 
-    def LaserApplySettings(self):
+    def LaserConnect(self, port):
+        """Connect with the laser power supply. Returns True on success."""
+        self.laserPS.openConnection(port)
+        return self.laserPS.isConnected()
+
+    def LaserConnected(self, connected=False):
+        """Update the UI after connecting with the laser power supply."""
+        if connected:
+            self.ui.ledStatusLaser.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
+            self.ui.LaserPSStatus.setText("Connected")
+        else:
+            self.ui.LaserPSStatus.setText(MESSAGE_NOT_CONNECTED)
+            self.statusBar.showMessage("Error trying to connect with the Laser Power Supply", 1000)
+            self.ui.ledStatusLaser.setPixmap(QtGui.QPixmap(ICON_RED_LED))
+
+    def LaserApplySettings(self, force=False):
+        """Apply the settings that changed since they were last sent (all of them if force is True)."""
         if self.laserPS.isConnected():
-            self.laserPS.setModeBanks(self.ui.LaserPSModeBanks.value())
-            self.laserPS.setResBurstDuration(self.ui.LaserPSMaxBurstDuration.value())
-            self.laserPS.setBurstDuration(9)  # ms. tau_f = tau_R + Npc*Ppc + Ppc/2 < tau_maxcode ***** FIX *******
-            self.laserPS.setMainVoltage(self.ui.LaserPSMainVoltage.value())
-            self.laserPS.setComAuxVoltage(self.ui.LaserPSAux1Voltage.value())
-            self.laserPS.setAux2Voltage(self.ui.LaserPSAux2Voltage.value())
-            self.laserPS.setAux3Voltage(self.ui.LaserPSAux3Voltage.value())
-            self.laserPS.setAuxDelay(self.ui.LaserPSAuxDelay.value())
-            self.laserPS.setSimmerDelay(self.ui.LaserPSSimmerDelay.value())
-            self.laserPS.setNBurst(self.ui.LaserPSBurstNumber.value())
-            self.laserPS.setBurstSeperation(self.ui.LaserPSBurstSeperation.value())
+            # in the order of the commands to the power supply
+            settings = collections.OrderedDict([
+                ("ModeBanks", self.ui.LaserPSModeBanks.value()),
+                ("ResBurstDuration", self.ui.LaserPSMaxBurstDuration.value()),
+                ("BurstDuration", 9),  # ms. tau_f = tau_R + Npc*Ppc + Ppc/2 < tau_maxcode ***** FIX *******
+                ("MainVoltage", self.ui.LaserPSMainVoltage.value()),
+                ("ComAuxVoltage", self.ui.LaserPSAux1Voltage.value()),
+                ("Aux2Voltage", self.ui.LaserPSAux2Voltage.value()),
+                ("Aux3Voltage", self.ui.LaserPSAux3Voltage.value()),
+                ("AuxDelay", self.ui.LaserPSAuxDelay.value()),
+                ("SimmerDelay", self.ui.LaserPSSimmerDelay.value()),
+                ("NBurst", self.ui.LaserPSBurstNumber.value()),
+                ("BurstSeperation", self.ui.LaserPSBurstSeperation.value())])
+            self.laserPS.applySettings(settings, force)
         else:
             self.ui.LaserPSStatus.setText(MESSAGE_NOT_CONNECTED)
             self.statusBar.showMessage('Laser Power Supply NOT connected! Command ignored.', 2500)
@@ -352,21 +429,19 @@ class MPTS_Control(QtWidgets.QMainWindow):
             self.statusBar.showMessage('Laser Power Supply NOT connected! Command ignored.', 2500)
 
     def LaserUpdate(self):
-        if self.laserPS.isConnected():
-            if self.laserPS.getLaserStatus():
-                self.ui.LaserPSStatus.setText(self.laserPS.getPowerErrorStr())
+        self.LaserShowStatus(monitor.readLaserStatus(self.laserPS))
+
+    def LaserShowStatus(self, status):
+        """Show a monitor.LaserStatus snapshot."""
+        if status.connected:
+            if status.error is not None:
+                self.ui.LaserPSStatus.setText(status.error)
             self.ui.ledStatusLaser.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
-            try:
-                voltages = self.laserPS.getVoltageBanksAll()
-                self.ui.LaserPSMainVoltageMeas.display(voltages[0])
-                self.ui.LaserPSAux1VoltageMeas.display(voltages[1])
-                self.ui.LaserPSAux2VoltageMeas.display(voltages[2])
-                self.ui.LaserPSAux3VoltageMeas.display(voltages[3])
-            except:
-                self.ui.LaserPSMainVoltageMeas.display(-1)
-                self.ui.LaserPSAux1VoltageMeas.display(-1)
-                self.ui.LaserPSAux2VoltageMeas.display(-1)
-                self.ui.LaserPSAux3VoltageMeas.display(-1)
+            voltages = status.voltages or (-1, -1, -1, -1)
+            self.ui.LaserPSMainVoltageMeas.display(voltages[0])
+            self.ui.LaserPSAux1VoltageMeas.display(voltages[1])
+            self.ui.LaserPSAux2VoltageMeas.display(voltages[2])
+            self.ui.LaserPSAux3VoltageMeas.display(voltages[3])
 
     def LaserRefresh(self):
         if self.laserPS.isConnected():
@@ -426,28 +501,49 @@ class MPTS_Control(QtWidgets.QMainWindow):
         """Initialize connection with wht image intensifier power supply"""
         if not self.i2ps.isConnected():
             self.statusBar.showMessage("Trying to connect with the Image Intensifier PS...", 1000)
-            self.i2ps.openConnection(ip=self.ui.I2PSIP.text())
-            if self.i2ps.isConnected():
-                self.ui.ledStatusI2PS.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
-                self.ui.I2PSStatus.setText("Connected")
-                self.I2PSApplySettings()
-                self.I2PSUpdate()
-            else:
-                self.ui.I2PSStatus.setText(MESSAGE_NOT_CONNECTED)
-                self.statusBar.showMessage("Error trying to connect with the Image Intensifier.", 1000)
-                self.ui.ledStatusI2PS.setPixmap(QtGui.QPixmap(ICON_RED_LED))
+            self.I2PSConnected(self.I2PSConnect(self.ui.I2PSIP.text(), self.I2PSSettings()))
         else:
             self.statusBar.showMessage("Connection with the Image Intensifier PS already stabilished.", 1000)
 
-    def I2PSApplySettings(self):
-        """Apply the settings on the image intensifier power supply"""
+    def I2PSConnect(self, ip, settings):
+        """Connect with the image intensifier power supply and apply the settings (see I2PSSettings).
+        Returns its status (monitor.I2PSStatus), or None if the connection failed."""
+        self.i2ps.openConnection(ip=ip)
+        if not self.i2ps.isConnected():
+            return None
+        errors = self.i2ps.applySettings(settings, True)
+        if errors:
+            print("Settings not confirmed by the Image Intensifier PS: %s" % ", ".join(errors))
+        return monitor.readI2PSStatus(self.i2ps)
+
+    def I2PSConnected(self, status=None):
+        """Update the UI after connecting with the image intensifier power supply."""
+        if status is not None:
+            self.ui.ledStatusI2PS.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
+            self.ui.I2PSStatus.setText("Connected")
+            self.I2PSShowStatus(status)
+        else:
+            self.ui.I2PSStatus.setText(MESSAGE_NOT_CONNECTED)
+            self.statusBar.showMessage("Error trying to connect with the Image Intensifier.", 1000)
+            self.ui.ledStatusI2PS.setPixmap(QtGui.QPixmap(ICON_RED_LED))
+
+    def I2PSApplySettings(self, force=False):
+        """Apply the settings on the image intensifier power supply that changed
+        since they were last confirmed (all of them if force is True)."""
         if self.i2ps.isConnected():
-            self.i2ps.setPulseDuration(self.ui.I2PSPulseDuration.value())
-            self.i2ps.setTriggerDelay(self.ui.I2PSTriggerDelay.value())
-            self.i2ps.setVoltagePPMCP(self.ui.I2PSVoltagePPMCP.value())
-            self.i2ps.setVoltageMCP(self.ui.I2PSVoltageMCP.value())
-            self.i2ps.setVoltagePCHighSide(self.ui.I2PSVoltagePCHighSide.value())
-            self.i2ps.setVoltagePCLowSide(self.ui.I2PSVoltagePCLowSide.value())
+            errors = self.i2ps.applySettings(self.I2PSSettings(), force)
+            if errors:
+                print("Settings not confirmed by the Image Intensifier PS: %s" % ", ".join(errors))
+
+    def I2PSSettings(self):
+        """Return the settings of the image intensifier power supply in the UI."""
+        return collections.OrderedDict([
+            ("PulseDuration", self.ui.I2PSPulseDuration.value()),
+            ("TriggerDelay", self.ui.I2PSTriggerDelay.value()),
+            ("VoltagePPMCP", self.ui.I2PSVoltagePPMCP.value()),
+            ("VoltageMCP", self.ui.I2PSVoltageMCP.value()),
+            ("VoltagePCHighSide", self.ui.I2PSVoltagePCHighSide.value()),
+            ("VoltagePCLowSide", self.ui.I2PSVoltagePCLowSide.value())])
 
     def I2PSStartAcquisition(self):
         """Start Acquisition by enabling power supply and triggering."""
@@ -482,98 +578,126 @@ class MPTS_Control(QtWidgets.QMainWindow):
 
     def I2PSUpdate(self):
         """Apply the settings on the image intensifier power supply"""
-        if self.i2ps.isConnected():
-            try:
-                self.ui.labelI2PSVoltagePPMCP.setText(str(self.i2ps.getVoltagePPMCP()))
-                self.ui.labelI2PSVoltageMCP.setText(str(self.i2ps.getVoltageMCP()))
-                self.ui.labelI2PSPCHighSide.setText(str(self.i2ps.getVoltagePCHighSide()))
-                self.ui.labelI2PSPCLowSide.setText(str(self.i2ps.getVoltagePCLowSide()))
-                self.ui.labelI2PSCurrentPP.setText(str(self.i2ps.getCurrentPP()))
-                self.ui.labelI2PSCurrentMCP.setText(str(self.i2ps.getCurrentMCP()))
-                self.ui.labelI2PSCurrentPCHighSide.setText(str(self.i2ps.getCurrentPCHighSide()))
-                self.ui.labelI2PSCurrentPCLowSide.setText(str(self.i2ps.getCurrentPCLowSide()))
-                PP_error, MCP_error, PC_h_error, PC_l_error = self.i2ps.getErrorState()
-                self.ui.ledI2PSCurrentOverflowPP.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if PP_error else ICON_RED_LED))
-                self.ui.ledI2PSCurrentOverflowMCP.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if MCP_error else ICON_RED_LED))
-                self.ui.ledI2PSCurrentOverflowPCHighSide.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if PC_h_error else ICON_RED_LED))
-                self.ui.ledI2PSCurrentOverflowPCLowSide.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if PC_l_error else ICON_RED_LED))
-                if self.i2ps.isPSEnabled():
-                    self.ui.pushButtonI2PSEnablePS.setText("Disable PS")
-                else:
-                    self.ui.pushButtonI2PSEnablePS.setText("Enable PS")
-                if self.i2ps.isPulseEnabled():
-                    self.ui.pushButtonI2PSEnablePulse.setText("Disable Pulse")
-                else:
-                    self.ui.pushButtonI2PSEnablePulse.setText("Enable Pulse")
-            except:
-                print("Error while trying update I2PS status")
+        try:
+            self.I2PSShowStatus(monitor.readI2PSStatus(self.i2ps))
+        except:
+            print("Error while trying update I2PS status")
+
+    def I2PSShowStatus(self, status):
+        """Show a monitor.I2PSStatus snapshot."""
+        if status.connected:
+            self.ui.labelI2PSVoltagePPMCP.setText(str(status.voltages[0]))
+            self.ui.labelI2PSVoltageMCP.setText(str(status.voltages[1]))
+            self.ui.labelI2PSPCHighSide.setText(str(status.voltages[2]))
+            self.ui.labelI2PSPCLowSide.setText(str(status.voltages[3]))
+            self.ui.labelI2PSCurrentPP.setText(str(status.currents[0]))
+            self.ui.labelI2PSCurrentMCP.setText(str(status.currents[1]))
+            self.ui.labelI2PSCurrentPCHighSide.setText(str(status.currents[2]))
+            self.ui.labelI2PSCurrentPCLowSide.setText(str(status.currents[3]))
+            PP_error, MCP_error, PC_h_error, PC_l_error = status.errors
+            self.ui.ledI2PSCurrentOverflowPP.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if PP_error else ICON_RED_LED))
+            self.ui.ledI2PSCurrentOverflowMCP.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if MCP_error else ICON_RED_LED))
+            self.ui.ledI2PSCurrentOverflowPCHighSide.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if PC_h_error else ICON_RED_LED))
+            self.ui.ledI2PSCurrentOverflowPCLowSide.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if PC_l_error else ICON_RED_LED))
+            if status.ps_enabled:
+                self.ui.pushButtonI2PSEnablePS.setText("Disable PS")
+            else:
+                self.ui.pushButtonI2PSEnablePS.setText("Enable PS")
+            if status.pulse_enabled:
+                self.ui.pushButtonI2PSEnablePulse.setText("Disable Pulse")
+            else:
+                self.ui.pushButtonI2PSEnablePulse.setText("Enable Pulse")
 
     def Phantom1Init(self):
         """Initializes the first Phantom camera."""
         if not self.phantom1.isConnected():
             self.statusBar.showMessage("Trying to connect with the Phantom camera 1...", 1000)
-            self.phantom1.openConnection(self.ui.Phantom1IP.text())
-            if self.phantom1.isConnected():
-                self.ui.Phantom1Status.setText("Connected")
-                self.ui.ledStatusPhantom1.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
-                self.ui.labelPhantom1Name.setText(self.phantom1.getName())
-                self.ui.labelPhantom1Serial.setText(self.phantom1.getSerialNumber())
-            else:
-                self.ui.Phantom1Status.setText(MESSAGE_NOT_CONNECTED)
-                self.statusBar.showMessage("Error trying to connect with the Phantom 1.", 1000)
-                self.ui.ledStatusPhantom1.setPixmap(QtGui.QPixmap(ICON_RED_LED))
+            self.Phantom1Connected(self.PhantomConnect(self.phantom1, self.ui.Phantom1IP.text()))
         else:
             self.statusBar.showMessage("Connection with the Phantom camera 1 already stabilished.", 1000)
 
+    def PhantomConnect(self, phantom, ip):
+        """Connect with a Phantom camera. Returns its name and serial number, or None if the connection failed."""
+        phantom.openConnection(ip)
+        if not phantom.isConnected():
+            return None
+        return phantom.getName(), phantom.getSerialNumber()
+
+    def Phantom1Connected(self, info=None):
+        """Update the UI after connecting with the Phantom camera 1 (info is (name, serial number))."""
+        if info is not None:
+            self.ui.Phantom1Status.setText("Connected")
+            self.ui.ledStatusPhantom1.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
+            self.ui.labelPhantom1Name.setText(info[0])
+            self.ui.labelPhantom1Serial.setText(info[1])
+        else:
+            self.ui.Phantom1Status.setText(MESSAGE_NOT_CONNECTED)
+            self.statusBar.showMessage("Error trying to connect with the Phantom 1.", 1000)
+            self.ui.ledStatusPhantom1.setPixmap(QtGui.QPixmap(ICON_RED_LED))
+
     def Phantom2Init(self):
         """Initializes the first Phantom camera."""
         if not self.phantom2.isConnected():
             self.statusBar.showMessage("Trying to connect with the Phantom camera 2...", 1000)
-            self.phantom2.openConnection(self.ui.Phantom2IP.text())
-            if self.phantom2.isConnected():
-                self.ui.Phantom2Status.setText("Connected")
-                self.ui.ledStatusPhantom2.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
-                self.ui.labelPhantom2Name.setText(self.phantom2.getName())
-                self.ui.labelPhantom2Serial.setText(self.phantom2.getSerialNumber())
-            else:
-                self.ui.Phantom2Status.setText(MESSAGE_NOT_CONNECTED)
-                self.statusBar.showMessage("Error trying to connect with the Phantom 2.", 1000)
-                self.ui.ledStatusPhantom2.setPixmap(QtGui.QPixmap(ICON_RED_LED))
+            self.Phantom2Connected(self.PhantomConnect(self.phantom2, self.ui.Phantom2IP.text()))
         else:
             self.statusBar.showMessage("Connection with the Phantom camera 2 already stabilished.", 1000)
 
+    def Phantom2Connected(self, info=None):
+        """Update the UI after connecting with the Phantom camera 2 (info is (name, serial number))."""
+        if info is not None:
+            self.ui.Phantom2Status.setText("Connected")
+            self.ui.ledStatusPhantom2.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
+            self.ui.labelPhantom2Name.setText(info[0])
+            self.ui.labelPhantom2Serial.setText(info[1])
+        else:
+            self.ui.Phantom2Status.setText(MESSAGE_NOT_CONNECTED)
+            self.statusBar.showMessage("Error trying to connect with the Phantom 2.", 1000)
+            self.ui.ledStatusPhantom2.setPixmap(QtGui.QPixmap(ICON_RED_LED))
+
     # Ophir Power Meter
     def OphirInit(self):
         """Initializes the Ophir Energy Power Meter."""
         if not self.ophir.isConnected():
             self.statusBar.showMessage("Trying to connect with Ophir (Laser Power meter)...", 1000)
-            self.ophir.openConnection(self.ui.OphirSerialPort.text())
-            if self.ophir.isConnected():
-                self.ui.OphirStatus.setText("Connected")
-                self.ui.ledStatusOphir.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
-                self.ui.OphirName.setText(self.ophir.getName())
-                self.ui.OphirFirmware.setText(self.ophir.getFirmware())
-                self.ophir.setCoefficients(self.ui.DirectCoeff.value(), self.ui.ReturnCoeff.value())
-            else:
-                self.ui.OphirStatus.setText(MESSAGE_NOT_CONNECTED)
-                self.statusBar.showMessage("Error trying to connect with the Ophir (Laser Power meter).", 1000)
-                self.ui.ledStatusOphir.setPixmap(QtGui.QPixmap(ICON_RED_LED))
+            self.OphirConnected(self.OphirConnect(self.ui.OphirSerialPort.text(), self.ui.DirectCoeff.value(), self.ui.ReturnCoeff.value()))
         else:
             self.statusBar.showMessage("Connection with the Ophir Power Meter already stabilished.", 1000)
 
+    def OphirConnect(self, port, coef1, coef2):
+        """Connect with the Ophir Power Meter and set its coefficients.
+        Returns its name and firmware version, or None if the connection failed."""
+        self.ophir.openConnection(port)
+        if not self.ophir.isConnected():
+            return None
+        self.ophir.setCoefficients(coef1, coef2)
+        return self.ophir.getName(), self.ophir.getFirmware()
+
+    def OphirConnected(self, info=None):
+        """Update the UI after connecting with the Ophir Power Meter (info is (name, firmware))."""
+        if info is not None:
+            self.ui.OphirStatus.setText("Connected")
+            self.ui.ledStatusOphir.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
+            self.ui.OphirName.setText(info[0])
+            self.ui.OphirFirmware.setText(info[1])
+        else:
+            self.ui.OphirStatus.setText(MESSAGE_NOT_CONNECTED)
+            self.statusBar.showMessage("Error trying to connect with the Ophir (Laser Power meter).", 1000)
+            self.ui.ledStatusOphir.setPixmap(QtGui.QPixmap(ICON_RED_LED))
+
     def OphirUpdate(self):
         """Update energy measurement on the Ophir Power Meter."""
-        if self.ophir.isConnected():
-            # if self.ophir.wasTriggered():
-            head1, head2 = self.ophir.getData()
-            head1 = head1 if head1 > 0 else 0
-            head2 = head2 if head2 > 0 else 0
-            if head1 > 0:
-                self.ui.OphirEnergyDirectMeas.setText(str(head1))
-                self.ui.OphirEnergyDirect.display(float(self.ophir.coef1 * head1))
-            if head2 > 0:
-                self.ui.OphirEnergyReturnMeas.setText(str(head2))
-                self.ui.OphirEnergyReturn.display(float(self.ophir.coef2 * head2))
+        self.OphirShowStatus(monitor.readOphirStatus(self.ophir))
+
+    def OphirShowStatus(self, status):
+        """Show a monitor.OphirStatus snapshot."""
+        if status.connected:
+            if status.head1 > 0:
+                self.ui.OphirEnergyDirectMeas.setText(str(status.head1))
+                self.ui.OphirEnergyDirect.display(float(self.ophir.coef1 * status.head1))
+            if status.head2 > 0:
+                self.ui.OphirEnergyReturnMeas.setText(str(status.head2))
+                self.ui.OphirEnergyReturn.display(float(self.ophir.coef2 * status.head2))
         else:
             self.ui.OphirStatus.setText(MESSAGE_NOT_CONNECTED)
             self.ui.ledStatusOphir.setPixmap(QtGui.QPixmap(ICON_RED_LED))
@@ -583,21 +707,31 @@ class MPTS_Control(QtWidgets.QMainWindow):
         """Initialize the Tektronix Oscilloscope."""
         if not self.scope.isConnected():
             self.statusBar.showMessage("Trying to connect with the Scope Osciloscope...", 1000)
-            if self.ui.ScopeIP.text():
-                error = self.scope.openConnection(ip=self.ui.ScopeIP.text())
-            elif self.ui.ScopeSerialPort.text():
-                error = self.scope.openConnection(port=self.ui.ScopeSerialPort.text())
-            if not error:
-                self.ui.ScopeStatus.setText("Connected")
-                self.ui.ledStatusScope.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
-                self.ui.labelScopeName.setText(self.scope.getName())
-            else:
-                self.ui.ScopeStatus.setText(MESSAGE_NOT_CONNECTED)
-                self.statusBar.showMessage("Error trying to connect with Scope.", 1000)
-                self.ui.ledStatusScope.setPixmap(QtGui.QPixmap(ICON_RED_LED))
+            self.ScopeConnected(self.ScopeConnect(self.ui.ScopeIP.text(), self.ui.ScopeSerialPort.text()))
         else:
             self.statusBar.showMessage("Connection with the Scope Osciloscope already stabilished.", 1000)
 
+    def ScopeConnect(self, ip, port):
+        """Connect with the scope through the network if ip is given, or else the serial port.
+        Returns the name of the scope, or None if the connection failed."""
+        error = True
+        if ip:
+            error = self.scope.openConnection(ip=ip)
+        elif port:
+            error = self.scope.openConnection(port=port)
+        return None if error else self.scope.getName()
+
+    def ScopeConnected(self, name=None):
+        """Update the UI after connecting with the Scope."""
+        if name is not None:
+            self.ui.ScopeStatus.setText("Connected")
+            self.ui.ledStatusScope.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
+            self.ui.labelScopeName.setText(name)
+        else:
+            self.ui.ScopeStatus.setText(MESSAGE_NOT_CONNECTED)
+            self.statusBar.showMessage("Error trying to connect with Scope.", 1000)
+            self.ui.ledStatusScope.setPixmap(QtGui.QPixmap(ICON_RED_LED))
+
     def ScopeApplySettings(self):
         if self.scope.isConnected():
             pass
@@ -629,35 +763,45 @@ class MPTS_Control(QtWidgets.QMainWindow):
             self.statusBar.showMessage("Connection with the CompactRio already stabilished.", 1000)
         else:
             self.statusBar.showMessage("Trying to connect to the CompactRio...", 1000)
-            self.cRio.openConnection(ip=self.ui.TriggerIP.text(), port=int(self.ui.TriggerPort.text()))
-            if self.cRio.isConnected():
-                self.ui.TriggerStatus.setText("Connected")
-                self.ui.ledStatusTriggering.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
-                self.cRio.sendSettings("Enable_IOs", 0)  # Disable any output for safety
-                self.ui.comboBoxOperationMode.setEnabled(True)
-                if self.ui.comboBoxOperationMode.currentIndex() == 0 or self.ui.comboBoxOperationMode.currentIndex() == 2:
-                    # manual mode with laser
-                    self.ui.pushButtonTriggerSimmer.setEnabled(True)
-                    self.ui.pushButtonTriggerBurst.setEnabled(False)
-                    self.ui.pushButtonTriggerManualTrigger.setEnabled(False)
-                elif self.ui.comboBoxOperationMode.currentIndex() > 2:
-                    # tokamak mode
-                    self.ui.pushButtonTriggerSimmer.setEnabled(False)
-                    self.ui.pushButtonTriggerBurst.setEnabled(False)
-                    self.ui.pushButtonTriggerManualTrigger.setEnabled(True)
-                else:
-                    # manual mode without laser
-                    self.ui.pushButtonTriggerSimmer.setEnabled(False)
-                    self.ui.pushButtonTriggerBurst.setEnabled(True)
-                    self.ui.pushButtonTriggerManualTrigger.setEnabled(False)
-            else:
-                self.ui.TriggerStatus.setText(MESSAGE_NOT_CONNECTED)
-                self.statusBar.showMessage("Error trying to connect with the CompactRio.", 1000)
-                self.ui.ledStatusTriggering.setPixmap(QtGui.QPixmap(ICON_RED_LED))
-                self.ui.comboBoxOperationMode.setEnabled(False)
+            self.TriggerConnected(self.TriggerConnect(self.ui.TriggerIP.text(), int(self.ui.TriggerPort.text())))
+
+    def TriggerConnect(self, ip, port):
+        """Connect with the CompactRio and disable its outputs. Returns True on success."""
+        self.cRio.openConnection(ip=ip, port=port)
+        if not self.cRio.isConnected():
+            return False
+        self.cRio.sendSettings("Enable_IOs", 0)  # Disable any output for safety
+        return True
+
+    def TriggerConnected(self, connected=False):
+        """Update the UI after connecting with the CompactRio."""
+        if connected:
+            self.ui.TriggerStatus.setText("Connected")
+            self.ui.ledStatusTriggering.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
+            self.ui.comboBoxOperationMode.setEnabled(True)
+            if self.ui.comboBoxOperationMode.currentIndex() == 0 or self.ui.comboBoxOperationMode.currentIndex() == 2:
+                # manual mode with laser
+                self.ui.pushButtonTriggerSimmer.setEnabled(True)
+                self.ui.pushButtonTriggerBurst.setEnabled(False)
+                self.ui.pushButtonTriggerManualTrigger.setEnabled(False)
+            elif self.ui.comboBoxOperationMode.currentIndex() > 2:
+                # tokamak mode
                 self.ui.pushButtonTriggerSimmer.setEnabled(False)
                 self.ui.pushButtonTriggerBurst.setEnabled(False)
+                self.ui.pushButtonTriggerManualTrigger.setEnabled(True)
+            else:
+                # manual mode without laser
+                self.ui.pushButtonTriggerSimmer.setEnabled(False)
+                self.ui.pushButtonTriggerBurst.setEnabled(True)
                 self.ui.pushButtonTriggerManualTrigger.setEnabled(False)
+        else:
+            self.ui.TriggerStatus.setText(MESSAGE_NOT_CONNECTED)
+            self.statusBar.showMessage("Error trying to connect with the CompactRio.", 1000)
+            self.ui.ledStatusTriggering.setPixmap(QtGui.QPixmap(ICON_RED_LED))
+            self.ui.comboBoxOperationMode.setEnabled(False)
+            self.ui.pushButtonTriggerSimmer.setEnabled(False)
+            self.ui.pushButtonTriggerBurst.setEnabled(False)
+            self.ui.pushButtonTriggerManualTrigger.setEnabled(False)
 
     def TriggerSetOperationMode(self):
         if self.cRio.isConnected():
@@ -745,43 +889,54 @@ class MPTS_Control(QtWidgets.QMainWindow):
     def TriggerRetrieveSettings(self):
         if self.cRio.isConnected():
             self.statusBar.showMessage("Retrieving settings from the CompactRio system...", 1000)
+            values = self.cRio.readSettingsBlock(list(triggering.logical_names)) or {}
+            errors = []
             for logical_name in triggering.physical_names:
+                value = values.get(triggering.physical_names[logical_name])
+                if value is None:
+                    errors.append(triggering.physical_names[logical_name])
+                    continue
                 widget = self.ui.centralwidget.findChild(QtWidgets.QSpinBox, logical_name)
                 if widget:
-                    value = self.cRio.readSettings(triggering.physical_names[logical_name])
                     widget.setValue(value)
                 else:
                     widget = self.ui.centralwidget.findChild(QtWidgets.QCheckBox, logical_name)
-                    value = self.cRio.readSettings(triggering.physical_names[logical_name])
                     widget.setChecked(int(value))
-            self.statusBar.showMessage("Retrieving settings from the CompactRio system... Done!", 1500)
+            if errors:
+                print("Settings not read from the CompactRio: %s" % ", ".join(errors))
+                self.statusBar.showMessage("Retrieving settings from the CompactRio system... Error!", 1500)
+            else:
+                self.statusBar.showMessage("Retrieving settings from the CompactRio system... Done!", 1500)
         else:
             self.ui.TriggerStatus.setText(MESSAGE_NOT_CONNECTED)
             self.ui.ledStatusTriggering.setPixmap(QtGui.QPixmap(ICON_RED_LED))
             self.statusBar.showMessage('CompactRio NOT connected! Command ignored.', 2500)
 
-    def TriggerApplySettings(self):
+    def TriggerApplySettings(self, force=False):
+        """Send the settings that changed since they were last confirmed (all of them if force is True)."""
         if self.cRio.isConnected():
             self.statusBar.showMessage("Sending settings to the CompactRio system...", 1000)
-            for logical_name in triggering.physical_names:
-                widget = self.ui.centralwidget.findChild(QtWidgets.QSpinBox, logical_name)
-                if widget:
-                    self.cRio.sendSettings(triggering.physical_names[logical_name], widget.value())
-                else:
-                    widget = self.ui.centralwidget.findChild(QtWidgets.QCheckBox, logical_name)
-                    self.cRio.sendSettings(triggering.physical_names[logical_name], int(widget.isChecked()))
-            self.statusBar.showMessage("Sending settings to the CompactRio system... Done!", 1500)
+            values = self.GetTriggerSettings()
+            errors = self.cRio.applySettings(dict((triggering.physical_names[name], values[name]) for name in values), force)
+            if errors:
+                print("Settings not acknowledged by the CompactRio: %s" % ", ".join(errors))
+                self.statusBar.showMessage("Sending settings to the CompactRio system... Error!", 1500)
+            else:
+                self.statusBar.showMessage("Sending settings to the CompactRio system... Done!", 1500)
         else:
             self.ui.TriggerStatus.setText(MESSAGE_NOT_CONNECTED)
             self.ui.ledStatusTriggering.setPixmap(QtGui.QPixmap(ICON_RED_LED))
             self.statusBar.showMessage('CompactRio NOT connected! Command ignored.', 2500)
 
     def TriggerUpdate(self):
-        if self.cRio.isConnected():
-            io_enabled, laser_ready, interlock = self.cRio.readStatus()
-            self.ui.ledIOs_enabled.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if io_enabled else ICON_GREEN_LED_OFF))
-            self.ui.ledLaser_Ready_I.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if laser_ready else ICON_GREEN_LED_OFF))
-            self.ui.ledInterlock.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if interlock else ICON_GREEN_LED_OFF))
+        self.TriggerShowStatus(monitor.readTriggerStatus(self.cRio))
+
+    def TriggerShowStatus(self, status):
+        """Show a monitor.TriggerStatus snapshot."""
+        if status.connected:
+            self.ui.ledIOs_enabled.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if status.io_enabled else ICON_GREEN_LED_OFF))
+            self.ui.ledLaser_Ready_I.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if status.laser_ready else ICON_GREEN_LED_OFF))
+            self.ui.ledInterlock.setPixmap(QtGui.QPixmap(ICON_GREEN_LED if status.interlock else ICON_GREEN_LED_OFF))
         else:
             self.ui.TriggerStatus.setText(MESSAGE_NOT_CONNECTED)
             self.ui.ledStatusTriggering.setPixmap(QtGui.QPixmap(ICON_RED_LED))
@@ -789,183 +944,121 @@ class MPTS_Control(QtWidgets.QMainWindow):
 
     # General State-Machine functions
     def InitAllDevices(self):
-        """Configure the serial device, serial port and polling interval before starting the polling thread."""
-        progressDialog = QtWidgets.QProgressDialog(self)
-        progressDialog.setRange(0, 8)
-
-        progressDialog.setWindowTitle("Connecting")
-        progressDialog.show()
-        progressDialog.setValue(0)
-        QtWidgets.QApplication.processEvents()
-
-        progressDialog.setLabelText("Connecting to the Laser Power Supply..." + "\nPlease wait.")
-        progressDialog.setValue(1)
-        self.LaserInit()
-        QtWidgets.QApplication.processEvents()
-        if progressDialog.wasCanceled():
-            return
+        """Connect with all devices concurrently, updating the UI as each connection finishes.
 
-        progressDialog.setLabelText("Connecting to CompactRio..." + "\nPlease wait.")
-        progressDialog.setValue(2)
-        self.TriggerInit()
-        QtWidgets.QApplication.processEvents()
-        if progressDialog.wasCanceled():
-            return
+        The widgets are read here, before the connections start, and the UI of each
+        device is updated in the GUI thread when its connection is done, also if
+        it finishes after its timeout (the devices still connecting are skipped)."""
+        manager = connection.ConnectionManager(funcDeliver=self.callInGui.emit)
 
-        progressDialog.setLabelText("Connecting to the Laser Power Meter..." + "\nPlease wait.")
-        progressDialog.setValue(3)
-        self.OphirInit()
-        QtWidgets.QApplication.processEvents()
-        if progressDialog.wasCanceled():
-            return
+        def add(name, funcConnected, func, args, done, timeout):
+            # a device still connecting in the background is not used until its connection ends
+            if name in self.connecting or funcConnected():
+                return
 
-        progressDialog.setLabelText("Connecting to the Tektronix Scope..." + "\nPlease wait.")
-        progressDialog.setValue(4)
-        self.ScopeInit()
-        QtWidgets.QApplication.processEvents()
-        if progressDialog.wasCanceled():
-            return
+            def finished(result):
+                self.connecting.discard(name)
+                done(result)
+            self.connecting.add(name)
+            manager.add(name, func, *args, done=finished, timeout=timeout)
+
+        add("the Laser Power Supply", self.laserPS.isConnected, self.LaserConnect, (self.ui.LaserPSSerialPort.text(),), self.LaserConnected, 5)
+        add("CompactRio", self.cRio.isConnected, self.TriggerConnect, (self.ui.TriggerIP.text(), int(self.ui.TriggerPort.text())),
+            self.TriggerConnected, 3)
+        add("the Laser Power Meter", self.ophir.isConnected, self.OphirConnect,
+            (self.ui.OphirSerialPort.text(), self.ui.DirectCoeff.value(), self.ui.ReturnCoeff.value()), self.OphirConnected, 5)
+        add("the Tektronix Scope", self.scope.isConnected, self.ScopeConnect, (self.ui.ScopeIP.text(), self.ui.ScopeSerialPort.text()),
+            self.ScopeConnected, 3)
+        add("the ADC board", lambda: self.adc is not None, self.ADCOpen,
+            (self.config.value("ADC/Boards", 1, type=int), self.config.value("ADC/Backend", "ATSApi", type=str)), self.ADCConnected, 10)
+        add("the Phantom camera 1", self.phantom1.isConnected, self.PhantomConnect, (self.phantom1, self.ui.Phantom1IP.text()),
+            self.Phantom1Connected, 5)
+        add("the Phantom camera 2", self.phantom2.isConnected, self.PhantomConnect, (self.phantom2, self.ui.Phantom2IP.text()),
+            self.Phantom2Connected, 5)
+        if self.ui.comboBoxI2PSSelectPS.currentIndex() == 0:
+            add("the Imagem Intensifier PS", self.i2ps.isConnected, self.I2PSConnect, (self.ui.I2PSIP.text(), self.I2PSSettings()),
+                self.I2PSConnected, 3)
 
-        progressDialog.setLabelText("Connecting to the ADC board..." + "\nPlease wait.")
-        progressDialog.setValue(5)
-        self.ADCInit()
-        QtWidgets.QApplication.processEvents()
-        if progressDialog.wasCanceled():
-            return
+        progressDialog = QtWidgets.QProgressDialog(self)
+        progressDialog.setRange(0, len(manager.jobs))
+        progressDialog.setWindowTitle("Connecting")
+        progressDialog.show()
+        progressDialog.setValue(0)
 
-        progressDialog.setLabelText("Connecting to the Phantom camera 1..." + "\nPlease wait.")
-        progressDialog.setValue(6)
-        self.Phantom1Init()
-        QtWidgets.QApplication.processEvents()
-        if progressDialog.wasCanceled():
-            return
+        def showPending():
+            progressDialog.setLabelText("Connecting to %s..." % ", ".join(manager.pending()) + "\nPlease wait.")
 
-        progressDialog.setLabelText("Connecting to the Phantom camera 2..." + "\nPlease wait.")
-        progressDialog.setValue(7)
-        QtWidgets.QApplication.processEvents()
-        self.Phantom2Init()
-        if progressDialog.wasCanceled():
-            return
+        def progress(name, error):
+            progressDialog.setValue(progressDialog.value() + 1)
+            showPending()
 
-        progressDialog.setLabelText("Connecting to the Imagem Intensifier PS..." + "\nPlease wait.")
-        progressDialog.setValue(8)
-        QtWidgets.QApplication.processEvents()
-        if self.ui.comboBoxI2PSSelectPS.currentIndex() == 0:
-            self.I2PSInit()
+        def stop():
+            QtWidgets.QApplication.processEvents()
+            return progressDialog.wasCanceled()
 
+        showPending()
+        manager.start()
+        manager.wait(funcProgress=progress, funcStop=stop)
         progressDialog.close()
 
     def SaveData(self):
-        """Saves data adcquired, include the instruments settings, in the MDSplus database."""
-        timestamp = datetime.datetime.now().isoformat()
+        """Saves data adcquired, include the instruments settings, in the MDSplus database.
+
+        The data is downloaded and written to the database by a SaveWorker running in a
+        background thread, so the UI keeps running (and polling the devices) while saving.
+        """
         self.statusBar.showMessage("Saving data.")
-        self.wasTriggeredTimer.stop()
-        self.refreshTimer.stop()
+        self.StopTriggerWatcher()
+        self.waitingTriggerTimer.stop()
         self.cRio.sendSettings("Enable_IOs", 0)  # Disable any output for safety
         self.ui.ledWaitingTrigger.setPixmap(QtGui.QPixmap(ICON_GREEN_LED_OFF))
         self.ui.ledSavingData.setPixmap(QtGui.QPixmap(ICON_GREEN_LED))
         self.OphirUpdate()
         self.setting_up = False
         self.waiting_trigger = False
+        self.monitor.setArmed(False)
         self.saving_data = True
 
-        # Create database for that shot
-        db = storage.database()
-        if self.ui.comboBoxOperationMode.currentIndex() <= 2:
-            mode = "manual"
-            self.lastManualShot = storage.getLastShot("manual")
-            db.createTree(mode, self.lastManualShot + 1)
-        else:
-            mode = "tokamak"
-            self.lastTokamakShot = storage.getLastShot("tokamak")
-            db.createTree(mode, self.lastTokamakShot + 1)
-
-        # Update shot number display
-        if mode == "tokamak":
-            self.lastTokamakShot += 1
-            storage.setLastShot(mode, self.lastTokamakShot)
-            self.ui.textLabelLastShot.setText("#" + str(self.lastTokamakShot))
-            self.ui.textLabelNextShot.setText("#" + str(self.lastTokamakShot + 1))
-        else:
-            self.lastManualShot += 1
-            storage.setLastShot(mode, self.lastManualShot)
-            self.ui.textLabelLastShot.setText("#" + str(self.lastManualShot))
-            self.ui.textLabelNextShot.setText("#" + str(self.lastManualShot + 1))
-
-        # Save settings and data on database
-        print("Saving settings...")
-        self.SaveTriggerSettings(db)
-        db.populateLaser()
-
-        # Cameras
-        self.statusBar.showMessage("Saving camera data")
-        if self.phantom1.isConnected() and self.phantom1.wasTriggered():
-            print("Saving camera 1 data...")
-            db.populateCamera(camera=1,
-                              enabled=1,
-                              name=self.phantom1.getName(),
-                              serialNumber=self.phantom1.getSerialNumber(),
-                              ip=self.ui.Phantom1IP.text(),
-                              FrameSync=self.ui.Phantom1FrameSync.currentText(),
-                              ImageFormat=self.ui.Phantom1ImageFormat.currentText())
-            print("Frames available: %d" % self.phantom1.getNFramesAvailable())
-            image_request = self.phantom1.requestImages(start_frame=0, num_frames=self.phantom1.getNFramesAvailable() - 1)
-            db.populateCameraData(image_request.Receive(), camera=1)
-        else:
-            db.populateCamera(camera=1, enabled=0, FrameSync=self.ui.Phantom1FrameSync.currentText(), ImageFormat=self.ui.Phantom1ImageFormat.currentText())
-
-        if self.phantom2.isConnected() and self.phantom2.wasTriggered():
-            print("Saving camera 2 data...")
-            db.populateCamera(camera=2,
-                              enabled=1,
-                              name=self.phantom2.getName(),
-                              serialNumber=self.phantom2.getSerialNumber(),
-                              ip=self.ui.Phantom2IP.text(),
-                              FrameSync=self.ui.Phantom2FrameSync.currentText(),
-                              ImageFormat=self.ui.Phantom2ImageFormat.currentText())
-            print("Frames available: %d" % self.phantom2.getNFramesAvailable())
-            image_request = self.phantom2.requestImages(start_frame=0, num_frames=self.phantom2.getNFramesAvailable() - 1)
-            db.populateCameraData(image_request.Receive(), camera=2)
-        else:
-            db.populateCamera(camera=2, enabled=0, FrameSync=self.ui.Phantom2FrameSync.currentText(), ImageFormat=self.ui.Phantom2ImageFormat.currentText())
-
-        # Scope and ADC
-        self.statusBar.showMessage("Saving waveform from osciloscope/ADC")
-        if self.adc is not None and self.adc.wasTriggered():
-            print("Saving ADC data...")
-            db.populateADC(description="%s, S/N: %s, Memory: %s Samples/Channel" % (self.ui.ADCName.text(), self.ui.ADCSerialNumber.text(), self.ui.ADCMemory.text()),
-                           enabled=int(self.adc is not None),
-                           RecordLength=self.ui.ADCRecordLength.value(),
-                           SampleRate=int(float(self.ui.ADCSampleRate.currentText().replace(" kS/s", "e3").replace(" MS/s", "e6"))))
-            enabled_channels = [self.ui.ADCCH1Enable.isChecked(), self.ui.ADCCH2Enable.isChecked()]
-            for i in range(len(enabled_channels)):
-                if enabled_channels[i]:
-                    db.populateADCChannel(self.adc.getChannelWaveform(i + 1), i + 1)
-                else:
-                    db.populateADCChannel(None, i + 1)
-        else:
-            db.populateADC(description="", enabled=0)
-
-        if self.scope.isConnected() and self.scope.wasTriggered():
-            print("Saving Scope data...")
-            db.populateScope(description=self.ui.labelScopeName.text(),
-                             enabled=1,
-                             RecordLength=self.scope.get_record_length(),
-                             SampleRate=self.scope.get_record_sample_rate())
-            enabled_channels = [self.ui.ScopeCH1Enable.isChecked(), self.ui.ScopeCH2Enable.isChecked(), self.ui.ScopeCH3Enable.isChecked(), self.ui.ScopeCH4Enable.isChecked()]
-            for i in range(len(enabled_channels)):
-                print("Saving data for CH%d" % (i + 1))
-                if enabled_channels[i]:
-                    db.populateScopeChannel(self.scope.get_channel_waveform(i + 1), i + 1)
-                else:
-                    db.populateScopeChannel(None, i + 1)
-        else:
-            db.populateADC(description="", enabled=0)
-
-        db.populateIntensifier(PPVoltage=self.ui.I2PSVoltagePPMCP.value(), MCPVoltage=self.ui.I2PSVoltageMCP.value(), PCHigh=self.ui.I2PSVoltagePCHighSide.value(),
-                               PCLow=self.ui.I2PSVoltagePCLowSide.value(), PulseDur=self.ui.I2PSPulseDuration.value(), TriggerDelay=self.ui.I2PSTriggerDelay.value(), IP=self.ui.I2PSIP.text(),
-                               Coarse=self.ui.II_Coarse.currentText(), Fine=self.ui.II_Fine.value(), Gain=self.ui.II_Gain.value(), PS=self.ui.comboBoxI2PSSelectPS.currentText())
-
+        self.save_thread = QtCore.QThread(self)
+        self.save_worker = acquisition.SaveWorker(self.GetShotSettings(), [self.phantom1, self.phantom2], self.adc, self.scope)
+        self.save_worker.moveToThread(self.save_thread)
+        self.save_thread.started.connect(self.save_worker.run)
+        self.save_worker.progress.connect(self.SaveProgress)
+        self.save_worker.finished.connect(self.SaveFinished)
+        self.save_worker.failed.connect(self.SaveFailed)
+        self.save_worker.aborted.connect(self.SaveAborted)
+        for signal in (self.save_worker.finished, self.save_worker.failed, self.save_worker.aborted):
+            signal.connect(self.save_thread.quit)
+        # the thread and the worker are deleted when the save ends, one of each per shot
+        self.save_thread.finished.connect(self.SaveThreadFinished)
+        self.save_thread.finished.connect(self.save_worker.deleteLater)
+        self.save_thread.finished.connect(self.save_thread.deleteLater)
+        self.save_thread.start()
+
+    def GetShotSettings(self):
+        """Collect from the UI and the power meter everything stored with the shot."""
+        shot = {}
+        shot["mode"] = "manual" if self.ui.comboBoxOperationMode.currentIndex() <= 2 else "tokamak"
+        shot["trigger"] = self.GetTriggerSettings()
+        shot["trigger"]["OPMODE"] = self.ui.comboBoxOperationMode.currentIndex()
+        shot["cameras"] = [{"ip": self.ui.Phantom1IP.text(),
+                            "FrameSync": self.ui.Phantom1FrameSync.currentText(),
+                            "ImageFormat": self.ui.Phantom1ImageFormat.currentText()},
+                           {"ip": self.ui.Phantom2IP.text(),
+                            "FrameSync": self.ui.Phantom2FrameSync.currentText(),
+                            "ImageFormat": self.ui.Phantom2ImageFormat.currentText()}]
+        shot["adc"] = {"channels": self.ADCEnabledChannels(),
+                       "settings": {"description": "%s, S/N: %s, Memory: %s Samples/Channel" % (self.ui.ADCName.text(), self.ui.ADCSerialNumber.text(), self.ui.ADCMemory.text()),
+                                    "RecordLength": self.ui.ADCRecordLength.value(),
+                                    "SampleRate": int(float(self.ui.ADCSampleRate.currentText().replace(" kS/s", "e3").replace(" MS/s", "e6")))},
+                       "edges": self.ADCEdgeThresholds()}
+        shot["scope"] = {"channels": [self.ui.ScopeCH1Enable.isChecked(), self.ui.ScopeCH2Enable.isChecked(), self.ui.ScopeCH3Enable.isChecked(), self.ui.ScopeCH4Enable.isChecked()],
+                         "description": self.ui.labelScopeName.text()}
+        shot["intensifier"] = dict(PPVoltage=self.ui.I2PSVoltagePPMCP.value(), MCPVoltage=self.ui.I2PSVoltageMCP.value(), PCHigh=self.ui.I2PSVoltagePCHighSide.value(),
+                                   PCLow=self.ui.I2PSVoltagePCLowSide.value(), PulseDur=self.ui.I2PSPulseDuration.value(), TriggerDelay=self.ui.I2PSTriggerDelay.value(), IP=self.ui.I2PSIP.text(),
+                                   Coarse=self.ui.II_Coarse.currentText(), Fine=self.ui.II_Fine.value(), Gain=self.ui.II_Gain.value(), PS=self.ui.comboBoxI2PSSelectPS.currentText())
+
+        shot["ophir"] = None
         if self.ophir.isConnected():
             head1, head2 = self.ophir.getData()
             head1 = head1 if head1 > 0 else 0
@@ -974,18 +1067,51 @@ class MPTS_Control(QtWidgets.QMainWindow):
             self.ui.OphirEnergyReturnMeas.setText(str(head2))
             self.ui.OphirEnergyDirect.display(float(self.ophir.coef1 * head1))
             self.ui.OphirEnergyReturn.display(float(self.ophir.coef2 * head2))
+            # Values of the measurement, as the power meter keeps being polled while saving
+            shot["ophir"] = storage.OphirData(self.ophir.name, self.ophir.firmware, head1, head2, self.ophir.coef1, self.ophir.coef2)
 
-        print("Saving data from power meter")
-        db.populateOphir(self.ophir, self.ophir.isConnected())
-
-        db.populateComments(timestamp=timestamp, operator=self.ui.Operator.text(), email=self.ui.Email.text(), aim=self.ui.Aim.text(), comments=self.ui.Comments.toPlainText())
+        shot["comments"] = dict(timestamp=datetime.datetime.now().isoformat(), operator=self.ui.Operator.text(), email=self.ui.Email.text(),
+                                aim=self.ui.Aim.text(), comments=self.ui.Comments.toPlainText())
+        return shot
 
-        self.ui.ledSavingData.setPixmap(QtGui.QPixmap(ICON_GREEN_LED_OFF))
+    @QtCore.pyqtSlot(str, int)
+    def SaveProgress(self, stage, percent):
+        if stage == "download" and percent:
+            self.statusBar.showMessage("Saving data: %s (%d%%)" % (stage, percent))
+        else:
+            self.statusBar.showMessage("Saving data: %s" % stage)
 
+    @QtCore.pyqtSlot(str, int)
+    def SaveFinished(self, mode, number):
+        # Update shot number display
+        if mode == "tokamak":
+            self.lastTokamakShot = number
+        else:
+            self.lastManualShot = number
+        self.ui.textLabelLastShot.setText("#" + str(number))
+        self.ui.textLabelNextShot.setText("#" + str(number + 1))
         self.statusBar.showMessage("")
-        print("All data was saved.")
+        self.SaveDone()
+
+    @QtCore.pyqtSlot(str)
+    def SaveFailed(self, error):
+        print("Error while saving. Aborting saving.")
+        print(error)
+        self.statusBar.showMessage("Error while saving data!", 5000)
+        self.SaveDone()
+
+    @QtCore.pyqtSlot()
+    def SaveAborted(self):
+        self.statusBar.showMessage("Saving aborted.", 2500)
+        self.SaveDone()
 
-        self.refreshTimer.start()
+    @QtCore.pyqtSlot()
+    def SaveThreadFinished(self):
+        self.save_thread = None
+        self.save_worker = None
+
+    def SaveDone(self):
+        self.ui.ledSavingData.setPixmap(QtGui.QPixmap(ICON_GREEN_LED_OFF))
         self.ui.pushButtonStartAbortAcquisition.setText("Start acquisition")
         self.setting_up = True
         self.saving_data = False
@@ -994,18 +1120,18 @@ class MPTS_Control(QtWidgets.QMainWindow):
         if self.ui.comboBoxOperationMode.currentIndex() == 4:
             self.reloadAutomaticTimer.start()
 
-    def SaveTriggerSettings(self, db):
-        """Saves triggering settings MDSplus"""
+    def GetTriggerSettings(self):
+        """Return the triggering settings in the UI, as a dictionary {logical_name: value}"""
         # for name, obj in inspect.getmembers(self.ui):
+        values = {}
         for logical_name in triggering.physical_names:
             widget = self.ui.centralwidget.findChild(QtWidgets.QSpinBox, logical_name)
             if widget:
-                db.populateSettings(logical_name, widget.value())
+                values[logical_name] = widget.value()
             else:
                 widget = self.ui.centralwidget.findChild(QtWidgets.QCheckBox, logical_name)
-                db.populateSettings(logical_name, int(widget.isChecked()))
-        db.populateSettings("OPMODE", self.ui.comboBoxOperationMode.currentIndex())
-
+                values[logical_name] = int(widget.isChecked())
+        return values
 
     def SetupInstruments(self):
         if self.ui.comboBoxOperationMode.currentIndex() != 1:
@@ -1019,7 +1145,9 @@ class MPTS_Control(QtWidgets.QMainWindow):
 
     def StartAcquisition(self):
         if self.saving_data:
-            self.statusBar.showMessage("Saving data, please wait...")
+            if not self.save_worker.isAborting():
+                self.save_worker.abort()
+            self.statusBar.showMessage("Aborting saving, please wait...")
             return
         if not self.waiting_trigger:
             self.cRio.sendSettings("Enable_IOs", 1)
@@ -1032,14 +1160,16 @@ class MPTS_Control(QtWidgets.QMainWindow):
                 self.ui.textLabelLastShot.setText("#" + str(self.lastManualShot))
                 self.ui.textLabelNextShot.setText("#" + str(self.lastManualShot + 1))
             self.SetupInstruments()
-            self.wasTriggeredTimer.start()
+            self.waitingTriggerTimer.start()
             self.setting_up = False
             self.waiting_trigger = True
+            self.monitor.setArmed(True)
             self.saving_data = False
             self.CamerasStartAcquisition()
             self.ScopeStartAcquisition()
             self.ADCStartAcquisition()
             self.I2PSStartAcquisition()
+            self.StartTriggerWatcher()
             self.statusBar.showMessage("Waiting trigger.")
             self.ui.pushButtonStartAbortAcquisition.setText("Abort acquisition")
         else:
@@ -1050,9 +1180,11 @@ class MPTS_Control(QtWidgets.QMainWindow):
         if self.waiting_trigger:
             self.cRio.sendSettings("Enable_IOs", 0)
             self.statusBar.showMessage("Aborting acquisition...", 1000)
-            self.wasTriggeredTimer.stop()
+            self.StopTriggerWatcher()
+            self.waitingTriggerTimer.stop()
             self.setting_up = True
             self.waiting_trigger = False
+            self.monitor.setArmed(False)
             self.CamerasAbortAcquisition()
             self.ScopeAbortAcquisition()
             self.ui.pushButtonStartAbortAcquisition.setText("Start acquisition")
@@ -1086,19 +1218,10 @@ class MPTS_Control(QtWidgets.QMainWindow):
 
         # Show the window
         error_box.exec_()
-        if self.saving_data:
+        if self.saving_data and (self.save_thread is None or not self.save_thread.isRunning()):
             print("Error while saving. Aborting saving.")
-            self.ui.ledSavingData.setPixmap(QtGui.QPixmap(ICON_GREEN_LED_OFF))
             self.statusBar.showMessage("")
-
-            self.refreshTimer.start()
-            self.ui.pushButtonStartAbortAcquisition.setText("Start acquisition")
-            self.setting_up = True
-            self.saving_data = False
-
-            # Automatic setup in tokamak automatic mode: recharge and reaload after 5 minutes
-            if self.ui.comboBoxOperationMode.currentIndex() == 4:
-                self.reloadAutomaticTimer.start()
+            self.SaveDone()
 
 
 
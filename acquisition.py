@@ -0,0 +1,311 @@
+"""
+    acquisition.py
+    --------------
+    Download of the data acquired by the instruments after a shot and
+    background saving of the shot in the MDSplus database.
+"""
+
+import logging
+import queue
+import threading
+import time
+import traceback
+from concurrent import futures
+from PyQt5 import QtCore
+
+import storage
+from instruments import triggering, AlazarTech
+
+_log = logging.getLogger(__name__)
+
+
+class DataDownloader():
+    """Download the data of several instruments concurrently.
+
+    Each download is a callable registered with a name. All of them run in
+    parallel, one thread per instrument, as every device has its own
+    connection (Phantom command/data sockets, ADC board, scope). The results
+    are collected with wait() and handed over to the storage.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.futures = {}
+        self._executor = None
+
+    def add(self, name, func, *args, **kwargs):
+        """Register a download. func(*args, **kwargs) is run in its own thread."""
+        self.jobs[name] = (func, args, kwargs)
+
+    def start(self):
+        """Start all registered downloads."""
+        if not self.jobs:
+            return
+        self._executor = futures.ThreadPoolExecutor(max_workers=len(self.jobs))
+        for name, (func, args, kwargs) in self.jobs.items():
+            self.futures[name] = self._executor.submit(self._run, name, func, args, kwargs)
+        self._executor.shutdown(wait=False)
+
+    def _run(self, name, func, args, kwargs):
+        t0 = time.time()
+        result = func(*args, **kwargs)
+        _log.info("Download of %s finished in %.2f s", name, time.time() - t0)
+        return result
+
+    def done(self):
+        """Return True when all downloads have finished."""
+        return all(future.done() for future in self.futures.values())
+
+    def wait(self, funcIdle=None, interval=0.05):
+        """Wait for all downloads and return a dictionary with the results.
+
+        funcIdle() is called periodically while waiting (e.g. to process GUI
+        events). A download that raised an exception is reported with None as
+        result and the exception is logged.
+        """
+        while not self.done():
+            if funcIdle is not None:
+                funcIdle()
+            futures.wait(list(self.futures.values()), timeout=interval)
+        results = {}
+        for name, future in self.futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as error:
+                _log.error("Download of %s failed: %s", name, error)
+                print("Error while downloading %s data: %s" % (name, error))
+                results[name] = None
+        return results
+
+
+class SaveAborted(Exception):
+    pass
+
+
+class SaveWorker(QtCore.QObject):
+    """Save a shot in the MDSplus database, off the GUI thread.
+
+    The shot is saved in stages: download -> convert -> write tree -> update
+    last shot. The camera images are streamed: the tree is created as soon as
+    the downloads start and every chunk of frames is written as a segment when
+    it arrives, through a bounded queue, so only a few chunks are kept in
+    memory. Progress is reported through Qt signals. An abort can be queued at
+    any time with abort(); the last shot is then not updated, so the partially
+    written tree is overwritten by the next save.
+
+    shot is a dictionary with the settings of the shot, collected from the UI
+    by the GUI thread before the worker is started (Qt widgets must not be
+    accessed from here).
+    """
+
+    STAGES = ("download", "convert", "write tree", "update last shot")
+    QUEUED_CHUNKS = 4
+
+    progress = QtCore.pyqtSignal(str, int)
+    finished = QtCore.pyqtSignal(str, int)
+    failed = QtCore.pyqtSignal(str)
+    aborted = QtCore.pyqtSignal()
+
+    def __init__(self, shot, phantoms, adc, scope):
+        super().__init__()
+        self.shot = shot
+        self.phantoms = phantoms
+        self.adc = adc
+        self.scope = scope
+        self._abort = threading.Event()
+        self.frames = queue.Queue(maxsize=self.QUEUED_CHUNKS)
+        self.download_progress = {}
+
+    def abort(self):
+        """Queue an abort of the save."""
+        self._abort.set()
+
+    def isAborting(self):
+        return self._abort.is_set()
+
+    def _checkAbort(self):
+        if self._abort.is_set():
+            raise SaveAborted()
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        try:
+            self.progress.emit("download", 0)
+            db, number = self.createTree()
+            downloader = self.download()
+            self.writeCameras(db)
+            data = downloader.wait(funcIdle=self._reportDownload)
+            self._checkAbort()
+            self.progress.emit("convert", 0)
+            records = self.convert(data)
+            self._checkAbort()
+            self.progress.emit("write tree", 0)
+            self.writeTree(db, records)
+            self.progress.emit("update last shot", 0)
+            storage.setLastShot(self.shot["mode"], number)
+        except SaveAborted:
+            print("Saving aborted.")
+            self.aborted.emit()
+            return
+        except Exception:
+            self.failed.emit(traceback.format_exc())
+            return
+        self.finished.emit(self.shot["mode"], number)
+
+    def download(self):
+        """Start the download of the data of all triggered instruments in parallel.
+
+        The camera images are put in the frames queue chunk by chunk; the
+        other results are collected with wait() on the returned downloader."""
+        downloader = DataDownloader()
+        self.cameras_triggered = []
+        for i, phantom in enumerate(self.phantoms):
+            triggered = phantom.isConnected() and phantom.wasTriggered()
+            self.cameras_triggered.append(triggered)
+            if triggered:
+                num_frames = phantom.getNFramesAvailable()
+                print("Camera %d, frames available: %d" % (i + 1, num_frames))
+                self.download_progress[i + 1] = 0
+                downloader.add("camera %d" % (i + 1), self.streamImages, i + 1, phantom, num_frames - 1)
+
+        self.adc_triggered = self.adc is not None and self.adc.wasTriggered()
+        if self.adc_triggered:
+            downloader.add("ADC", self.downloadADC, self.shot["adc"]["channels"], self.shot["adc"]["edges"])
+
+        self.scope_triggered = self.scope.isConnected() and self.scope.wasTriggered()
+        if self.scope_triggered:
+            downloader.add("scope", self.downloadScope, self.shot["scope"]["channels"])
+
+        downloader.start()
+        return downloader
+
+    def _reportDownload(self):
+        if self.download_progress:
+            self.progress.emit("download", int(100 * min(self.download_progress.values())))
+
+    def streamImages(self, camera, phantom, num_frames):
+        """Download the images of a camera into the frames queue, with the time of each frame.
+
+        (camera, None, None) is put in the queue at the end, also on errors."""
+        try:
+            times = triggering.cameraFrameTimes(self.shot["trigger"], num_frames)
+            for first, images in phantom.iterImages(start_frame=0, num_frames=num_frames,
+                                                    funcProgress=lambda fraction: self.download_progress.__setitem__(camera, fraction),
+                                                    funcStop=self.isAborting):
+                self.frames.put((camera, images, times[first:first + len(images)]))
+        finally:
+            self.frames.put((camera, None, None))
+        return not self.isAborting()
+
+    def writeCameras(self, db):
+        """Write the camera images from the frames queue as they are downloaded."""
+        streaming = set(camera for camera in self.download_progress)
+        writers = {}
+        while streaming:
+            try:
+                camera, images, times = self.frames.get(timeout=0.05)
+            except queue.Empty:
+                self._reportDownload()
+                continue
+            if images is None:
+                streaming.discard(camera)
+            elif not self.isAborting():
+                # Keep emptying the queue on abort, so the downloads can finish
+                try:
+                    if camera not in writers:
+                        print("Saving camera %d data..." % camera)
+                        writers[camera] = db.cameraWriter(camera, images.shape[1], images.shape[2])
+                    writers[camera].putFrames(images, times)
+                except Exception:
+                    self.abort()
+                    self._drainFrames(streaming)
+                    raise
+                self._reportDownload()
+        self._checkAbort()
+
+    def _drainFrames(self, streaming):
+        while streaming:
+            camera, images, times = self.frames.get()
+            if images is None:
+                streaming.discard(camera)
+
+    def downloadADC(self, enabled_channels, thresholds):
+        """Download the waveforms of the enabled ADC channels (None for disabled channels)
+        and find the edges of their pulses, with the (low, high) thresholds of each channel."""
+        traces = self.adc.readChannels([i + 1 for i, enabled in enumerate(enabled_channels) if enabled])
+        traces = dict((trace.channel, trace) for trace in traces)
+        waveforms = [traces.get(i + 1) for i in range(len(enabled_channels))]
+        edges = [AlazarTech.traceEdges(waveform, *thresholds[waveform.channel]) if waveform is not None and waveform.channel in thresholds else None
+                 for waveform in waveforms]
+        return waveforms, edges
+
+    def downloadScope(self, enabled_channels):
+        """Download the record length, sample rate and waveforms of the enabled scope channels.
+
+        The waveforms are downloaded first, so the record length and the sample
+        rate are taken from their preambles."""
+        channels = self.scope.get_channels_waveforms([i + 1 for i, enabled in enumerate(enabled_channels) if enabled])
+        channels = dict((Channel.channel, Channel) for Channel in channels)
+        waveforms = [channels.get(i + 1) for i in range(len(enabled_channels))]
+        record_length = self.scope.get_record_length()
+        sample_rate = self.scope.get_record_sample_rate()
+        return record_length, sample_rate, waveforms
+
+    def convert(self, data):
+        """Arrange the downloaded data in the records written to the tree."""
+        records = {"cameras": [], "adc": None, "scope": None}
+        for i, triggered in enumerate(self.cameras_triggered):
+            records["cameras"].append(triggered and bool(data.get("camera %d" % (i + 1))))
+        if self.adc_triggered and data["ADC"] is not None:
+            records["adc"] = data["ADC"]
+        if self.scope_triggered and data["scope"] is not None:
+            records["scope"] = data["scope"]
+        return records
+
+    def createTree(self):
+        """Create the tree of the next shot and write the settings. Returns the database and the shot number."""
+        shot = self.shot
+        mode = shot["mode"]
+        number = storage.getLastShot(mode) + 1
+        db = storage.database()
+        db.createTree(mode, number)
+
+        print("Saving settings...")
+        db.populate(shot["trigger"])
+        db.populateLaser()
+        return db, number
+
+    def writeTree(self, db, records):
+        """Write the records of all instruments in the tree (camera images are already written)."""
+        shot = self.shot
+        for i, camera in enumerate(shot["cameras"]):
+            if records["cameras"][i]:
+                db.populateCamera(camera=i + 1, enabled=1, ip=camera["ip"], FrameSync=camera["FrameSync"], ImageFormat=camera["ImageFormat"])
+            else:
+                db.populateCamera(camera=i + 1, enabled=0, FrameSync=camera["FrameSync"], ImageFormat=camera["ImageFormat"])
+        self.progress.emit("write tree", 50)
+
+        if records["adc"] is not None:
+            print("Saving ADC data...")
+            db.populateADC(enabled=1, **shot["adc"]["settings"])
+            waveforms, edges = records["adc"]
+            for i, waveform in enumerate(waveforms):
+                db.populateADCChannel(waveform, i + 1)
+                db.populateADCEdges(edges[i], i + 1)
+        else:
+            db.populateADC(description="", enabled=0)
+
+        if records["scope"] is not None:
+            print("Saving Scope data...")
+            record_length, sample_rate, waveforms = records["scope"]
+            db.populateScope(description=shot["scope"]["description"], enabled=1, RecordLength=record_length, SampleRate=sample_rate)
+            for i, waveform in enumerate(waveforms):
+                db.populateScopeChannel(waveform, i + 1)
+        else:
+            db.populateScope(description="", enabled=0)
+
+        db.populateIntensifier(**shot["intensifier"])
+        print("Saving data from power meter")
+        db.populateOphir(shot["ophir"], shot["ophir"] is not None)
+        db.populateComments(**shot["comments"])
+        print("All data was saved.")
@@ -0,0 +1,127 @@
+"""
+    connection.py
+    -------------
+    Concurrent connection to the instruments.
+"""
+
+import logging
+import threading
+import time
+
+_log = logging.getLogger(__name__)
+
+
+class ConnectionTimeout(Exception):
+    pass
+
+
+class ConnectionManager():
+    """Open the connections with several instruments concurrently.
+
+    Each connection is a callable registered with a name and a timeout. All of
+    them run in parallel, one thread per instrument, so the time to connect is
+    that of the slowest instrument and not the sum of all of them. Blocking
+    connections (serial ports, sockets) cannot be interrupted: wait() stops
+    waiting for a connection that exceeds its timeout and its thread is left
+    to finish in the background.
+
+    The done callbacks are called by wait(), in the calling thread, as soon as
+    each connection finishes, so they can safely update the UI. The done
+    callback of a connection is only called once its thread has finished, so
+    it never uses the instrument at the same time. For connections finishing
+    after their timeout, funcDeliver(func) is called from their thread, and
+    must call func() in the thread of wait() (e.g. through a queued signal);
+    without funcDeliver, late connections are only logged.
+    """
+
+    def __init__(self, timeout=5.0, funcDeliver=None):
+        self.timeout = timeout
+        self.funcDeliver = funcDeliver
+        self.jobs = []
+        self.lock = threading.Lock()
+
+    def add(self, name, func, *args, **kwargs):
+        """Register a connection. func(*args) is run in its own thread.
+
+        The keyword arguments done and timeout are optional: done(result) is
+        called with the value returned by func, or with None if it raised an
+        exception or timed out."""
+        done = kwargs.pop("done", None)
+        timeout = kwargs.pop("timeout", self.timeout)
+        self.jobs.append({"name": name, "func": func, "args": args, "done": done, "timeout": timeout,
+                          "finished": threading.Event(), "result": None, "error": None, "reported": False,
+                          "timed_out": False})
+
+    def start(self):
+        """Start all registered connections."""
+        self.t0 = time.time()
+        for job in self.jobs:
+            thread = threading.Thread(target=self._run, args=(job,), name="connect %s" % job["name"])
+            thread.daemon = True
+            thread.start()
+
+    def _run(self, job):
+        try:
+            job["result"] = job["func"](*job["args"])
+        except Exception as error:
+            job["error"] = error
+        _log.info("Connection with %s finished in %.2f s", job["name"], time.time() - self.t0)
+        with self.lock:
+            job["finished"].set()
+            late = job["timed_out"]
+        if late and self.funcDeliver is not None:
+            self.funcDeliver(lambda: self._done(job))
+
+    def pending(self):
+        """Return the names of the connections not reported yet."""
+        return [job["name"] for job in self.jobs if not job["reported"]]
+
+    def wait(self, funcProgress=None, funcStop=None, interval=0.05):
+        """Wait for all connections, calling the done callbacks as they finish.
+
+        funcProgress(name, error) is called after each connection, with None as
+        error on success, or a ConnectionTimeout if the connection is still
+        running after its timeout (its done callback is then delivered later,
+        see funcDeliver). The wait is cancelled when funcStop() returns True:
+        the connections still pending are then not reported to funcProgress,
+        and their done callbacks are delivered as for a time out."""
+        while self.pending():
+            cancel = funcStop is not None and funcStop()
+            for job in self.jobs:
+                if job["reported"]:
+                    continue
+                with self.lock:
+                    finished = job["finished"].is_set()
+                    if not finished and (cancel or time.time() - self.t0 > job["timeout"]):
+                        job["timed_out"] = True
+                if cancel:
+                    job["reported"] = True
+                    if finished:
+                        self._done(job)
+                    continue
+                if finished:
+                    job["reported"] = True
+                    self._done(job)
+                    if funcProgress is not None:
+                        funcProgress(job["name"], job["error"])
+                elif job["timed_out"]:
+                    job["reported"] = True
+                    error = ConnectionTimeout("no answer in %g s" % job["timeout"])
+                    _log.error("Connection with %s: %s, still connecting in the background", job["name"], error)
+                    print("Connection with %s: %s, still connecting in the background" % (job["name"], error))
+                    if funcProgress is not None:
+                        funcProgress(job["name"], error)
+            time.sleep(interval)
+
+    def _done(self, job):
+        """Call the done callback of a finished connection."""
+        error = job["error"]
+        if error is not None:
+            _log.error("Connection with %s failed: %s", job["name"], error)
+            print("Error while connecting with %s: %s" % (job["name"], error))
+        if job["done"] is not None:
+            try:
+                job["done"](job["result"] if error is None else None)
+            except Exception as setup_error:
+                _log.error("Setup of %s failed: %s", job["name"], setup_error)
+                print("Error while setting up %s: %s" % (job["name"], setup_error))
@@ -1,9 +1,21 @@
 import ctypes
-from ctypes import c_int, c_uint8, c_uint16, c_uint32, c_int32, c_float, c_char_p, c_void_p, c_long, windll, CDLL, POINTER
+from ctypes import c_int, c_uint8, c_uint16, c_uint32, c_int32, c_float, c_char_p, c_void_p, c_long, CDLL, POINTER
+try:
+    from ctypes import windll
+except ImportError:
+    # not on Windows
+    windll = None
 import os
 import numpy as np
+import queue
+import threading
 import time
 import logging
+import mmap
+from concurrent import futures
+from instruments import adcfile, alazarsim
+import weakref
+from collections import deque
 
 # add logger, to allow logging to Labber's instrument log
 log = logging.getLogger('AlazarTech')
@@ -57,11 +69,32 @@ input_range = {
 }
 
 
+def _freeMemory(addr):
+    """Release memory allocated by DMABuffer with VirtualAlloc/valloc"""
+    if os.name == 'nt':
+        MEM_RELEASE = 0x8000
+        windll.kernel32.VirtualFree.argtypes = [c_void_p, c_long, c_long]
+        windll.kernel32.VirtualFree.restype = c_int
+        windll.kernel32.VirtualFree(c_void_p(addr), 0, MEM_RELEASE)
+    elif os.name == 'posix':
+        libc = CDLL("libc.so.6")
+        libc.free.argtypes = [c_void_p]
+        libc.free(c_void_p(addr))
+    else:
+        raise Exception("Unsupported OS")
+
+
 class DMABuffer:
-    """"Buffer for DMA"""
+    """"Buffer for DMA
 
-    def __init__(self, c_sample_type, size_bytes):
+    The memory is page aligned: VirtualAlloc on Windows, valloc on Linux or,
+    with use_mmap, an anonymous mmap (backed by transparent huge pages when
+    hugepages is set). The memory is released by release(), at the end of a
+    with block or, at the latest, when the buffer is garbage collected."""
+
+    def __init__(self, c_sample_type, size_bytes, use_mmap=False, hugepages=False):
         self.size_bytes = size_bytes
+        self.c_sample_type = c_sample_type
 
         npSampleType = {
             c_uint8: np.uint8,
@@ -80,37 +113,133 @@ class DMABuffer:
         }.get(c_sample_type, 0)
 
         self.addr = None
-        if os.name == 'nt':
-            MEM_COMMIT = 0x1000
-            PAGE_READWRITE = 0x4
-            windll.kernel32.VirtualAlloc.argtypes = [c_void_p, c_long, c_long, c_long]
-            windll.kernel32.VirtualAlloc.restype = c_void_p
-            self.addr = windll.kernel32.VirtualAlloc(
-                0, c_long(size_bytes), MEM_COMMIT, PAGE_READWRITE)
-        elif os.name == 'posix':
-            libc = CDLL("libc.so.6")
-            libc.valloc.argtypes = [c_long]
-            libc.valloc.restype = c_void_p
-            self.addr = libc.valloc(size_bytes)
+        self._mmap = None
+        self._finalizer = None
+        if use_mmap and os.name == 'posix':
+            self._mmap = mmap.mmap(-1, size_bytes, flags=mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS)
+            if hugepages and hasattr(mmap, 'MADV_HUGEPAGE'):
+                self._mmap.madvise(mmap.MADV_HUGEPAGE)
+            ctypes_array = (c_sample_type * (size_bytes // bytes_per_sample)).from_buffer(self._mmap)
+            self.addr = ctypes.addressof(ctypes_array)
         else:
-            raise Exception("Unsupported OS")
+            if os.name == 'nt':
+                MEM_COMMIT = 0x1000
+                PAGE_READWRITE = 0x4
+                windll.kernel32.VirtualAlloc.argtypes = [c_void_p, c_long, c_long, c_long]
+                windll.kernel32.VirtualAlloc.restype = c_void_p
+                self.addr = windll.kernel32.VirtualAlloc(
+                    0, c_long(size_bytes), MEM_COMMIT, PAGE_READWRITE)
+            elif os.name == 'posix':
+                libc = CDLL("libc.so.6")
+                libc.valloc.argtypes = [c_long]
+                libc.valloc.restype = c_void_p
+                self.addr = libc.valloc(size_bytes)
+            else:
+                raise Exception("Unsupported OS")
+            if not self.addr:
+                raise MemoryError("Could not allocate a DMA buffer of %d bytes" % size_bytes)
+            # the finalizer must not hold a reference to the buffer itself
+            self._finalizer = weakref.finalize(self, _freeMemory, self.addr)
+            ctypes_array = (c_sample_type * (size_bytes // bytes_per_sample)).from_address(self.addr)
 
-        ctypes_array = (c_sample_type * (size_bytes // bytes_per_sample)).from_address(self.addr)
         self.buffer = np.frombuffer(ctypes_array, dtype=npSampleType)
         self.ctypes_buffer = ctypes_array
-        pointer, read_only_flag = self.buffer.__array_interface__['data']
-
-    def __exit__(self):
-        if os.name == 'nt':
-            MEM_RELEASE = 0x8000
-            windll.kernel32.VirtualFree.argtypes = [c_void_p, c_long, c_long]
-            windll.kernel32.VirtualFree.restype = c_int
-            windll.kernel32.VirtualFree(c_void_p(self.addr), 0, MEM_RELEASE)
-        elif os.name == 'posix':
-            libc = CDLL("libc.so.6")
-            libc.free(self.addr)
-        else:
-            raise Exception("Unsupported OS")
+
+    def release(self):
+        """Release the memory of the buffer (can be called more than once)"""
+        self.buffer = None
+        self.ctypes_buffer = None
+        if self._finalizer is not None:
+            self._finalizer()
+        elif self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # views on the buffer still exist, the memory is unmapped when they are deleted
+                pass
+        self.addr = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class DMABufferPool():
+    """Pool of DMA buffers, kept between acquisitions.
+
+    The buffers are looked up by sample type and size, so re-arming the board
+    with the same record settings costs no allocation. Idle buffers of other
+    sizes are released when new buffers must be allocated; clear() releases
+    all idle buffers."""
+
+    def __init__(self, use_mmap=False, hugepages=False):
+        self.use_mmap = use_mmap
+        self.hugepages = hugepages
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, c_sample_type, size_bytes, count=1):
+        """Return count buffers of size_bytes bytes"""
+        key = (c_sample_type, size_bytes)
+        with self.lock:
+            buffers = self.idle.get(key, [])[:count]
+            self.idle[key] = self.idle.get(key, [])[count:]
+            if len(buffers) < count:
+                self._trim(key)
+        while len(buffers) < count:
+            buffers.append(DMABuffer(c_sample_type, size_bytes, self.use_mmap, self.hugepages))
+        return buffers
+
+    def release(self, buffers):
+        """Give buffers back to the pool"""
+        with self.lock:
+            for buf in buffers:
+                if buf.addr is not None:
+                    self.idle.setdefault((buf.c_sample_type, buf.size_bytes), []).append(buf)
+
+    def _trim(self, keep):
+        for key in list(self.idle):
+            if key != keep:
+                for buf in self.idle.pop(key):
+                    buf.release()
+
+    def clear(self):
+        """Release the memory of all idle buffers"""
+        with self.lock:
+            self._trim(None)
+
+    def idleBytes(self):
+        with self.lock:
+            return sum(size * len(buffers) for (sample_type, size), buffers in self.idle.items())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.clear()
+
+
+_simulated_dll = None
+
+
+def loadLibrary(backend="ATSApi"):
+    """Load the ATSApi library, or the simulated one (shared by all digitizers) if backend is "simulated"."""
+    global _simulated_dll
+    if backend == "simulated":
+        if _simulated_dll is None:
+            # enough boards for a DigitizerGroup
+            _simulated_dll = alazarsim.SimulatedATSApi(boards=2)
+        return _simulated_dll
+    if backend != "ATSApi":
+        raise Exception("Unknown ADC backend: %s" % backend)
+    try:
+        return ctypes.cdll.LoadLibrary('ATSApi')
+    except:
+        # if failure, try to open in driver folder
+        sPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'atsapi')
+        return ctypes.CDLL(os.path.join(sPath, 'ATSApi'))
 
 
 # error type returned by this class
@@ -122,6 +251,356 @@ class TimeoutError(Error):
     pass
 
 
+class BufferLayout():
+    """Layout of the DMA buffers of an AutoDMA acquisition.
+
+    The data of a buffer is handed to the reducers as an array shaped
+    (nAvPerBuffer, nPtsOut, channelCount): the records of the buffer that are
+    averaged together, the samples of all records (nRecord * samplesPerRecord)
+    and the active channels, in the order of self.channels."""
+
+    def __init__(self, channels, samplesPerRecord, nRecord, recordsPerBuffer, buffersPerAcquisition, bitsPerSample, input_range):
+        self.channels = channels
+        self.samplesPerRecord = samplesPerRecord
+        self.nRecord = nRecord
+        self.recordsPerBuffer = recordsPerBuffer
+        self.buffersPerAcquisition = buffersPerAcquisition
+        self.bitsPerSample = bitsPerSample
+        self.input_range = input_range
+        self.nAvPerBuffer = recordsPerBuffer // nRecord
+        self.nPtsOut = samplesPerRecord * nRecord
+        self.shape = (self.nAvPerBuffer, self.nPtsOut, len(channels))
+        self.samplesPerBuffer = self.nAvPerBuffer * self.nPtsOut * len(channels)
+        # the samples are in the most significant bits of the codes
+        self.codeScale = 2 ** (8 * ((bitsPerSample + 7) // 8) - bitsPerSample)
+
+
+class BufferReducer():
+    """Base class of the reducers of the DMA buffers.
+
+    start(layout) is called before the acquisition, reduce(index, data) for
+    each completed buffer and result() at the end. reduce may be called
+    concurrently from several worker threads, with buffers in any order, and
+    must not keep references to data: the buffer is posted to the board again
+    as soon as all reducers are done with it."""
+
+    def start(self, layout):
+        self.layout = layout
+
+    def reduce(self, index, data):
+        raise NotImplementedError
+
+    def result(self):
+        return None
+
+
+class RawTrace():
+    """Raw codes of a channel with their calibration, as in the channel class.
+
+    The volts are ((signal_raw - y_offset) * y_mult) + y_zero, computed only
+    when data_y is used, and the time of the samples is x_zero + i * x_incr."""
+
+    def __init__(self, channel, signal_raw, y_offset, y_mult, input_range, sample_rate, x_zero=0.0):
+        self.channel = channel
+        self.signal_raw = signal_raw
+        self.y_offset = y_offset
+        self.y_mult = y_mult
+        self.y_zero = 0
+        self.input_range = input_range
+        self.sample_rate = sample_rate
+        self.x_zero = x_zero
+        self.x_incr = float(1. / sample_rate)
+
+    @property
+    def data_y(self):
+        return ((self.signal_raw - self.y_offset) * self.y_mult) + self.y_zero
+
+    @property
+    def data_x(self):
+        return self.x_zero + np.arange(self.signal_raw.size) * self.x_incr
+
+
+class AverageReducer(BufferReducer):
+    """Average the records in the integer domain.
+
+    The raw codes are summed in an int64 buffer and converted to volts only
+    once, at the end (or left as raw codes plus calibration, see traces())."""
+
+    def start(self, layout):
+        self.layout = layout
+        self.lock = threading.Lock()
+        # range and zero for conversion to voltages
+        codeZero = 2 ** (float(layout.bitsPerSample) - 1) - 0.5
+        codeRange = 2 ** (float(layout.bitsPerSample) - 1) - 0.5
+        # range and zero for each channel, combined with bit shifting
+        self.range = {ch: layout.input_range[ch] / codeRange / layout.codeScale for ch in layout.channels}
+        self.offset = layout.codeScale * codeZero
+        self.sum = {ch: np.zeros(layout.nPtsOut, dtype=np.int64) for ch in layout.channels}
+        self.count = 0
+
+    def reduce(self, index, data):
+        if self.layout.nAvPerBuffer == 1:
+            with self.lock:
+                for i, ch in enumerate(self.layout.channels):
+                    np.add(self.sum[ch], data[0, :, i], out=self.sum[ch], casting="unsafe")
+                self.count += 1
+        else:
+            partial = [data[:, :, i].sum(axis=0, dtype=np.int64) for i in range(len(self.layout.channels))]
+            with self.lock:
+                for i, ch in enumerate(self.layout.channels):
+                    self.sum[ch] += partial[i]
+                self.count += self.layout.nAvPerBuffer
+
+    def result(self):
+        """Return the averaged data of channels 1 and 2 in volts (empty for inactive channels)."""
+        vData = [np.array([], dtype=float), np.array([], dtype=float)]
+        for ch in self.layout.channels:
+            vData[ch - 1] = self.range[ch] * (self.sum[ch] / max(1, self.count) - self.offset)
+        return vData
+
+    def traces(self, sample_rate):
+        """Return the sum of the raw codes of channels 1 and 2 as RawTrace (None for inactive channels).
+
+        The number of records summed is folded in the calibration, so the data
+        is exact and the conversion is left to the reader."""
+        traces = [None, None]
+        count = max(1, self.count)
+        for ch in self.layout.channels:
+            traces[ch - 1] = RawTrace(ch, self.sum[ch], self.offset * count, self.range[ch] / count,
+                                      self.layout.input_range[ch], sample_rate)
+        return traces
+
+
+def scanEdges(samples, low, high):
+    """Find the edges of samples with hysteresis, starting from an unknown state.
+
+    The signal is high from a sample >= high until the next sample <= low and
+    low from a sample <= low until the next sample >= high. Returns the index
+    and the state (True if high) of the first sample that sets the state, the
+    indices of the rising and falling edges after it and the final state;
+    (None, None, [], [], None) if no sample sets the state."""
+    high_samples = samples >= high
+    decisive = np.flatnonzero(high_samples | (samples <= low))
+    if decisive.size == 0:
+        return None, None, np.array([], dtype=np.int64), np.array([], dtype=np.int64), None
+    states = high_samples[decisive]
+    changes = np.flatnonzero(states[1:] != states[:-1]) + 1
+    rising = decisive[changes[states[changes]]]
+    falling = decisive[changes[~states[changes]]]
+    return int(decisive[0]), bool(states[0]), rising, falling, bool(states[-1])
+
+
+class EdgeDetector():
+    """Detect the edges of a signal with hysteresis, chunk by chunk.
+
+    The chunks must be given in order; the state of the signal is carried
+    from one chunk to the next, so an edge across the boundary of two chunks
+    is found once. The edges are kept as sample indices in rising and falling."""
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+        self.state = None
+        self.position = 0
+        self._rising = []
+        self._falling = []
+
+    def process(self, samples):
+        first, first_state, rising, falling, final_state = scanEdges(samples, self.low, self.high)
+        self.add(self.position, first, first_state, rising, falling, final_state)
+        self.position += samples.size
+
+    def add(self, position, first, first_state, rising, falling, final_state):
+        """Add the result of scanEdges for a chunk starting at sample position."""
+        if first is None:
+            return
+        if self.state is not None and self.state != first_state:
+            (self._rising if first_state else self._falling).append(np.array([position + first]))
+        self._rising.append(position + rising)
+        self._falling.append(position + falling)
+        self.state = final_state
+
+    @property
+    def rising(self):
+        return np.concatenate([np.array([], dtype=np.int64)] + self._rising)
+
+    @property
+    def falling(self):
+        return np.concatenate([np.array([], dtype=np.int64)] + self._falling)
+
+
+class EdgeReducer(BufferReducer):
+    """Detect the edges of the signals as the buffers arrive.
+
+    thresholds gives the (low, high) thresholds in volts of each channel. The
+    records of all buffers are taken as a single stream per channel: the
+    buffers are scanned by the workers in any order and the results are
+    joined in order at the end, carrying the state from one buffer to the
+    next. result() returns {channel: (rising, falling)} as sample indices."""
+
+    def __init__(self, thresholds):
+        self.thresholds = thresholds
+
+    def start(self, layout):
+        self.layout = layout
+        self.lock = threading.Lock()
+        # thresholds in codes, with bit shifting, as in AverageReducer
+        codeZero = 2 ** (float(layout.bitsPerSample) - 1) - 0.5
+        codeRange = 2 ** (float(layout.bitsPerSample) - 1) - 0.5
+        self.codes = {}
+        for ch in layout.channels:
+            if ch in self.thresholds:
+                low, high = self.thresholds[ch]
+                scale = codeRange * layout.codeScale / layout.input_range[ch]
+                zero = layout.codeScale * codeZero
+                self.codes[ch] = (zero + low * scale, zero + high * scale)
+        self.scans = {}
+
+    def reduce(self, index, data):
+        scans = {}
+        for i, ch in enumerate(self.layout.channels):
+            if ch in self.codes:
+                scans[ch] = scanEdges(data[:, :, i].ravel(), *self.codes[ch])
+        with self.lock:
+            self.scans[index] = scans
+
+    def result(self):
+        edges = {}
+        samples = self.layout.nAvPerBuffer * self.layout.nPtsOut
+        for ch in self.codes:
+            detector = EdgeDetector(*self.codes[ch])
+            for index in sorted(self.scans):
+                detector.add(index * samples, *self.scans[index][ch])
+            edges[ch] = (detector.rising, detector.falling)
+        return edges
+
+
+def traceEdges(trace, low, high):
+    """Return the times of the rising and falling edges of a trace (RawTrace or channel), thresholds in volts."""
+    # thresholds in codes, from the calibration of the trace
+    detector = EdgeDetector((low - trace.y_zero) / trace.y_mult + trace.y_offset,
+                            (high - trace.y_zero) / trace.y_mult + trace.y_offset)
+    detector.process(trace.signal_raw)
+    return trace.x_zero + detector.rising * trace.x_incr, trace.x_zero + detector.falling * trace.x_incr
+
+
+class DMAEngine():
+    """Producer/consumer engine for AutoDMA acquisitions.
+
+    The acquisition thread only waits for the DMA buffers to be filled and
+    hands them to worker threads through a bounded queue. The workers run the
+    reducers on the buffers and the buffers are posted back to the board, in
+    order, as soon as they are done. The board keeps filling the buffers still
+    posted while the workers convert the data.
+
+    Counters (see stats()):
+        buffers: buffers completed by the board
+        overflows: times the board ran out of posted buffers because the
+            workers were behind (data is lost on the board)
+        max_queued: maximum number of buffers waiting for the workers
+        latency: mean and max time (s) from buffer completion to reduced
+    """
+
+    def __init__(self, digitizer, buffers, reducers, nWorkers=2, queueSize=None):
+        self.digitizer = digitizer
+        self.buffers = buffers
+        self.reducers = reducers
+        self.nWorkers = max(1, nWorkers)
+        self.queue = queue.Queue(maxsize=queueSize or len(buffers))
+        self.error = None
+        self.buffers_completed = 0
+        self.overflows = 0
+        self.max_queued = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._lock = threading.Lock()
+
+    def stats(self):
+        return {"buffers": self.buffers_completed,
+                "overflows": self.overflows,
+                "max_queued": self.max_queued,
+                "latency_mean": self.latency_total / max(1, self.buffers_completed),
+                "latency_max": self.latency_max}
+
+    def _work(self, layout, bytesPerSample):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            index, buf, done, t_complete = item
+            try:
+                if self.error is None:
+                    data = buf.buffer[:layout.samplesPerBuffer].reshape(layout.shape)
+                    for reducer in self.reducers:
+                        reducer.reduce(index, data)
+            except Exception as error:
+                self.error = error
+            latency = time.perf_counter() - t_complete
+            with self._lock:
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+            done.set()
+            self.queue.task_done()
+
+    def run(self, layout, bytesPerSample, timeout, firstTimeout, funcStop=None, funcProgress=None):
+        """Acquire layout.buffersPerAcquisition buffers. The buffers must be posted to the board."""
+        for reducer in self.reducers:
+            reducer.start(layout)
+        workers = [threading.Thread(target=self._work, args=(layout, bytesPerSample), name="DMA worker %d" % i)
+                   for i in range(self.nWorkers)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        posted = deque(self.buffers)
+        pending = deque()
+        timeout_ms = int(firstTimeout * 1000)
+        try:
+            while self.buffers_completed < layout.buffersPerAcquisition:
+                if self.error is not None:
+                    raise self.error
+                if not posted:
+                    # all buffers are waiting for the workers, the board has nowhere to write
+                    self.overflows += 1
+                    pending[0][1].wait()
+                self._repost(posted, pending)
+
+                # Wait for the buffer at the head of the list of posted buffers to be filled by the board.
+                buf = posted.popleft()
+                self.digitizer.AlazarWaitAsyncBufferComplete(buf.addr, timeout_ms=timeout_ms)
+                t_complete = time.perf_counter()
+                # reset timeout time, can be different than first call
+                timeout_ms = int(timeout * 1000)
+                done = threading.Event()
+                self.queue.put((self.buffers_completed, buf, done, t_complete))
+                pending.append((buf, done))
+                self.buffers_completed += 1
+                self.max_queued = max(self.max_queued, self.queue.qsize())
+
+                # break if stopped from outside
+                if funcStop is not None and funcStop():
+                    break
+                # report progress
+                if funcProgress is not None:
+                    funcProgress(float(self.buffers_completed) / float(layout.buffersPerAcquisition))
+        finally:
+            for worker in workers:
+                self.queue.put(None)
+            for worker in workers:
+                worker.join()
+        if self.error is not None:
+            raise self.error
+        return [reducer.result() for reducer in self.reducers]
+
+    def _repost(self, posted, pending):
+        """Post back to the board, in order, the buffers the workers are done with."""
+        while pending and pending[0][1].is_set():
+            buf, done = pending.popleft()
+            self.digitizer.AlazarPostAsyncBuffer(buf.addr, buf.size_bytes)
+            posted.append(buf)
+
+
 class Digitizer():
     """Represent the Alazartech digitizer, redefines the dll functions in python"""
 
@@ -254,21 +733,23 @@ class Digitizer():
         30: 'ATS9416'
     }
 
-    def __init__(self, systemId=1, boardId=1, timeout=10.0):
-        """The init case defines a session ID, used to identify the instrument"""
+    channelCount = 2
+
+    def __init__(self, systemId=1, boardId=1, timeout=10.0, backend="ATSApi"):
+        """The init case defines a session ID, used to identify the instrument
+
+        backend is "ATSApi" for the board, or "simulated" to run without it
+        (see alazarsim)."""
         # range settings; default value of 400mV for 9373;
         # will be overwritten if model is 9870 and AlazarInputControl called
         self.input_range = {1: 0.4, 2: 0.4}
         self.buffers = []
+        self.read_buffer = None
+        self.pool = DMABufferPool()
         self.timeout = timeout
         # create a session id
 
-        try:
-            self._ATS_dll = ctypes.cdll.LoadLibrary('ATSApi')
-        except:
-            # if failure, try to open in driver folder
-            sPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'atsapi')
-            self._ATS_dll = ctypes.CDLL(os.path.join(sPath, 'ATSApi'))
+        self._ATS_dll = loadLibrary(backend)
 
         self._handle = self._ATS_dll.AlazarGetBoardBySystemID(systemId, boardId)
         if not self._handle:
@@ -285,23 +766,24 @@ class Digitizer():
         # get mem and bitsize
         (self.memorySize_samples, self.bitsPerSample) = self.get_channel_info(self._handle)
 
-    def find_boards(cls, dll_path=None):
+    @classmethod
+    def find_boards(cls, backend="ATSApi"):
         """
         Find Alazar boards connected
 
         Args:
-            dll_path: (string) path of the Alazar driver dll
+            backend: (string) "ATSApi" or "simulated", as in Digitizer()
 
         Returns:
             list: list of board info for each connected board
         """
-
-        system_count = cls._ATS_dll.AlazarNumOfSystems()
+        dll = loadLibrary(backend)
+        system_count = dll.AlazarNumOfSystems()
         boards = []
         for system_id in range(1, system_count + 1):
-            board_count = cls._ATS_dll.AlazarBoardsInSystemBySystemID(system_id)
+            board_count = dll.AlazarBoardsInSystemBySystemID(system_id)
             for board_id in range(1, board_count + 1):
-                boards.append(cls.get_board_info(cls._ATS_dll, system_id, board_id))
+                boards.append(cls(system_id, board_id, backend=backend).get_board_info(system_id, board_id))
         return boards
 
     def get_board_info(self, system_id, board_id):
@@ -338,7 +820,7 @@ class Digitizer():
         bitsPerSample_ptr = bitsPerSample.ctypes.data_as(POINTER(c_uint8))
         # self._ATS_dll.AlazarGetChannelInfo(handle, memorySize.ctypes.data, bitsPerSample.ctypes.data)
         self._ATS_dll.AlazarGetChannelInfo(handle, memorySize_ptr, bitsPerSample_ptr)
-        return memorySize[0], bitsPerSample[0]
+        return int(memorySize[0]), int(bitsPerSample[0])
 
     def testLED(self):
         import time
@@ -481,9 +963,18 @@ class Digitizer():
     def readTracesDMA(self, bGetCh1, bGetCh2, nSamples, nRecord, nBuffer, nAverage=1,
                       bConfig=True, bArm=True, bMeasure=True,
                       funcStop=None, funcProgress=None, timeout=None, bufferSize=512,
-                      firstTimeout=None, maxBuffers=1024):
-        """read traces in NPT AutoDMA mode, convert to float, average to single trace"""
-        t0 = time.clock()
+                      firstTimeout=None, maxBuffers=1024, reducers=None, nWorkers=2, raw=False,
+                      spillFile=None):
+        """read traces in NPT AutoDMA mode, convert to float, average to single trace
+
+        The buffers are processed by a DMAEngine: extra reducers (BufferReducer)
+        are run on every buffer along with the averaging, and the counters of
+        the engine are kept in self.dma_stats. With raw=True the summed raw
+        codes of each channel are returned as RawTrace, with their calibration,
+        instead of volts. With spillFile, the buffers are written as they are to
+        that file (see adcfile) instead of being averaged, and the file is
+        returned opened as an adcfile.ADCFile."""
+        t0 = time.perf_counter()
         lT = []
 
         # use global timeout if not given
@@ -561,12 +1052,9 @@ class Digitizer():
             sample_type = ctypes.c_uint8
             if bytesPerSample > 1:
                 sample_type = ctypes.c_uint16
-            # clear old buffers
-            self.removeBuffersDMA()
-            # create new buffers
-            self.buffers = []
-            for i in range(bufferCount):
-                self.buffers.append(DMABuffer(sample_type, bytesPerBufferMem))
+            # reuse the buffers of the pool, allocating only if the size changed
+            self.pool.release(self.buffers)
+            self.buffers = self.pool.acquire(sample_type, bytesPerBufferMem, bufferCount)
 
         # arm and start capture, if wanted
         if bArm:
@@ -583,109 +1071,57 @@ class Digitizer():
             try:
                 self.AlazarStartCapture()
             except:
-                # make sure buffers release memory if failed
-                self.removeBuffersDMA()
+                # give the buffers back to the pool if failed
+                self.pool.release(self.buffers)
+                self.buffers = []
                 raise
 
         # if not waiting for result, return here
         if not bMeasure:
             return
 
-        lT.append('Post: %.1f ms' % ((time.clock() - t0) * 1000))
+        lT.append('Post: %.1f ms' % ((time.perf_counter() - t0) * 1000))
+        layout = BufferLayout([ch for ch in (1, 2) if channels & ch], samplesPerRecord, nRecord, recordsPerBuffer,
+                              buffersPerAcquisition, self.bitsPerSample, self.input_range)
+        if spillFile is not None:
+            average = adcfile.ADCFileWriter(spillFile, getattr(self, "sample_rate", 1))
+        else:
+            average = AverageReducer()
+        engine = DMAEngine(self, self.buffers, [average] + list(reducers or []), nWorkers=nWorkers)
+        log.info(str(lT))
+        lT = []
         try:
-            lT.append('Start: %.1f ms' % ((time.clock() - t0) * 1000))
-            buffersCompleted = 0
-            bytesTransferred = 0
-            # initialize data array
-            nPtsOut = samplesPerRecord * nRecord
-            nAvPerBuffer = recordsPerBuffer / nRecord
-            vData = [np.zeros(nPtsOut, dtype=float), np.zeros(nPtsOut, dtype=float)]
-            # range and zero for conversion to voltages
-            codeZero = 2 ** (float(self.bitsPerSample) - 1) - 0.5
-            codeRange = 2 ** (float(self.bitsPerSample) - 1) - 0.5
-            # range and zero for each channel, combined with bit shifting
-            range1 = self.input_range[1] / codeRange / 16.
-            range2 = self.input_range[2] / codeRange / 16.
-            offset = 16. * codeZero
-
-            timeout_ms = int(firstTimeout * 1000)
-
-            log.info(str(lT))
-            lT = []
-
-            while (buffersCompleted < buffersPerAcquisition):
-                # Wait for the buffer at the head of the list of available
-                # buffers to be filled by the board.
-                buf = self.buffers[buffersCompleted % len(self.buffers)]
-                self.AlazarWaitAsyncBufferComplete(buf.addr, timeout_ms=timeout_ms)
-                # lT.append('Wait: %.1f ms' % ((time.clock() - t0) * 1000))
-
-                # reset timeout time, can be different than first call
-                timeout_ms = int(timeout * 1000)
-
-                buffersCompleted += 1
-                bytesTransferred += buf.size_bytes
-
-                # break if stopped from outside
-                if funcStop is not None and funcStop():
-                    break
-                # report progress
-                if funcProgress is not None:
-                    funcProgress(float(buffersCompleted) / float(buffersPerAcquisition))
-
-                # remove extra elements for getting even 256*16 buffer sizes
-                if bytesPerBuffer == bytesPerBufferMem:
-                    buf_truncated = buf.buffer
-                else:
-                    buf_truncated = buf.buffer[:(bytesPerBuffer // bytesPerSample)]
-
-                # reshape, sort and average data
-                if nAverage > 1:
-                    if channels == 1:
-                        rs = buf_truncated.reshape((nAvPerBuffer, nPtsOut))
-                        vData[0] += range1 * (np.mean(rs, 0) - offset)
-                    elif channels == 2:
-                        rs = buf_truncated.reshape((nAvPerBuffer, nPtsOut))
-                        vData[1] += range2 * (np.mean(rs, 0) - offset)
-                    elif channels == 3:
-                        rs = buf_truncated.reshape((nAvPerBuffer, nPtsOut, 2))
-                        vData[0] += range1 * (np.mean(rs[:, :, 0], 0) - offset)
-                        vData[1] += range2 * (np.mean(rs[:, :, 1], 0) - offset)
-                else:
-                    if channels == 1:
-                        vData[0] = range1 * (buf_truncated - offset)
-                    elif channels == 2:
-                        vData[1] = range2 * (buf_truncated - offset)
-                    elif channels == 3:
-                        rs = buf_truncated.reshape((nPtsOut, 2))
-                        vData[0] = range1 * (rs[:, 0] - offset)
-                        vData[1] = range2 * (rs[:, 1] - offset)
-
-                # lT.append('Sort/Avg: %.1f ms' % ((time.clock() - t0) * 1000))
-                # log.info(str(lT))
-                # lT = []
-                #
-                # Sample codes are unsigned by default. As a result:
-                # - 0x00 represents a negative full scale input signal.
-                # - 0x80 represents a ~0V signal.
-                # - 0xFF represents a positive full scale input signal.
-
-                # Add the buffer to the end of the list of available buffers.
-                self.AlazarPostAsyncBuffer(buf.addr, buf.size_bytes)
+            lT.append('Start: %.1f ms' % ((time.perf_counter() - t0) * 1000))
+            #
+            # Sample codes are unsigned by default. As a result:
+            # - 0x00 represents a negative full scale input signal.
+            # - 0x80 represents a ~0V signal.
+            # - 0xFF represents a positive full scale input signal.
+            results = engine.run(layout, bytesPerSample, timeout, firstTimeout, funcStop=funcStop, funcProgress=funcProgress)
         finally:
             # release resources
             try:
                 self.AlazarAbortAsyncRead()
             except:
                 pass
-            lT.append('Abort: %.1f ms' % ((time.clock() - t0) * 1000))
-        # normalize
-        # log.info('Average: %.1f ms' % np.mean(lAvTime))
-        vData[0] /= buffersPerAcquisition
-        vData[1] /= buffersPerAcquisition
+            self.dma_stats = engine.stats()
+            lT.append('Abort: %.1f ms' % ((time.perf_counter() - t0) * 1000))
         # # log timing information
-        lT.append('Done: %.1f ms' % ((time.clock() - t0) * 1000))
+        lT.append('Done: %.1f ms' % ((time.perf_counter() - t0) * 1000))
+        lT.append('DMA: %s' % self.dma_stats)
         log.info(str(lT))
+        if spillFile is not None:
+            return adcfile.ADCFile(results[0])
+        nPtsOut = layout.nPtsOut
+        if raw:
+            traces = average.traces(getattr(self, "sample_rate", 1))
+            # return data - requested vector length, not restricted to 128 multiple
+            if nPtsOut != (samplesPerRecordValue * nRecord):
+                for trace in traces:
+                    if trace is not None:
+                        trace.signal_raw = trace.signal_raw.reshape((nRecord, samplesPerRecord))[:, :samplesPerRecordValue].flatten()
+            return traces
+        vData = results[0]
         # return data - requested vector length, not restricted to 128 multiple
         if nPtsOut != (samplesPerRecordValue * nRecord):
             if len(vData[0]) > 0:
@@ -696,11 +1132,13 @@ class Digitizer():
 
     def removeBuffersDMA(self):
         """Clear and remove DMA buffers, to release memory"""
-        # make sure buffers release memory
-        for buf in self.buffers:
-            buf.__exit__()
-        # remove all
+        self.pool.release(self.buffers)
         self.buffers = []
+        if self.read_buffer is not None:
+            self.pool.release([self.read_buffer])
+            self.read_buffer = None
+        # make sure buffers release memory
+        self.pool.clear()
 
     def readTraces(self, Channel):
         """Read traces, convert to float, average to a single trace"""
@@ -766,6 +1204,212 @@ class Digitizer():
         ch.getWaveform()
         return ch
 
+    def readChannels(self, channels):
+        """Read the record of several channels from the on-board memory in a single buffer.
+
+        The records are read one after the other into a DMA buffer kept
+        between calls (reallocated only when a longer record is needed), one
+        block per channel. Returns a RawTrace per channel, whose signal_raw
+        is a copy of its block, so it stays valid when the buffer is reused
+        or released."""
+        channels = list(channels)
+        if not channels:
+            return []
+        bytesPerSample = (self.bitsPerSample + 7) // 8
+        bitShift = 8 * bytesPerSample - self.bitsPerSample
+        samplesPerRecord = self.nPreSize + self.nPostSize
+        # The buffer must be at least 16 samples larger than the transfer size
+        stride = samplesPerRecord + 16
+        size_bytes = int(4096 * np.ceil(stride * len(channels) * bytesPerSample / 4096.))
+        if self.read_buffer is None or self.read_buffer.size_bytes < size_bytes:
+            if self.read_buffer is not None:
+                self.pool.release([self.read_buffer])
+            self.read_buffer = self.pool.acquire(c_uint16 if bytesPerSample > 1 else c_uint8, size_bytes)[0]
+        block = self.read_buffer.buffer[:stride * len(channels)].reshape((len(channels), stride))
+
+        codeRange = (1 << (self.bitsPerSample - 1)) - 0.5
+        traces = []
+        for i, ch in enumerate(channels):
+            address = self.read_buffer.addr + i * stride * bytesPerSample
+            self.AlazarRead(ch, c_void_p(address), bytesPerSample, 1, -self.nPreSize, samplesPerRecord)
+            signal_raw = block[i, :samplesPerRecord]
+            signal_raw = np.right_shift(signal_raw, bitShift) if bitShift else signal_raw.copy()
+            traces.append(RawTrace(ch, signal_raw, codeRange, self.input_range[ch] / codeRange, self.input_range[ch],
+                                   self.sample_rate, x_zero=-self.nPreSize / self.sample_rate))
+        return traces
+
+
+class DigitizerGroup():
+    """Several digitizers acquiring together, seen as a single digitizer.
+
+    The boards are configured identically and triggered by the same external
+    trigger, so their records share the same time base. The channels are
+    numbered across the boards: channels 1 and 2 are those of the first
+    board, 3 and 4 those of the second one, and so on. Each board is read by
+    its own thread."""
+
+    def __init__(self, boards=None, timeout=10.0, backend="ATSApi"):
+        """boards is a list of (system id, board id), all boards found if None"""
+        if boards is None:
+            boards = [(info["system_id"], info["board_id"]) for info in Digitizer.find_boards(backend)]
+        if not boards:
+            raise Exception("No AlazarTech board found")
+        self.digitizers = [Digitizer(systemId, boardId, timeout, backend) for systemId, boardId in boards]
+        self.channelCount = sum(digitizer.channelCount for digitizer in self.digitizers)
+
+    def route(self, Channel):
+        """Return the digitizer and its channel number for a channel of the group"""
+        for digitizer in self.digitizers:
+            if Channel <= digitizer.channelCount:
+                return digitizer, Channel
+            Channel -= digitizer.channelCount
+        raise Exception("No ADC channel %d" % Channel)
+
+    def _firstChannel(self, digitizer):
+        first = 1
+        for other in self.digitizers:
+            if other is digitizer:
+                return first
+            first += other.channelCount
+
+    def _forAll(self, func_name, *args, **kwargs):
+        return [getattr(digitizer, func_name)(*args, **kwargs) for digitizer in self.digitizers]
+
+    def _inParallel(self, func):
+        """Run func(digitizer) for every digitizer, one thread per board, and return the results in order"""
+        with futures.ThreadPoolExecutor(max_workers=len(self.digitizers)) as executor:
+            return list(executor.map(func, self.digitizers))
+
+    @property
+    def sample_rate(self):
+        return self.digitizers[0].sample_rate
+
+    @property
+    def input_range(self):
+        ranges = {}
+        for digitizer in self.digitizers:
+            first = self._firstChannel(digitizer)
+            for ch, value in digitizer.input_range.items():
+                ranges[first + ch - 1] = value
+        return ranges
+
+    # configuration, the same for all boards
+
+    def AlazarSetCaptureClock(self, *args, **kwargs):
+        self._forAll("AlazarSetCaptureClock", *args, **kwargs)
+
+    def AlazarSetTriggerOperation(self, *args, **kwargs):
+        self._forAll("AlazarSetTriggerOperation", *args, **kwargs)
+
+    def AlazarSetExternalTrigger(self, *args, **kwargs):
+        self._forAll("AlazarSetExternalTrigger", *args, **kwargs)
+
+    def AlazarSetTriggerDelay(self, *args, **kwargs):
+        self._forAll("AlazarSetTriggerDelay", *args, **kwargs)
+
+    def AlazarSetTriggerTimeOut(self, *args, **kwargs):
+        self._forAll("AlazarSetTriggerTimeOut", *args, **kwargs)
+
+    def AlazarSetRecordSize(self, *args, **kwargs):
+        self._forAll("AlazarSetRecordSize", *args, **kwargs)
+
+    def AlazarSetRecordCount(self, *args, **kwargs):
+        self._forAll("AlazarSetRecordCount", *args, **kwargs)
+
+    # configuration of a channel
+
+    def AlazarInputControl(self, Channel, Coupling, InputRange, Impedance):
+        digitizer, ch = self.route(Channel)
+        digitizer.AlazarInputControl(ch, Coupling, InputRange, Impedance)
+
+    def AlazarSetBWLimit(self, Channel, enable):
+        digitizer, ch = self.route(Channel)
+        digitizer.AlazarSetBWLimit(ch, enable)
+
+    # acquisition
+
+    def AlazarStartCapture(self):
+        self._forAll("AlazarStartCapture")
+
+    def AlazarAbortCapture(self):
+        self._forAll("AlazarAbortCapture")
+
+    def acquisition(self, enable):
+        self._forAll("acquisition", enable)
+
+    def wasTriggered(self):
+        """Check if all boards finished their acquisition."""
+        return all(self._forAll("wasTriggered"))
+
+    def readChannels(self, channels):
+        """Read the record of several channels of the group, the boards in parallel (see Digitizer.readChannels).
+
+        The channel of the traces returned is their number in the group."""
+        channels = list(channels)
+        boards = {}
+        for Channel in channels:
+            digitizer, ch = self.route(Channel)
+            boards.setdefault(digitizer, []).append(ch)
+        results = self._inParallel(lambda digitizer: digitizer.readChannels(boards.get(digitizer, [])))
+        traces = {}
+        for digitizer, board_traces in zip(self.digitizers, results):
+            first = self._firstChannel(digitizer)
+            for trace in board_traces:
+                trace.channel = first + trace.channel - 1
+                traces[trace.channel] = trace
+        return [traces[Channel] for Channel in channels]
+
+    def readTracesDMA(self, channels, nSamples, nRecord, nBuffer, **kwargs):
+        """Acquire the enabled channels of all boards in AutoDMA mode (see Digitizer.readTracesDMA).
+
+        channels is the list of enabled channels of the group. All boards are
+        configured and armed first, then read in parallel. Returns the result
+        of each channel, in the order of channels.
+
+        With spillFile, each board writes its own file, named after spillFile
+        with the index of the board (e.g. spill_1.adc, spill_2.adc), and the
+        files are returned opened as adcfile.ADCFile, one per board."""
+        spillFile = kwargs.pop("spillFile", None)
+        enabled = []
+        for digitizer in self.digitizers:
+            first = self._firstChannel(digitizer)
+            enabled.append((first in channels, first + 1 in channels))
+        for digitizer, (bGetCh1, bGetCh2) in zip(self.digitizers, enabled):
+            digitizer.readTracesDMA(bGetCh1, bGetCh2, nSamples, nRecord, nBuffer, bMeasure=False, **kwargs)
+
+        def measure(digitizer):
+            index = self.digitizers.index(digitizer)
+            bGetCh1, bGetCh2 = enabled[index]
+            if spillFile is not None:
+                root, ext = os.path.splitext(spillFile)
+                kwargs_board = dict(kwargs, spillFile="%s_%d%s" % (root, index + 1, ext))
+            else:
+                kwargs_board = kwargs
+            return digitizer.readTracesDMA(bGetCh1, bGetCh2, nSamples, nRecord, nBuffer, bConfig=False, bArm=False,
+                                           **kwargs_board)
+
+        if spillFile is not None:
+            return self._inParallel(measure)
+        results = {}
+        for digitizer, data in zip(self.digitizers, self._inParallel(measure)):
+            first = self._firstChannel(digitizer)
+            results[first], results[first + 1] = data
+        return [results[Channel] for Channel in channels]
+
+    def removeBuffersDMA(self):
+        self._forAll("removeBuffersDMA")
+
+    # information
+
+    def getName(self):
+        return ", ".join(self._forAll("getName"))
+
+    def getSerialNumber(self):
+        return ", ".join(str(serial) for serial in self._forAll("getSerialNumber"))
+
+    def getMemorySize(self):
+        return min(self._forAll("getMemorySize"))
+
 
 class channel(Digitizer):
     """ Channel class that implements the functionality related to one of
@@ -1,8 +1,10 @@
 import logging
 import socket
+import threading
 import base64
 import re
 import numpy as np
+from instruments import shadow
 
 _log = logging.getLogger(__name__)
 
@@ -19,6 +21,8 @@ class PowerSupply(object):
         self.port = port
         self._cmd_sock = None
         self.connection_status = False
+        self.lock = threading.RLock()  # serializes the command/answer exchanges
+        self.shadow = shadow.ShadowSettings()  # settings last confirmed by the power supply
 
         self.VoltagePPMCP = 0
         self.VoltageMCP = 0
@@ -41,6 +45,7 @@ class PowerSupply(object):
 
         self.ip = ip or self.ip
         self.port = port or self.port
+        self.shadow.invalidate()
         try:
             # Set up the command connection
             self._cmd_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -72,6 +77,7 @@ class PowerSupply(object):
         if self._cmd_sock is not None:
             self._cmd_sock.close()
             self._cmd_sock = None
+        self.shadow.invalidate()
 
     def _SendCommand(self, cmd):
         """Send command without waiting for the response."""
@@ -101,37 +107,62 @@ class PowerSupply(object):
                'Mask': mask,
                'Data': data}
         msg = DifferIF_buildcmd_b64(cmd)
-        self._SendCommand(msg)
+        with self.lock:
+            self._SendCommand(msg)
 
     def _GetProperty(self, base=0, index=0, mask=0xFFFFFFFF, Type='INT', data=[]):
-        cmd = {'DevAddrSrc': 0,
-               'DevAddrDest': 0,
-               'Operator': 'GET',
-               'Type': Type,
-               'DataLength': 1,
-               'CmdExt': 0,
-               'Base': base,
-               'Index': index,
-               'Mask': mask,
-               'Data': data}
-        msg = DifferIF_buildcmd_b64(cmd)
-        self._SendCommand(msg)
-        recv = ""
-        while True:
-            recv += self._ReceiveCommandResponse()
-            if recv[-1] == '\n':
-                if len(recv) >= 31:
-                    for m in regex.finditer(recv):
-                        # print(m.group(1).encode("latin-1"))
-                        cmd = DifferIF_intercmd_b64("\x02" + m.group(1) + "\n")
-                        if cmd['Base'] == base and cmd['Index'] == index:
-                            return cmd['Data']
-                        else:
-                            self._SendCommand(msg)
-                    recv = ""
-                else:
-                    self._SendCommand(msg)
-                    recv = ""
+        return self._GetProperties([(base, index, 1)], mask, Type)[0]
+
+    def _GetProperties(self, items, mask=0xFFFFFFFF, Type='INT', retries=2):
+        """Read several properties with GET commands sent back to back, and
+        return their data in order.
+
+        items is a list of (base, index, length): length consecutive items are
+        read from base/index with a single command. The answers are matched
+        with the commands by (Base, Index) as they arrive, so answers to other
+        commands are ignored. The commands still unanswered when the socket
+        times out are sent again, up to retries times."""
+        pending = {}
+        for base, index, length in items:
+            cmd = {'DevAddrSrc': 0,
+                   'DevAddrDest': 0,
+                   'Operator': 'GET',
+                   'Type': Type,
+                   'DataLength': length,
+                   'CmdExt': 0,
+                   'Base': base,
+                   'Index': index,
+                   'Mask': mask,
+                   'Data': []}
+            pending[(base, index)] = DifferIF_buildcmd_b64(cmd)
+        results = {}
+        with self.lock:
+            self._SendCommand(b"".join(pending.values()))
+            recv = ""
+            while pending:
+                try:
+                    block = self._ReceiveCommandResponse()
+                except socket.timeout:
+                    if retries == 0:
+                        raise Exception("No answer from the I2PS to %d commands" % len(pending))
+                    retries -= 1
+                    self._SendCommand(b"".join(pending.values()))
+                    continue
+                if len(block) == 0:
+                    self.connection_status = False
+                    raise Exception("Connection closed by the I2PS")
+                recv += block
+                end = recv.rfind("\n")
+                if end < 0:
+                    continue
+                for m in regex.finditer(recv[:end + 1]):
+                    cmd = DifferIF_intercmd_b64("\x02" + m.group(1) + "\n")
+                    key = (cmd['Base'], cmd['Index'])
+                    if key in pending:
+                        del pending[key]
+                        results[key] = cmd['Data']
+                recv = recv[end + 1:]
+        return [results[(base, index)] for base, index, length in items]
 
     def reset(self):
         self.disablePulse()
@@ -163,12 +194,7 @@ class PowerSupply(object):
         return input1, input2, input3
 
     def getErrorState(self):
-        getStatReg = self.getStatReg()[0]
-        PP_error = getStatReg & 28
-        MCP_error = getStatReg & 29
-        PC_h_error = getStatReg & 30
-        PC_l_error = getStatReg & 31
-        return PP_error, MCP_error, PC_h_error, PC_l_error
+        return errorState(self.getStatReg()[0])
 
     def enablePS(self, enable=True):
         self._SetProperty(base=0x00, index=0x0C, mask=0xFFFFFFFF, data=[int(enable)])
@@ -208,6 +234,25 @@ class PowerSupply(object):
         self._SetProperty(base=0x00, index=0x13, mask=0xFFFFFFFF, data=[voltage])
         return self._GetProperty(base=0x00, index=0x13, mask=0xFFFFFFFF, data=[])[0]
 
+    def applySettings(self, settings, force=False):
+        """Apply the settings {name: value} that changed since they were last
+        confirmed, name being that of a setter without "set" (e.g.
+        "VoltageMCP"). Every setting is verified with the value read back.
+        All of them are applied when forced, after reconnecting or after
+        shadow.resync_interval seconds.
+        Returns the names of the settings not applied (empty if no error)."""
+        send, full = self.shadow.changes(settings, force)
+        errors = []
+        for name in send:
+            readback = getattr(self, "set" + name)(send[name])
+            if readback is not None and (readback & 0xFFFFFFFF) == (send[name] & 0xFFFFFFFF):
+                self.shadow.confirm({name: send[name]})
+            else:
+                self.shadow.discard([name])
+                errors.append(name)
+        self.shadow.confirm({}, full=full and not errors)
+        return errors
+
     def getName(self):
         return self._GetProperty(base=0x12, index=0x40, mask=0xFF, Type='STRING', data="")
 
@@ -222,11 +267,7 @@ class PowerSupply(object):
         return self._GetProperty(base=0x10, index=0x13, mask=0xFFFFFFFF, data=[])[0]
 
     def getVoltagePCLowSide(self):
-        voltage = self._GetProperty(base=0x10, index=0x14, mask=0xFFFFFFFF, data=[])[0]
-        if not voltage:
-            return voltage
-        else:
-            return int(-1.0 * (0xFFFFFFFF + 1 - voltage))
+        return negativeVoltage(self._GetProperty(base=0x10, index=0x14, mask=0xFFFFFFFF, data=[])[0])
 
     def getCurrentPP(self):
         return self._GetProperty(base=0x00, index=0x03, mask=0xFFFFFFFF, data=[])[0] / 10.
@@ -240,10 +281,41 @@ class PowerSupply(object):
     def getCurrentPCLowSide(self):
         return self._GetProperty(base=0x11, index=0x00, mask=0xFFFFFFFF, data=[])[0] / 10.
 
+    def getSnapshot(self):
+        """Read the voltages (PP/MCP, MCP, PC high side, PC low side), the currents
+        (PP, MCP, PC high side, PC low side), the error flags and the enable state
+        of the power supply with one pipelined request.
+        Returns (voltages, currents, errors, ps_enabled, pulse_enabled)."""
+        voltages, status, currentPCLowSide, enabled = self._GetProperties([
+            (0x10, 0x11, 4),  # voltages
+            (0x00, 0x02, 4),  # StatReg, currents PP, MCP and PC high side
+            (0x11, 0x00, 1),  # current PC low side
+            (0x00, 0x0C, 2)])  # PS and pulse enabled
+        voltages = (voltages[0], voltages[1], voltages[2], negativeVoltage(voltages[3]))
+        currents = (status[1] / 10., status[2] / 10., status[3] / 10., currentPCLowSide[0] / 10.)
+        return voltages, currents, errorState(status[0]), bool(enabled[0]), bool(enabled[1])
+
     def SoftTrigger(self):
         self._SetProperty(base=0x00, index=0x13, mask=0x40000000, data=[0x40000000])
 
 
+def negativeVoltage(voltage):
+    """Value of the PC low side voltage (negative, in two's complement)."""
+    if not voltage:
+        return voltage
+    else:
+        return int(-1.0 * (0xFFFFFFFF + 1 - voltage))
+
+
+def errorState(statReg):
+    """Error flags of PP, MCP, PC high side and PC low side in StatReg."""
+    PP_error = statReg & 28
+    MCP_error = statReg & 29
+    PC_h_error = statReg & 30
+    PC_l_error = statReg & 31
+    return PP_error, MCP_error, PC_h_error, PC_l_error
+
+
 def u8list_to_ux(l):
     result = 0
     for x in l:
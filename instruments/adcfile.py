@@ -0,0 +1,140 @@
+"""
+    adcfile.py
+    ----------
+    Raw ADC acquisitions spilled to a memory-mapped file.
+
+    The file starts with a header of HEADER_SIZE bytes (sample rate, input
+    ranges, channel mask and the layout of the buffers) followed by the DMA
+    buffers of the acquisition as delivered by the board: an array of uint16
+    codes shaped (buffers, records per buffer, samples, channels). The file
+    is opened with numpy.memmap, so the data is never loaded in memory as a
+    whole and the length of a capture is limited by the disk only.
+"""
+
+import numpy as np
+
+MAGIC = b"MPTSADC1"
+VERSION = 1
+HEADER_SIZE = 4096
+
+header_dtype = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("channel_mask", "<u4"),
+    ("bits_per_sample", "<u4"),
+    ("n_record", "<u4"),
+    ("samples_per_record", "<u8"),
+    ("records_per_buffer", "<u8"),
+    ("buffers", "<u8"),
+    ("sample_rate", "<f8"),
+    ("input_range", "<f8", (2,)),
+])
+
+
+def channelsFromMask(mask):
+    return [ch for ch in (1, 2) if mask & ch]
+
+
+class FileTrace():
+    """Raw codes of a channel read from an ADC file, with the same calibration
+    attributes as AlazarTech.channel (signal_raw, y_offset, y_mult, y_zero,
+    x_zero, x_incr, input_range), so it can be written by storage as it is."""
+
+    def __init__(self, channel, signal_raw, y_offset, y_mult, input_range, sample_rate):
+        self.channel = channel
+        self.signal_raw = signal_raw
+        self.y_offset = y_offset
+        self.y_mult = y_mult
+        self.y_zero = 0
+        self.input_range = input_range
+        self.sample_rate = sample_rate
+        self.x_zero = 0.0
+        self.x_incr = float(1. / sample_rate)
+
+    @property
+    def data_y(self):
+        return ((self.signal_raw - self.y_offset) * self.y_mult) + self.y_zero
+
+    @property
+    def data_x(self):
+        return self.x_zero + np.arange(self.signal_raw.size) * self.x_incr
+
+
+class ADCFile():
+    """An ADC file opened read-only, zero copy."""
+
+    def __init__(self, path):
+        self.path = path
+        header = np.fromfile(path, dtype=header_dtype, count=1)
+        if len(header) == 0 or header["magic"][0] != MAGIC:
+            raise Exception("%s is not an ADC file" % path)
+        header = header[0]
+        self.version = int(header["version"])
+        self.channels = channelsFromMask(int(header["channel_mask"]))
+        self.bitsPerSample = int(header["bits_per_sample"])
+        self.nRecord = int(header["n_record"])
+        self.samplesPerRecord = int(header["samples_per_record"])
+        self.recordsPerBuffer = int(header["records_per_buffer"])
+        self.buffers = int(header["buffers"])
+        self.sample_rate = float(header["sample_rate"])
+        self.input_range = {1: float(header["input_range"][0]), 2: float(header["input_range"][1])}
+        nAv = self.recordsPerBuffer // self.nRecord
+        shape = (self.buffers, nAv, self.samplesPerRecord * self.nRecord, len(self.channels))
+        self.data = np.memmap(path, dtype=np.uint16, mode="r", offset=HEADER_SIZE, shape=shape)
+
+    def records(self, channel):
+        """Return the codes of channel as a (records, samples) view on the file."""
+        i = self.channels.index(channel)
+        return self.data[..., i].reshape((-1, self.samplesPerRecord))
+
+    def trace(self, channel):
+        """Return all records of channel, one after the other, as a FileTrace.
+
+        The codes are a view on the file for single channel acquisitions (the
+        samples of two channels are interleaved, so they are copied)."""
+        # range and zero for conversion to voltages, combined with bit shifting
+        codeZero = 2 ** (float(self.bitsPerSample) - 1) - 0.5
+        codeRange = 2 ** (float(self.bitsPerSample) - 1) - 0.5
+        codeScale = 2 ** (8 * ((self.bitsPerSample + 7) // 8) - self.bitsPerSample)
+        return FileTrace(channel, self.records(channel).ravel(), codeScale * codeZero,
+                         self.input_range[channel] / codeRange / codeScale, self.input_range[channel], self.sample_rate)
+
+
+class ADCFileWriter():
+    """Reducer (see AlazarTech.BufferReducer) writing every DMA buffer to an ADC file.
+
+    The file is created with its final size when the acquisition starts and
+    each buffer is copied to its place in the file, so the buffers can be
+    written by several workers in any order. result() flushes the file and
+    returns its path."""
+
+    def __init__(self, path, sample_rate):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.data = None
+
+    def start(self, layout):
+        self.layout = layout
+        header = np.zeros(1, dtype=header_dtype)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["channel_mask"] = sum(layout.channels)
+        header["bits_per_sample"] = layout.bitsPerSample
+        header["n_record"] = layout.nRecord
+        header["samples_per_record"] = layout.samplesPerRecord
+        header["records_per_buffer"] = layout.nAvPerBuffer * layout.nRecord
+        header["buffers"] = layout.buffersPerAcquisition
+        header["sample_rate"] = self.sample_rate
+        header["input_range"] = [layout.input_range[1], layout.input_range[2]]
+        with open(self.path, "wb") as f:
+            f.write(header.tobytes().ljust(HEADER_SIZE, b"\0"))
+        self.data = np.memmap(self.path, dtype=np.uint16, mode="r+", offset=HEADER_SIZE,
+                              shape=(layout.buffersPerAcquisition,) + layout.shape)
+
+    def reduce(self, index, data):
+        self.data[index] = data
+
+    def result(self):
+        self.data.flush()
+        self.data = None
+        return self.path
@@ -0,0 +1,304 @@
+"""
+    alazarsim.py
+    ------------
+    Software stand-in for the AlazarTech ATSApi library.
+
+    SimulatedATSApi implements the functions of the ATSApi used by
+    AlazarTech.Digitizer, with the same arguments, so the digitizer (and the
+    DMA pipeline) can run without the board. The board answers with
+    synthetic MPTS signals: the laser pulses seen by the photodiode on
+    channel 1 and the gate of the Pockels cell on channel 2.
+
+    It is selected with Digitizer(backend="simulated"), or with
+    Backend=simulated in the [ADC] section of settings.ini.
+"""
+
+import ctypes
+import logging
+import threading
+import time
+from collections import deque
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+SUCCESS = 512
+API_FAILED = 513
+API_WAIT_TIMEOUT = 579
+API_BUFFER_NOT_READY = 573
+
+# capabilities of AlazarQueryCapability
+GET_SERIAL_NUMBER = 0x10000024
+MEMORY_SIZE = 0x1000002A
+
+ATS9440 = 16
+
+# AlazarSetCaptureClock id -> samples/s, as in AlazarTech.sample_rate
+SAMPLE_RATES = {0x01: 1e3, 0x08: 10e3, 0x0A: 20e3, 0x0C: 50e3, 0x0E: 100e3, 0x10: 200e3, 0x12: 500e3,
+                0x14: 1e6, 0x18: 2e6, 0x1A: 5e6, 0x1C: 10e6, 0x1E: 20e6, 0x22: 50e6, 0x24: 100e6, 0x25: 125e6}
+# AlazarInputControl id -> volts, as in Digitizer.AlazarInputControl
+INPUT_RANGES = {15: 10.0, 14: 8.0, 13: 5.0, 12: 4.0, 11: 2.0, 10: 1.0, 9: 0.8, 8: 0.5, 7: 0.4, 6: 0.2,
+                5: 0.1, 4: 0.08, 3: 0.05, 2: 0.04, 1: 0.02}
+
+
+def _value(arg):
+    """Return the value of an argument passed as a ctypes object or as a Python number."""
+    return arg.value if hasattr(arg, "value") else arg
+
+
+def _address(arg):
+    """Return the address of a buffer passed as a pointer, a c_void_p or an integer."""
+    if isinstance(arg, int):
+        return arg
+    return ctypes.cast(arg, ctypes.c_void_p).value
+
+
+class SimFunction():
+    """Function of the simulated library (accepts argtypes/restype like a ctypes function)."""
+
+    def __init__(self, func):
+        self.func = func
+        self.argtypes = None
+        self.restype = None
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+
+class SimulatedBoard():
+    """State and signals of one simulated board.
+
+    The laser fires pulse_rate pulses per second; the first pulse of a record
+    comes first_pulse seconds after its trigger. The board is triggered
+    trigger_delay seconds after the start of the capture and, with realtime,
+    delivers the DMA buffers no faster than the sample rate allows."""
+
+    def __init__(self, system_id, board_id, bitsPerSample=14, memorySize=128 * 1024 * 1024,
+                 pulse_rate=20e3, pulse_width=20e-9, pulse_amplitude=1.5, first_pulse=1e-6,
+                 gate_width=1e-6, gate_amplitude=3.0, noise=0.01, trigger_delay=0.5, realtime=False, seed=0):
+        self.system_id = system_id
+        self.board_id = board_id
+        self.bitsPerSample = bitsPerSample
+        self.memorySize = memorySize
+        self.pulse_rate = pulse_rate
+        self.pulse_width = pulse_width
+        self.pulse_amplitude = pulse_amplitude
+        self.first_pulse = first_pulse
+        self.gate_width = gate_width
+        self.gate_amplitude = gate_amplitude
+        self.noise = noise
+        self.trigger_delay = trigger_delay
+        self.realtime = realtime
+        self.random = np.random.RandomState(seed)
+
+        self.sample_rate = 20e6
+        self.input_range = {1: 0.4, 2: 0.4}
+        self.preSize = 0
+        self.postSize = 1024
+        self.recordCount = 1
+        self.t_start = None
+        self.posted = deque()
+        self.dma = None
+        self.lock = threading.Lock()
+
+    # signals
+
+    def signal(self, channel, samples):
+        """Return the signal of channel (in volts) for a record of samples samples."""
+        t = (np.arange(samples) - self.preSize) / self.sample_rate
+        period = 1. / self.pulse_rate
+        # phase jitter of the laser between records
+        t0 = self.first_pulse + 0.01 * period * self.random.randn()
+        phase = np.mod(t - t0 + 0.5 * period, period) - 0.5 * period
+        if channel == 1:
+            # photodiode: gaussian laser pulses, with a few % of energy fluctuation
+            sigma = max(self.pulse_width, 1. / self.sample_rate) / 2.355
+            amplitude = self.pulse_amplitude * (1 + 0.03 * self.random.randn())
+            volts = amplitude * np.exp(-0.5 * (phase / sigma) ** 2)
+        else:
+            # Pockels cell gate, opened around every laser pulse
+            volts = np.where(np.abs(phase) < 0.5 * self.gate_width, self.gate_amplitude, 0.)
+        volts = volts + self.noise * self.random.randn(samples)
+        return volts
+
+    def codes(self, channel, samples):
+        """Return the signal of channel as board codes (the sample in the most significant bits)."""
+        codeZero = 2 ** (self.bitsPerSample - 1) - 0.5
+        codeRange = 2 ** (self.bitsPerSample - 1) - 0.5
+        volts = self.signal(channel, samples)
+        codes = np.clip(np.round(codeZero + volts / self.input_range[channel] * codeRange), 0, 2 ** self.bitsPerSample - 1)
+        return (codes.astype(np.uint16) << (16 - self.bitsPerSample))
+
+    # acquisition
+
+    def triggered(self):
+        return self.t_start is not None and time.time() - self.t_start >= self.trigger_delay
+
+    def beforeAsyncRead(self, channels, transferOffset, samplesPerRecord, recordsPerBuffer, recordsPerAcquisition, flags):
+        channels = [ch for ch in (1, 2) if channels & ch]
+        # a few different records, with noise, repeated through the buffers
+        records = np.empty((8, samplesPerRecord, len(channels)), dtype=np.uint16)
+        for i in range(len(records)):
+            for j, ch in enumerate(channels):
+                records[i, :, j] = self.codes(ch, samplesPerRecord)
+        templates = [np.take(records, np.arange(k, k + recordsPerBuffer) % len(records), axis=0).ravel() for k in (0, 3)]
+        with self.lock:
+            self.posted.clear()
+            self.dma = {"channels": channels, "samplesPerRecord": samplesPerRecord, "recordsPerBuffer": recordsPerBuffer,
+                        "buffers": int(np.ceil(recordsPerAcquisition / float(recordsPerBuffer))),
+                        "completed": 0, "templates": templates}
+        return SUCCESS
+
+    def postAsyncBuffer(self, addr, size_bytes):
+        with self.lock:
+            if self.dma is None:
+                return API_FAILED
+            self.posted.append((addr, size_bytes))
+        return SUCCESS
+
+    def waitAsyncBufferComplete(self, addr, timeout_ms):
+        dma = self.dma
+        if dma is None or not self.posted or self.posted[0][0] != addr:
+            return API_BUFFER_NOT_READY
+        deadline = time.time() + timeout_ms / 1000.
+        while not self.triggered():
+            if self.t_start is None or time.time() > deadline:
+                return API_WAIT_TIMEOUT
+            time.sleep(0.001)
+        if dma["completed"] >= dma["buffers"]:
+            return API_WAIT_TIMEOUT
+        if self.realtime:
+            # time at which the board has acquired the buffer
+            duration = dma["recordsPerBuffer"] * dma["samplesPerRecord"] / self.sample_rate
+            ready = self.t_start + self.trigger_delay + (dma["completed"] + 1) * duration
+            if ready > deadline:
+                return API_WAIT_TIMEOUT
+            time.sleep(max(0, ready - time.time()))
+        with self.lock:
+            addr, size_bytes = self.posted.popleft()
+            template = dma["templates"][dma["completed"] % len(dma["templates"])]
+            ctypes.memmove(addr, template.ctypes.data, min(size_bytes, template.nbytes))
+            dma["completed"] += 1
+        return SUCCESS
+
+    def abortAsyncRead(self):
+        with self.lock:
+            self.posted.clear()
+            self.dma = None
+            self.t_start = None
+        return SUCCESS
+
+    def busy(self):
+        if self.t_start is None:
+            return False
+        if not self.triggered():
+            return True
+        if self.dma is not None and self.realtime:
+            return self.dma["completed"] < self.dma["buffers"]
+        return False
+
+    def read(self, channel, buffer, elementSize, record, transferOffset, transferLength):
+        codes = self.codes(channel, transferLength)
+        if elementSize == 1:
+            codes = (codes >> 8).astype(np.uint8)
+        ctypes.memmove(_address(buffer), codes.ctypes.data, codes.nbytes)
+        return SUCCESS
+
+
+class SimulatedATSApi():
+    """Simulated ATSApi library, with a board per (system id, board id).
+
+    The keyword arguments are passed to SimulatedBoard."""
+
+    def __init__(self, systems=1, boards=1, **kwargs):
+        self.boards = {}
+        for system_id in range(1, systems + 1):
+            for board_id in range(1, boards + 1):
+                self.boards[system_id * 100 + board_id] = SimulatedBoard(system_id, board_id, **kwargs)
+
+    def __getattr__(self, name):
+        if not name.startswith("Alazar"):
+            raise AttributeError(name)
+        method = getattr(self, "_" + name, None)
+        if method is None:
+            # configuration functions only need to succeed
+            method = lambda *args: SUCCESS
+        return SimFunction(method)
+
+    def board(self, handle):
+        return self.boards[_value(handle)]
+
+    def _AlazarNumOfSystems(self):
+        return len(set(board.system_id for board in self.boards.values()))
+
+    def _AlazarBoardsInSystemBySystemID(self, system_id):
+        return len([board for board in self.boards.values() if board.system_id == _value(system_id)])
+
+    def _AlazarGetBoardBySystemID(self, system_id, board_id):
+        handle = _value(system_id) * 100 + _value(board_id)
+        return handle if handle in self.boards else 0
+
+    def _AlazarGetBoardKind(self, handle):
+        return ATS9440
+
+    def _AlazarGetChannelInfo(self, handle, memorySize_ptr=None, bitsPerSample_ptr=None):
+        board = self.board(handle)
+        if memorySize_ptr is not None:
+            memorySize_ptr[0] = board.memorySize
+        if bitsPerSample_ptr is not None:
+            bitsPerSample_ptr[0] = board.bitsPerSample
+        return SUCCESS
+
+    def _AlazarQueryCapability(self, handle, capability, reserved, value_ptr):
+        board = self.board(handle)
+        value_ptr[0] = {GET_SERIAL_NUMBER: 900000 + board.board_id, MEMORY_SIZE: board.memorySize}.get(_value(capability), 0)
+        return SUCCESS
+
+    def _AlazarErrorToText(self, status):
+        return b"Simulated error %d" % _value(status)
+
+    def _AlazarSetCaptureClock(self, handle, source, rate, edge, decimation):
+        self.board(handle).sample_rate = SAMPLE_RATES[_value(rate)]
+        return SUCCESS
+
+    def _AlazarInputControl(self, handle, channel, coupling, input_range, impedance):
+        self.board(handle).input_range[_value(channel)] = INPUT_RANGES[_value(input_range)]
+        return SUCCESS
+
+    def _AlazarSetRecordSize(self, handle, preSize, postSize):
+        board = self.board(handle)
+        board.preSize = _value(preSize)
+        board.postSize = _value(postSize)
+        return SUCCESS
+
+    def _AlazarSetRecordCount(self, handle, count):
+        self.board(handle).recordCount = _value(count)
+        return SUCCESS
+
+    def _AlazarStartCapture(self, handle):
+        self.board(handle).t_start = time.time()
+        return SUCCESS
+
+    def _AlazarAbortCapture(self, handle):
+        self.board(handle).t_start = None
+        return SUCCESS
+
+    def _AlazarBusy(self, handle):
+        return int(self.board(handle).busy())
+
+    def _AlazarBeforeAsyncRead(self, handle, channels, transferOffset, samplesPerRecord, recordsPerBuffer, recordsPerAcquisition, flags):
+        return self.board(handle).beforeAsyncRead(_value(channels), _value(transferOffset), _value(samplesPerRecord),
+                                                  _value(recordsPerBuffer), _value(recordsPerAcquisition), _value(flags))
+
+    def _AlazarPostAsyncBuffer(self, handle, buffer, size_bytes):
+        return self.board(handle).postAsyncBuffer(_address(buffer), _value(size_bytes))
+
+    def _AlazarWaitAsyncBufferComplete(self, handle, buffer, timeout_ms):
+        return self.board(handle).waitAsyncBufferComplete(_address(buffer), _value(timeout_ms))
+
+    def _AlazarAbortAsyncRead(self, handle):
+        return self.board(handle).abortAsyncRead()
+
+    def _AlazarRead(self, handle, channel, buffer, elementSize, record, transferOffset, transferLength):
+        return self.board(handle).read(_value(channel), buffer, _value(elementSize), _value(record),
+                                       _value(transferOffset), _value(transferLength))
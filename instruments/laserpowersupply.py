@@ -3,7 +3,9 @@
 """Implementation of the Laser Power Supply control."""
 
 import serial
+import threading
 import time
+from instruments import shadow
 
 
 class LaserPowerSupply():
@@ -36,6 +38,8 @@ class LaserPowerSupply():
 
         self.connection_status = False
         self.debug = debug
+        self.lock = threading.RLock()  # serializes the command/answer exchanges
+        self.shadow = shadow.ShadowSettings()  # settings last sent to the power supply
         self.ser = serial.Serial()
         self.ser.baudrate = baudrate
         self.ser.timeout = timeout
@@ -47,6 +51,7 @@ class LaserPowerSupply():
         self.ser.baudrate = baudrate
         self.ser.timeout = timeout
         self.ser.write_timeout = 1
+        self.shadow.invalidate()
         try:
             self.ser.open()
             self.ser.reset_output_buffer()
@@ -64,10 +69,11 @@ class LaserPowerSupply():
             return False
         try:
             # Makes a simple request and wait for the answer to check if the connection is working
-            self.ser.reset_output_buffer()
-            self.ser.reset_input_buffer()
-            self.ser.write(b"$VER\r")
-            recv = self.ser.readline()
+            with self.lock:
+                self.ser.reset_output_buffer()
+                self.ser.reset_input_buffer()
+                self.ser.write(b"$VER\r")
+                recv = self.ser.readline()
             if len(recv) > 0:
                 self.connection_status = True
                 return True
@@ -82,6 +88,40 @@ class LaserPowerSupply():
         if self.ser.isOpen():
             self.ser.close()
         self.connection_status = False
+        self.shadow.invalidate()
+
+    def applySettings(self, settings, force=False):
+        """Apply the settings {name: value} that changed since they were last
+        sent, name being that of a setter without "set" (e.g. "MainVoltage").
+        All of them are applied when forced, after reconnecting or after
+        shadow.resync_interval seconds; the values kept by the setters are
+        reset first, so every command is written again."""
+        send, full = self.shadow.changes(settings, force)
+        if full:
+            self.forgetSettings()
+        for name in send:
+            getattr(self, "set" + name)(send[name])
+        if self.connection_status:
+            self.shadow.confirm(send, full)
+
+    def forgetSettings(self):
+        """Reset the values of the parameters kept by the setters (they only
+        write the parameters that changed)."""
+        self.resBankMain = -1
+        self.resBankAux = -1
+        self.resBurstNumber = -1
+        self.resBurstDuration = -1
+        self.MainVoltage = -1
+        self.Aux1Voltage = -1
+        self.Aux2Voltage = -1
+        self.Aux3Voltage = -1
+        self.ComAuxVoltage = -1
+        self.BurstNumber = -1
+        self.AccurChargeV = -1
+        self.ModeBanks = -1
+        self.SimmerDelay = -1
+        self.BurstSeperation = -1
+        self.BurstDuration = -1
 
     def configure_serial(self, port, baudrate, timeout):
         self.ser.port = port or self.port
@@ -95,10 +135,11 @@ class LaserPowerSupply():
         if self.connection_status:
             if self.debug:
                 print("laser PS: >>%s" % command)
-            self.ser.write(bytearray(command + "\r", "latin-1"))
-            self.ser.flush()  # it is buffering. required to get the data out *now*
-            time.sleep(0.07)
-            return self._read()
+            with self.lock:
+                self.ser.write(bytearray(command + "\r", "latin-1"))
+                self.ser.flush()  # it is buffering. required to get the data out *now*
+                time.sleep(0.07)
+                return self._read()
 
     def _read(self):
         """ Reads a response from the instrument.
@@ -115,12 +156,13 @@ class LaserPowerSupply():
 
     def _query(self, command):
         """ Writes a command to the instrument and reads the response."""
-        ans = self._write(command)
-        if self.ser.in_waiting > 0:
-            if self.debug:
-                print("laser PS (ignored): <<%s" % self.ser.read(self.ser.in_waiting))
-            else:
-                self.ser.read(self.ser.in_waiting)
+        with self.lock:
+            ans = self._write(command)
+            if self.ser.in_waiting > 0:
+                if self.debug:
+                    print("laser PS (ignored): <<%s" % self.ser.read(self.ser.in_waiting))
+                else:
+                    self.ser.read(self.ser.in_waiting)
         return ans
 
     # 1. Set restrictions parameter
@@ -3,6 +3,7 @@
 """Implementation of the Laser Power Measurement Device."""
 
 import serial
+import threading
 import time
 import sys
 
@@ -16,6 +17,7 @@ class LaserStar():
         self.ser = serial.Serial()
         self.connection_status = False
         self.debug = debug
+        self.lock = threading.RLock()  # serializes the command/answer exchanges
         if port:
             self.openConnection(port, baudrate, timeout)
 
@@ -41,11 +43,12 @@ class LaserStar():
             return False
         try:
             # Makes a simple request and wait for the answer to check if the connection is working
-            self.ser.reset_output_buffer()
-            self.ser.reset_input_buffer()
-            self.ser.write(b"$II\r")
-            time.sleep(0.1)
-            recv = self.ser.readline().strip()
+            with self.lock:
+                self.ser.reset_output_buffer()
+                self.ser.reset_input_buffer()
+                self.ser.write(b"$II\r")
+                time.sleep(0.1)
+                recv = self.ser.readline().strip()
             if len(recv) > 0:
                 self.connection_status = True
                 return True
@@ -66,8 +69,9 @@ class LaserStar():
             return ans
 
     def query(self, command):
-        self.write(command)
-        return self.read()
+        with self.lock:
+            self.write(command)
+            return self.read()
 
     def getName(self):
         self.name = self.query("$II")[1:]
@@ -79,9 +83,10 @@ class LaserStar():
 
     def getData(self):
         try:
-            self.ser.write(b"$SB\r")
-            time.sleep(0.1)
-            str = self.ser.readline().decode("latin-1").strip()
+            with self.lock:
+                self.ser.write(b"$SB\r")
+                time.sleep(0.1)
+                str = self.ser.readline().decode("latin-1").strip()
             if self.debug:
                 print(str)
         except Exception:
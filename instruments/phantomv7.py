@@ -4,6 +4,7 @@ import logging
 import re
 import select
 import socket
+import threading
 import time
 import numpy as np
 
@@ -74,6 +75,7 @@ class PhantomCamera(object):
         self.num_frames = 1
         self.connection_status = False
         self.debug = debug
+        self.lock = threading.RLock()  # serializes the command/answer exchanges
 
         self._command_sent = False
         self._triggered = False
@@ -133,8 +135,7 @@ class PhantomCamera(object):
         """Checks if the camera is currently connedted by making a simple request
         and waiting for the answer."""
         try:
-            self._cmd_sock.send(b'get info.serial\n')
-            recv = self._cmd_sock.recv(self.MAX_MESSAGE_SIZE).decode('latin-1')
+            recv = self._SendCommand("get info.serial")
             if len(recv) > 0:
                 self.connection_status = True
                 return True
@@ -199,8 +200,9 @@ class PhantomCamera(object):
 
     def _SendCommand(self, cmd):
         """Send a command to the camera, and return the response."""
-        self._SendCommandAsync(cmd)
-        return self._ReceiveCommandResponse()
+        with self.lock:
+            self._SendCommandAsync(cmd)
+            return self._ReceiveCommandResponse()
 
     def Prepare(self, num_frames=None, fps=None, exposure=None):
         self.fps = fps or self.default_fps
@@ -255,38 +257,90 @@ class PhantomCamera(object):
         images of this request.
         """
         # Send the request to the camera for the frame in question
-        num_frames = num_frames or self.getNFramesAvailable()
+        if num_frames is None:
+            num_frames = self.getNFramesAvailable()
         # Request 16 bits images from <num_frames> frames starting from frame <start_frame>
         cmd = "img {cine:%d, start:%d, cnt:%d, fmt:16}" % (self.cine, start_frame, num_frames)
         self._SendCommandAsync(cmd)
         return _ImageRequest(self, start_frame, num_frames)
 
+    def iterImages(self, start_frame=0, num_frames=None, chunk_size=20, funcProgress=None, funcStop=None):
+        """Download images in chunks, yielding (first_frame, images) for each chunk.
+
+        The request for the next chunk is sent as soon as the current one is
+        acknowledged, so the camera keeps streaming while the current chunk is
+        received. funcProgress(fraction) is called after each chunk and the
+        download is cancelled when funcStop() returns True.
+
+        The lock is taken for each chunk and released before it is yielded.
+        The next request is then already acknowledged, so other commands can
+        be sent between chunks; only its data is still pending on the data
+        connection.
+        """
+        if num_frames is None:
+            num_frames = self.getNFramesAvailable()
+        chunks = [(start, min(chunk_size, start_frame + num_frames - start))
+                  for start in range(start_frame, start_frame + num_frames, chunk_size)]
+        if not chunks:
+            return
+
+        pending = None
+        received = 0
+        try:
+            with self.lock:
+                pending = self.requestImages(*chunks[0])
+                pending.ReceiveAck()
+            for i in range(len(chunks)):
+                with self.lock:
+                    request = pending
+                    pending = None
+                    if i + 1 < len(chunks):
+                        # Keep the next request in flight while this chunk is received
+                        pending = self.requestImages(*chunks[i + 1])
+                    images = request.Receive()
+                    if pending is not None:
+                        pending.ReceiveAck()
+                received += request.num_frames
+                if funcProgress is not None:
+                    funcProgress(float(received) / num_frames)
+                yield request.start, images
+                if funcStop is not None and funcStop():
+                    break
+            self._DrainRequest(pending)
+        except GeneratorExit:
+            self._DrainRequest(pending)
+            raise
+
+    def _DrainRequest(self, request):
+        """Receive and discard the data of a request that is no longer needed,
+        keeping the command and data connections in sync."""
+        if request is not None:
+            with self.lock:
+                request.Receive()
+
     def _ReceiveImages(self, shape, num_frames):
-        """Receive previously requested images."""
-        bytesperpixel = 2
-        frame_size = shape[0] * shape[1]
-        total_size = (frame_size * num_frames) * bytesperpixel
+        """Receive previously requested images.
+
+        The data is read straight from the data socket into a preallocated
+        uint16 array, which is returned with shape (num_frames, height, width).
+        """
+        images = np.empty((num_frames, shape[0], shape[1]), dtype=np.uint16)
+        view = memoryview(images).cast("B")
+        total_size = view.nbytes
 
         # Wait for image data to come in
-        img_data = b""
-        while (len(img_data) < total_size):
-            remaining_data = total_size - len(img_data)
+        received = 0
+        while received < total_size:
             ready = select.select([self._data_sock], [], [], 5)
             if ready[0]:
-                request_size = min([remaining_data, self.MAX_MESSAGE_SIZE])
-                img_data += self._data_sock.recv(request_size)
+                request_size = min(total_size - received, self.MAX_MESSAGE_SIZE)
+                nbytes = self._data_sock.recv_into(view[received:], request_size)
+                if nbytes == 0:
+                    raise Exception("Data connection closed by the camera")
+                received += nbytes
             else:
                 raise Exception("No data received")
-        _log.debug("RECV_IMG(%d)", len(img_data))
-        # print("camera (image length): <<%s" % len(img_data))
-        # images = np.frombuffer(img_data, dtype=np.uint16).reshape((num_frames, shape[0], shape[1]))
-        # return images
-        images = np.zeros((num_frames, shape[0], shape[1]))
-        for i in range(num_frames):
-            img_start = i * frame_size * bytesperpixel
-            img_end = (i + 1) * frame_size * bytesperpixel
-            img_string = img_data[img_start:img_end]
-            images[i, :, :] = np.fromstring(img_string, dtype=np.uint16).reshape(shape)
+        _log.debug("RECV_IMG(%d)", received)
         return images
 
     def _SetProperty(self, name, value):
@@ -0,0 +1,50 @@
+"""
+    shadow.py
+    ---------
+    Shadow copy of the settings of an instrument, so only the settings that
+    changed are sent again.
+"""
+
+import time
+
+
+class ShadowSettings():
+    """Settings last confirmed by a device, as a dictionary {name: value}.
+
+    changes() returns the settings that differ from the copy. All of them are
+    returned (a full resync) when the copy is not trusted: after invalidate()
+    (called when the connection is opened again, as the device may have been
+    restarted or changed by hand), once resync_interval seconds have passed
+    since the last full resync, or when forced."""
+
+    def __init__(self, resync_interval=600.):
+        self.resync_interval = resync_interval
+        self.values = {}
+        self.synced = None
+
+    def invalidate(self):
+        """Forget the state of the device, so all settings are sent next time."""
+        self.values = {}
+        self.synced = None
+
+    def needsResync(self):
+        return self.synced is None or time.time() - self.synced > self.resync_interval
+
+    def changes(self, settings, force=False):
+        """Return the settings to send and whether it is a full resync."""
+        if force or self.needsResync():
+            return dict(settings), True
+        return dict((name, value) for name, value in settings.items()
+                    if name not in self.values or self.values[name] != value), False
+
+    def confirm(self, settings, full=False):
+        """Record settings confirmed by the device. full is True when all of the
+        settings were sent and confirmed."""
+        self.values.update(settings)
+        if full:
+            self.synced = time.time()
+
+    def discard(self, names):
+        """Forget settings whose state on the device is unknown (e.g. not acknowledged)."""
+        for name in names:
+            self.values.pop(name, None)
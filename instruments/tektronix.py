@@ -1,27 +1,215 @@
 import sys
+import re
 import serial
+import socket
+import threading
 import time
 import numpy as np
 import copy
 
 
 try:
+    import queue
+    from http.client import HTTPConnection, HTTPException
     from urllib.parse import quote
-    from urllib.request import urlopen
 except ImportError:
 #    from urlparse import quote
+    import Queue as queue
+    from httplib import HTTPConnection, HTTPException
     from urllib import quote
-    from urllib2 import urlopen
 
 
 # https://github.com/markjones112358/pyInstruments
 
+# fields of the answer to WFMPre?, in order
+preamble_fields = ["BYT_NR", "BIT_NR", "ENCDG", "BN_FMT", "BYT_OR", "NR_PT", "WFID", "PT_FMT",
+                   "XINCR", "PT_OFF", "XZERO", "XUNIT", "YMULT", "YZERO", "YOFF", "YUNIT"]
+
+
+def split_answer(text):
+    """ Split an answer in its fields, separated by ";" outside of quoted strings."""
+    fields = []
+    field = ""
+    quoted = False
+    for c in text:
+        if c == '"':
+            quoted = not quoted
+        if c == ";" and not quoted:
+            fields.append(field)
+            field = ""
+        else:
+            field += c
+    fields.append(field)
+    return fields
+
+
+class Preamble:
+    """ Waveform preamble of a channel, parsed from the answer to WFMPre?.
+    The answer can be given with or without headers; the fields of the
+    waveform are None when the channel has no waveform."""
+
+    def __init__(self, text):
+        values = {}
+        for i, field in enumerate(split_answer(text.strip())):
+            field = field.strip()
+            match = re.match(r'^:?(?:WFMP[A-Z]*:)?([A-Z_]+) (.*)$', field, re.IGNORECASE)
+            if match and match.group(1).upper() in preamble_fields:
+                values[match.group(1).upper()] = match.group(2)
+            elif i < len(preamble_fields):
+                values[preamble_fields[i]] = field
+        self.values = values
+        self.byt_nr = self._int("BYT_NR", 1)
+        self.bit_nr = self._int("BIT_NR", 8)
+        self.encoding = values.get("ENCDG", "BIN").upper()
+        self.bn_fmt = values.get("BN_FMT", "RP").upper()
+        self.byt_or = values.get("BYT_OR", "MSB").upper()
+        self.nr_pt = self._int("NR_PT", None)
+        self.wfid = values.get("WFID", "").strip('"')
+        self.x_incr = self._float("XINCR")
+        self.pt_off = self._int("PT_OFF", 0)
+        self.x_zero = self._float("XZERO") or 0
+        self.y_mult = self._float("YMULT")
+        self.y_zero = self._float("YZERO")
+        self.y_offset = self._float("YOFF")
+        # V/div, from the description of the waveform
+        match = re.search(r'([-+0-9.Ee]+) ?[mu]?V/div', self.wfid)
+        self.volts_per_div = float(match.group(1)) if match else None
+        if match and "mV/div" in match.group(0):
+            self.volts_per_div *= 1e-3
+
+    def _int(self, key, default):
+        try:
+            return int(float(self.values[key]))
+        except (KeyError, ValueError):
+            return default
+
+    def _float(self, key):
+        try:
+            return float(self.values[key])
+        except (KeyError, ValueError):
+            return None
+
+    def has_waveform(self):
+        return self.y_mult is not None and self.x_incr is not None
+
+    def dtype(self):
+        """ numpy type of the binary data points."""
+        kind = "i" if self.bn_fmt == "RI" else "u"
+        order = ">" if self.byt_or == "MSB" else "<"
+        return np.dtype("%s%s%d" % (order if self.byt_nr > 1 else "", kind, self.byt_nr))
+
+
+def parse_block(data):
+    """ Return the payload of an IEEE 488.2 definite length block (#<n><length><payload>)
+    and what follows it."""
+    start = data.index(b"#")
+    n = int(data[start + 1:start + 2])
+    length = int(data[start + 2:start + 2 + n])
+    begin = start + 2 + n
+    return data[begin:begin + length], data[begin + length:]
+
+
+class BlockReader:
+    """ Buffered reader of the response messages of an IEEE 488.2 instrument
+    on a serial port.
+
+    The port is read with readinto, straight into a preallocated bytearray
+    (grown if a message does not fit). A message ends with a new line, except
+    inside quoted strings and definite length blocks (#<n><length><data>),
+    whose length is read from their header, so the data of a block is
+    requested from the port in one call and never scanned for the terminator.
+    """
+
+    # characters that change the state of the scan of a message
+    special = re.compile(b'["#\n]')
+
+    def __init__(self, port, size=65536, timeout=10):
+        self.port = port
+        self.buffer = bytearray(size)
+        self.start = 0
+        self.end = 0
+        self.timeout = timeout
+
+    def clear(self):
+        """ Discards the buffered data."""
+        self.start = self.end = 0
+
+    def _fill(self, count):
+        """ Reads from the port until count bytes are buffered. An exception is
+        raised if nothing arrives within timeout seconds."""
+        last = time.time()
+        while self.end - self.start < count:
+            if self.start + count > len(self.buffer):
+                # move the unread data to the beginning of the buffer, growing it if needed
+                unread = self.end - self.start
+                buffer = self.buffer if count <= len(self.buffer) else bytearray(max(count, 2 * len(self.buffer)))
+                buffer[:unread] = self.buffer[self.start:self.end]
+                self.buffer, self.start, self.end = buffer, 0, unread
+            # what is missing (up to the end of the buffer), or more if the port has it already
+            size = max(count - (self.end - self.start), self.port.in_waiting)
+            size = min(size, len(self.buffer) - self.end)
+            with memoryview(self.buffer) as view:
+                n = self.port.readinto(view[self.end:self.end + size])
+            if n:
+                self.end += n
+                last = time.time()
+            elif time.time() - last > self.timeout:
+                raise Exception("No answer from %s in %g s" % (self.port.port, self.timeout))
+
+    def read(self):
+        """ Returns the next response message, without its terminator."""
+        i = 0
+        quoted = False
+        while True:
+            if self.start + i >= self.end:
+                self._fill(i + 1)
+            match = self.special.search(self.buffer, self.start + i, self.end)
+            if match is None:
+                i = self.end - self.start
+                continue
+            i = match.start() - self.start
+            c = self.buffer[match.start()]
+            if c == 0x22:
+                quoted = not quoted
+            elif quoted:
+                pass
+            elif c == 0x0A:
+                message = bytes(self.buffer[self.start:self.start + i])
+                self.start += i + 1
+                return message
+            else:
+                # definite length block: skip the header and the data
+                self._fill(i + 2)
+                n = self.buffer[self.start + i + 1] - 0x30
+                if 1 <= n <= 9:
+                    self._fill(i + 2 + n)
+                    length = int(self.buffer[self.start + i + 2:self.start + i + 2 + n])
+                    i += 2 + n + length
+                    self._fill(i)
+                    continue
+            i += 1
+
+
 class eScope:
-    """ The base class for a eScope instruments."""
+    """ The base class for a eScope instruments.
+
+    The commands are sent through a small pool of persistent HTTP/1.1
+    connections, so a command costs no TCP connection setup (the connection
+    is opened again if the scope closes it). Each request holds a connection
+    of the pool until its answer is read, so the instrument can be used from
+    several threads at once, e.g. the trigger watcher and the download of a
+    shot."""
 
-    def __init__(self, ip=None, debug=False):
+    def __init__(self, ip=None, debug=False, pool_size=2, timeout=2):
         self.id = None
+        self.ip = None
         self.debug = debug
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.pool = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.local = threading.local()
         try:
             error = self.openConnection(ip)
             if error:
@@ -34,8 +222,9 @@ class eScope:
         if not self.ip:
             print("Error trying to connect to Tektronix eScope (no IP provide).")
             return True
+        self.close()
         try:
-            idn = urlopen("http://%s/Comm.html?COMMAND=%s" % (self.ip, quote("*IDN?")), timeout=0.5).readline().decode("ascii")
+            idn = self.query("*IDN?", timeout=0.5)
             if idn:
                 self.id = idn.split(",")[1]
                 return False
@@ -45,9 +234,63 @@ class eScope:
             print("Error trying to connect to Tektronix eScope.")
             return True
 
+    def close(self):
+        """ Close all connections of the pool."""
+        with self.lock:
+            while True:
+                try:
+                    self.pool.get_nowait().close()
+                except queue.Empty:
+                    break
+            self.connections = 0
+
+    def _get_connection(self):
+        with self.lock:
+            try:
+                return self.pool.get_nowait()
+            except queue.Empty:
+                if self.connections < self.pool_size:
+                    self.connections += 1
+                    return HTTPConnection(self.ip, timeout=self.timeout)
+        return self.pool.get()
+
+    def _put_connection(self, conn):
+        self.pool.put(conn)
+
+    def request(self, command, timeout=None):
+        """ Sends a command and returns the whole (binary) answer.
+        The request is sent again once, on a new connection, if the
+        connection was closed by the scope."""
+        timeout = self.timeout if timeout is None else timeout
+        conn = self._get_connection()
+        try:
+            for attempt in range(2):
+                try:
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    conn.request("GET", "/Comm.html?COMMAND=%s" % quote(command))
+                    response = conn.getresponse()
+                    ans = response.read()
+                    break
+                except socket.timeout:
+                    # the answer of the scope may still come, do not reuse the connection
+                    conn.close()
+                    raise
+                except (HTTPException, socket.error):
+                    conn.close()
+                    if attempt:
+                        raise
+        finally:
+            self._put_connection(conn)
+        if self.debug:
+            print("scope: >> %s" % command)
+            print("scope: <<%s" % ans)
+        return ans
+
     def isConnected(self):
         try:
-            state = urlopen("http://%s/Comm.html?COMMAND=ACQ:STATE?" % self.ip, timeout=0.5).readline().decode("ascii")
+            state = self.query("ACQ:STATE?", timeout=0.5)
             if int(state) + 1:
                 return True
             else:
@@ -56,27 +299,31 @@ class eScope:
             return False
 
     def write(self, command):
-        """ Writes a command to the instrument."""
-        self.request = urlopen("http://%s/Comm.html?COMMAND=%s" % (self.ip, quote(command)), timeout=2)
-        if self.debug:
-            print("scope: >> %s" % command)
+        """ Writes a command to the instrument.
+        The answer is kept, for the calling thread, until the next read()."""
+        self.local.answer = self.request(command)
 
     def read(self, raw=False):
         """ Reads a response from the instrument.
-        This function will block until the instrument responds."""
-        ans = self.request.readline()
-        if self.debug:
-            print("scope: <<%s" % ans)
+        This function will block until the instrument responds.
+        Raw responses are read up to the end, as binary data may contain new lines."""
+        ans = self.local.answer
         if not raw:
-            return ans.decode("ascii")
+            end = ans.find(b"\n")
+            return (ans if end < 0 else ans[:end + 1]).decode("ascii")
         else:
             return ans
 
-    def query(self, command):
+    def query(self, command, timeout=None):
         """ Writes a command to the instrument and reads the response.
         """
-        self.write(command)
-        return self.read()
+        ans = self.request(command, timeout)
+        end = ans.find(b"\n")
+        return (ans if end < 0 else ans[:end + 1]).decode("ascii")
+
+    def query_raw(self, command, timeout=None):
+        """ Writes a command to the instrument and returns the raw (binary) response."""
+        return self.request(command, timeout)
 
     def getName(self):
         """ Returns the instruments identifier string.
@@ -101,6 +348,7 @@ class serialInstrument:
         self.debug = debug
         self.inst = serial.Serial()
         self.inst.port = port
+        self.reader = BlockReader(self.inst)
 
     def openConnection(self, port=None, baudrate=19200, timeout=0.01):
         self.inst.port = port
@@ -111,7 +359,8 @@ class serialInstrument:
             self.inst.open()
             self.inst.reset_input_buffer()
             self.inst.reset_output_buffer()
-            self.id = self.inst.getName()
+            self.reader.clear()
+            self.id = self.getName()
             print("Connected to connect to Tektronix Scope (Serial port %s, baudrate %s)." % (self.inst.port, self.inst.baudrate))
             return 0
         except:
@@ -126,19 +375,23 @@ class serialInstrument:
 
     def read(self, raw=False):
         """ Reads a response from the instrument.
-        This function will block until the instrument responds."""
-        out = ""
-        tmp = self.inst.read(raw=raw)
-        return tmp
+        This function will block until the instrument responds.
+        Raw responses are returned as bytes, with their binary blocks as they are."""
+        ans = self.reader.read()
+        if self.debug:
+            print("%d bytes read" % len(ans))
+        return ans if raw else ans.decode("ascii")
 
     def query(self, command):
         """ Writes a command to the instrument and reads the response.
         """
-        self.write(command + "\n")
-        tmp = self.read()
-        while tmp is False:
-            tmp = self.read()
-        return tmp
+        self.write(command)
+        return self.read()
+
+    def query_raw(self, command):
+        """ Writes a command to the instrument and returns the raw (binary) response."""
+        self.write(command)
+        return self.read(raw=True)
 
     def getName(self):
         """ Returns the instruments identifier string.
@@ -162,6 +415,8 @@ class Scope:
     x_incr = False
     x_num = False
     numAvg = 0
+    # bytes per data point in the transfers (2 keeps the extra resolution of averaged acquisitions)
+    data_width = 2
     selectedChannel = 1
     debug = False
 
@@ -204,6 +459,12 @@ class Scope:
         self.connection_status = False
         self.inst = inst
         self.name = ""
+        # preamble of each channel, until the settings are changed (by a command
+        # or, at the latest, until the next get_channels_waveforms)
+        self.preambles = {}
+
+    def invalidate_preambles(self):
+        self.preambles = {}
 
     def openConnection(self, port=None, ip=None):
         if ip:
@@ -236,6 +497,7 @@ class Scope:
 
     def write(self, command):
         # Send an arbitrary command directly to the scope
+        self.invalidate_preambles()
         self.inst.write(command)
 
     def read(self, raw=False):
@@ -245,6 +507,10 @@ class Scope:
     def query(self, command):
         return self.inst.query(command)
 
+    def query_raw(self, command):
+        """ Writes a command to the scope and returns the raw (binary) response."""
+        return self.inst.query_raw(command)
+
     def getName(self):
         """ Returns the instruments identifier string.
         This is a fairly universal command so should work on most devices.
@@ -256,6 +522,8 @@ class Scope:
         self.inst.sendReset()
 
     def issueCommand(self, command, feedback=""):
+        if not command.upper().startswith(("DATA", "DAT:")):
+            self.invalidate_preambles()
         self.inst.write(command)
 
     def set_tScale(self, s):
@@ -437,14 +705,26 @@ class Scope:
     def get_trigger_position(self, position):
         return self.query("HORizontal:TRIGger:POSition?")
 
+    def _cached_preamble(self):
+        for preamble in self.preambles.values():
+            if preamble.has_waveform():
+                return preamble
+        return None
+
     def get_record_length(self):
         if self.connection_status:
+            preamble = self._cached_preamble()
+            if preamble is not None and preamble.nr_pt:
+                return preamble.nr_pt
             return int(self.query("HORizontal:RECORDLength?"))
         else:
             return 0
 
     def get_record_sample_rate(self):
         if self.connection_status:
+            preamble = self._cached_preamble()
+            if preamble is not None:
+                return 1. / preamble.x_incr
             return 1. / float(self.query("WFMP:XIN?"))
         else:
             return 0
@@ -454,96 +734,75 @@ class Scope:
         [x, y] = Channel.get_waveform()
         return Channel
 
+    def get_channels_waveforms(self, channels):
+        """ Downloads the waveforms of several channels (numbers) with a single
+        command sequence and returns a channel object for each of them, with
+        its data and calibration. The preambles are requested again, as the
+        settings may have been changed on the front panel since the last
+        download, and the record length and sample rate are then taken from
+        them."""
+        self.invalidate_preambles()
+        channels = [channel(self, ch) for ch in channels]
+        self.fetch_waveforms(channels)
+        return channels
+
+    def fetch_waveforms(self, channels):
+        """ Downloads the waveforms of channels (channel objects) in one request:
+        the data source is switched from channel to channel, with the preamble
+        (unless cached) and the curve of each one. The data is transferred with
+        data_width bytes per point."""
+        command = "DATA:ENCdg RPBinary;:DATA:WIDth %d" % self.data_width
+        for Channel in channels:
+            command += ";:DATA:SOUrce CH%d" % Channel.channel
+            preamble = self.preambles.get(Channel.channel)
+            if preamble is None or preamble.byt_nr != self.data_width:
+                self.preambles.pop(Channel.channel, None)
+                command += ";:WFMPre?"
+            command += ";:CURVE?"
+        ans = self.query_raw(command)
+
+        for Channel in channels:
+            preamble = self.preambles.get(Channel.channel)
+            if preamble is None:
+                text = ans[:ans.index(b"#")].decode("ascii")
+                # remove the separators and the header of the curve, if headers are enabled
+                text = re.sub(r";?:?CURV[A-Z]*\s*$", "", text.strip(), flags=re.IGNORECASE).lstrip(";")
+                preamble = Preamble(text)
+                if not preamble.has_waveform():
+                    raise Exception("No waveform available for CH%d" % Channel.channel)
+                if preamble.volts_per_div is None:
+                    preamble.volts_per_div = Channel.get_yScale()
+                self.preambles[Channel.channel] = preamble
+            payload, ans = parse_block(ans)
+            Channel.set_waveform(preamble, payload)
+
 
 def get_channels_autoRange(channels, wait=True, averages=False, max_adjustments=5):
     """ Helper function to control the adjustment of multiple channels between
     captures.
-    This reduces the amount of time spend adjusting the V/div when multiple
-    channels are used as only one re-acquisition is required between adjustments.
+    All channels are downloaded together and every channel that clips or
+    does not fill its range is adjusted in the same pass, so only one
+    re-acquisition is required between adjustments.
     """
-    channels_data = [False for x in range(len(channels))]
-    channels_rescale = [False for x in range(len(channels))]
-    reset = False
-    to_wait = wait
-    for channel_number, channel in enumerate(channels):
-        xs, ys = channel.get_waveform(False, wait=to_wait)
-        to_wait = False
-        if channel.did_clip():
-            # Increase V/div until no clipped data
-            set_vdiv = channel.get_yScale()
-
-            if channel.available_vdivs.index(set_vdiv) > 0:
-                temp_index = channel.available_vdivs.index(set_vdiv) - 1
-                temp1 = channel.available_vdivs[temp_index]
-                temp2 = 'Decreasing channel ' + str(channel_number) + ' to '
-                temp2 += str(temp1)
-                temp2 += ' V/div'
-                print(temp2)
-                channels_rescale[channel_number] = temp1
-                reset = True
-            else:
-                print()
-                print('===================================================')
-                print('WARN: Scope Y-scale maxed out! THIS IS BAD!!!!!!!!!')
-                print('===================================================')
-                print('Aborting!')
-                sys.exit()
-        else:
-            tmp_max = 0
-            tmp_min = 0
-            for y in ys:
-                if y > tmp_max:
-                    tmp_max = y
-                elif y < tmp_min:
-                    tmp_min = y
-            datarange = tmp_max - tmp_min
-
-            set_range = channel.get_yScale()
-            set_window = set_range * 8.0
-
-            # find the best (minimum no-clip) range
-            best_window = 0
-            tmp_range = copy.copy(channel.available_vdivs)
-            available_windows = map(lambda x: x * 8.0, tmp_range)
-
-            for available_window in available_windows:
-                if datarange <= (available_window * 0.95):
-                    best_window = available_window
-
-            # if it's not the range were already using, set it
-            if best_window < set_window:
-                temp = 'Increasing channel ' + str(channel_number)
-                temp += ' to ' + str(best_window / 8.0) + ' V/div'
-                print(temp)
-                channels_rescale[channel_number] = best_window / 8.0
-                reset = True
-
-        channels_data[channel_number] = (xs, ys)
-
-    if max_adjustments > 0 and reset:
-        max_adjustments -= 1
-        temp = 'A channels range has been altered, data will need to be'
-        temp += ' re-acquired'
-        print(temp)
-        temp = 'The maximum remaining adjustments to the channels is '
-        temp += str(max_adjustments)
-        print(temp)
-        enumerated_data = enumerate(zip(channels_rescale, channels))
-        for channel_number, (channel_scale, channel) in enumerated_data:
-            if channel_scale is False:
-                temp = 'Adjusting channel ' + str(channel_number) + ' to '
-                temp += str(channel_scale) + ' V/div'
-                print(temp)
-                channel.set_vScale(channel_scale)
-        channels[0].set_averaging(False)
+    scope = channels[0].inst
+    for adjustment in range(max_adjustments + 1):
+        if wait:
+            scope.waitForAcquisitions()
+        scope.fetch_waveforms(channels)
+        rescale = [(Channel, Channel.best_vScale()) for Channel in channels]
+        rescale = [(Channel, vdiv) for Channel, vdiv in rescale if vdiv is not None]
+        if not rescale or adjustment == max_adjustments:
+            break
+        for Channel, vdiv in rescale:
+            print("Adjusting channel %d to %s V/div" % (Channel.channel, vdiv))
+            Channel.set_vScale(vdiv)
+        print("The range of %d channels has been altered, data will be re-acquired" % len(rescale))
+        # restart the averaging with the new settings
+        scope.set_averaging(False)
         time.sleep(1)
-        channels[0].set_averaging(averages)
-        return get_channels_autoRange(channels,
-                                      wait,
-                                      averages,
-                                      max_adjustments=max_adjustments)
-    else:
-        return channels_data
+        scope.set_averaging(averages)
+        wait = True
+    return [(Channel.data_x, Channel.data_y) for Channel in channels]
 
 
 class channel(Scope):
@@ -593,16 +852,31 @@ class channel(Scope):
         """ Checks to see if the last acquisition contained clipped data points.
         This would indicate that the V/div is set too high.
         """
-        count = 0
-        for point in self.signal_raw:
-            if point > 250 or point < 5:
-                count += 1
-            else:
-                count = 0
-
-            if count > 1:
-                return True
-        return False
+        # codes within 2% of the limits of the transfer, on two consecutive points
+        full_scale = 2 ** (8 * self.signal_raw.itemsize)
+        if self.signal_raw.dtype.kind == "i":
+            codes = self.signal_raw.astype(int) + full_scale // 2
+        else:
+            codes = self.signal_raw
+        out = (codes > 250. / 256 * full_scale) | (codes < 5. / 256 * full_scale)
+        return bool(np.any(out[1:] & out[:-1]))
+
+    def best_vScale(self):
+        """ Returns the V/div that fits the last waveform best, or None if the
+        current setting is right: the next larger V/div if the data clipped,
+        else the smallest V/div whose 8 divisions hold the data."""
+        set_vdiv = self.input_range
+        if self.did_clip():
+            if set_vdiv in self.available_vdivs and self.available_vdivs.index(set_vdiv) > 0:
+                return self.available_vdivs[self.available_vdivs.index(set_vdiv) - 1]
+            print("WARN: Scope Y-scale of CH%d maxed out!" % self.channel)
+            return None
+        datarange = float(np.max(self.data_y) - np.min(self.data_y))
+        best_vdiv = self.available_vdivs[0]
+        for vdiv in self.available_vdivs:
+            if datarange <= vdiv * 8.0 * 0.95:
+                best_vdiv = vdiv
+        return best_vdiv if best_vdiv < set_vdiv else None
 
     def get_yScale(self):
         """ query the instrument for this channels V/div setting.
@@ -718,50 +992,31 @@ class channel(Scope):
     def get_waveform(self):
         """ Downloads this channels waveform data.
         This function will not make any adjustments to the V/div settings.
+        The preamble (WFMPre?) and the data (CURVE?) are fetched with a single
+        request; the preamble is kept by the scope until its settings change,
+        so later downloads of the channel only ask for the data.
         """
-        self.issueCommand("DAT:ENC RPB")
-        self.issueCommand("DATA:SOUrce CH" + str(self.channel), "Setting data source to channel " + str(self.channel))
-        self.input_range = self.get_yScale()
-
-        # self.write("WFMPre?")
-
-        encoding = self.inst.query("WFMPre:ENCdg?")
-        self.y_offset = float(self.inst.query("WFMP:YOF?"))
-        self.y_mult = float(self.inst.query("WFMP:YMU?"))
-        self.y_zero = float(self.inst.query("WFMP:YZE?"))
-        self.x_zero = float(self.inst.query("WFMPre:XZE?")) or 0
-        self.x_incr = float(self.inst.query("WFMP:XIN?"))
-
-        self.inst.write("CURVE?")
-        ans = self.inst.read(raw=True)[: -1]  # remove "\n" at the line end
-        # if "#" not in ans[0].decode("ascii"):
-        #     print("scope: <<%s" % ans[0].decode("ascii"))
-        #     raise "Error reading waveform"
-
-        num_bytes = int(ans[1])
-        self.x_num = 10000  # int(ans[2: 2 + num_bytes])
-        tmp = ans[7:]  # Signal
-        # 510000
-
-        if encoding == 'ascii':
-            out = tmp.split(":CURVE ")[1]
-            data = out.split(',')
-        else:
-            data = np.frombuffer(tmp, dtype=np.uint8)
-
+        self.inst.fetch_waveforms([self])
+        return [self.data_x, self.data_y]
+
+    def set_waveform(self, preamble, payload):
+        """ Sets the data of the channel from its preamble and the binary data points."""
+        self.preamble = preamble
+        self.input_range = preamble.volts_per_div
+        self.y_offset = preamble.y_offset
+        self.y_mult = preamble.y_mult
+        self.y_zero = preamble.y_zero
+        self.x_zero = preamble.x_zero
+        self.x_incr = preamble.x_incr
+        self.x_num = preamble.nr_pt
+
+        data = np.frombuffer(payload, dtype=preamble.dtype())
         self.signal_raw = data
-        data_y = ((data - self.y_offset) * self.y_mult) + self.y_zero
-        data_x = self.x_zero + np.arange(data.size) * self.x_incr
+        self.data_y = ((data - self.y_offset) * self.y_mult) + self.y_zero
+        self.data_x = self.x_zero + np.arange(data.size) * self.x_incr
 
         if self.x_num != data.size:
             print("======================================================")
             print("WARNING: Data payload was stated as " + str(self.x_num) + " points")
             print("but " + str(data.size) + " points were returned for CH" + str(self.channel))
             print("======================================================")
-
-        # if self.did_clip() is True:
-        #    print("=======================================================")
-        #    print("WARNING: Data payload possibly contained clipped points")
-        #    print("=======================================================")
-
-        return [data_x, data_y]
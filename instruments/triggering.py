@@ -5,6 +5,9 @@
 import logging
 import re
 import socket
+import threading
+import numpy as np
+from instruments import shadow
 
 _log = logging.getLogger(__name__)
 
@@ -58,6 +61,27 @@ except:
 regex = re.compile('(\S+)[\s*]=[\s*]"(\S+)"')
 
 
+def formatSettings(settings):
+    """Return the settings {physical_name: value} as a block of commands, one
+    per line, in the format of the settings files."""
+    return "\r\n".join('%s = "%d"' % (name, value) for name, value in settings.items())
+
+
+def cameraFrameTimes(settings, num_frames):
+    """Return the time (s) of the camera frames after the trigger.
+
+    settings is a dictionary {logical_name: value} with the triggering
+    settings. The plasma frames are triggered by B2 (delay and period in 1 us).
+    With CMOSPOn unchecked a laser frame, delayed by B4 (0.1 us), follows each
+    plasma frame, so the frames alternate between plasma and laser."""
+    delay = settings["B2_Delay"] * 1e-6
+    period = settings["B2_Period"] * 1e-6
+    frames = np.arange(num_frames)
+    if settings["CMOSPOn"]:
+        return delay + frames * period
+    return delay + (frames // 2) * period + (frames % 2) * settings["B4_Delay"] * 1e-7
+
+
 class TriggerUnit():
     MAX_MESSAGE_SIZE = 65536
 
@@ -76,6 +100,8 @@ class TriggerUnit():
         self._cmd_sock = None
         self.connection_status = False
         self.debug = debug
+        self.lock = threading.RLock()  # serializes the command/answer exchanges
+        self.shadow = shadow.ShadowSettings()  # settings last confirmed by the system
 
         if ip is not None:
             self.openConnection(self.ip, self.port)
@@ -83,6 +109,7 @@ class TriggerUnit():
     def openConnection(self, ip=None, port=15000, cmd_timeout=1):
         self.ip = ip or self.ip
         self.port = port or self.port
+        self.shadow.invalidate()
         try:
             # Set up the command connection
             print("Trying to connect to the Triggering unit - CompactRio (IP: %s, port: %s)." % (self.ip, self.port))
@@ -98,8 +125,9 @@ class TriggerUnit():
     def isConnected(self):
         try:
             # Makes a simple request and wait for the answer to check if the connection is working
-            self._cmd_sock.send(b'Mode = "?"\r\n')
-            recv = self._cmd_sock.recv(self.MAX_MESSAGE_SIZE).decode('latin-1')
+            with self.lock:
+                self._cmd_sock.send(b'Mode = "?"\r\n')
+                recv = self._cmd_sock.recv(self.MAX_MESSAGE_SIZE).decode('latin-1')
             if len(recv) > 0:
                 self.connection_status = True
                 return True
@@ -115,6 +143,7 @@ class TriggerUnit():
             self._cmd_sock.close()
             self._cmd_sock = None
             self.connection_status = False
+        self.shadow.invalidate()
 
     def _SendCommandAsync(self, cmd):
         """Send command without waiting for the response.
@@ -153,17 +182,88 @@ class TriggerUnit():
         except:
             return ""
 
+    def _ReceiveResponses(self, count):
+        """Receive the responses of count commands sent in one message, one line
+        per command, in order. Responses missing when the connection fails or
+        times out are returned as blank strings."""
+        recv = ""
+        try:
+            while recv.count("\n") < count:
+                block = self._cmd_sock.recv(self.MAX_MESSAGE_SIZE).decode('latin-1')
+                if len(block) == 0:
+                    break
+                recv += block
+        except ConnectionAbortedError:
+            self.closeConnection()
+            print("cRio: Connection Aborted Error")
+        except:
+            pass
+        lines = [line.strip() for line in recv.split("\n") if line.strip()]
+        _log.debug("RECV(%d lines of %d)", len(lines), count)
+        if self.debug:
+            print("cRio: <<%s" % "\n".join(lines))
+        return (lines + [""] * count)[:count]
+
     def _SendCommand(self, cmd):
         """Send a command to the camera, and return the response."""
-        self._SendCommandAsync(cmd)
-        return self._ReceiveCommandResponse()
+        with self.lock:
+            self._SendCommandAsync(cmd)
+            return self._ReceiveCommandResponse()
 
     def sendSettings(self, name, value):
         """Send a setting to the Triggering system. Returns error flag"""
         if self.connection_status:
             cmd = '%s = "%d"' % (name, value)
             ans = self._SendCommand(cmd)
-            return False if 'Ok' in ans else True
+            if 'Ok' in ans:
+                self.shadow.confirm({name: value})
+                return False
+            self.shadow.discard([name])
+            return True
+
+    def sendSettingsBlock(self, settings):
+        """Send several settings {name: value} to the Triggering system in one
+        message and read all the acknowledgements in one pass.
+        Returns the names of the settings not acknowledged (empty if no error).
+
+        The answers are matched by name when they all carry the name of their
+        setting. Otherwise they are matched in order, only if one answer was
+        received per setting; if some are missing, it is unknown which ones,
+        so none of the settings is confirmed."""
+        if self.connection_status:
+            with self.lock:
+                self._SendCommandAsync(formatSettings(settings))
+                answers = [ans for ans in self._ReceiveResponses(len(settings)) if ans]
+            matches = [regex.search(ans) for ans in answers]
+            if answers and all(match and match.group(1) in settings for match in matches):
+                acked = set(match.group(1) for match, ans in zip(matches, answers) if 'Ok' in ans)
+            elif len(answers) == len(settings):
+                acked = set(name for name, ans in zip(settings, answers) if 'Ok' in ans)
+            else:
+                _log.error("%d answers to %d settings, none of them confirmed", len(answers), len(settings))
+                acked = set()
+            errors = [name for name in settings if name not in acked]
+            self.shadow.discard(errors)
+            self.shadow.confirm(dict((name, settings[name]) for name in settings if name not in errors))
+            return errors
+
+    def applySettings(self, settings, force=False):
+        """Send the settings {name: value} that changed since they were last
+        confirmed by the Triggering system. On a full resync (forced, after
+        reconnecting or after shadow.resync_interval seconds) all of them are
+        sent and verified by reading them back.
+        Returns the names of the settings not applied (empty if no error)."""
+        if self.connection_status:
+            send, full = self.shadow.changes(settings, force)
+            if not send:
+                return []
+            errors = self.sendSettingsBlock(send)
+            if full and not errors:
+                values = self.readSettingsBlock(list(send)) or {}
+                errors = [name for name in send if values.get(name) != send[name]]
+                self.shadow.discard(errors)
+                self.shadow.confirm({}, full=not errors)
+            return errors
 
     def readSettings(self, name):
         """Reads a setting from the Triggering system.
@@ -179,6 +279,27 @@ class TriggerUnit():
         else:
             return None
 
+    def readSettingsBlock(self, names):
+        """Reads several settings from the Triggering system in one message.
+        Returns a dictionary {name: value} with the settings read; the settings
+        without a valid answer (e.g. on a time out) are left out."""
+        if self.connection_status:
+            with self.lock:
+                self._SendCommandAsync("\r\n".join('%s = "?"' % name for name in names))
+                answers = self._ReceiveResponses(len(names))
+            # the answers are matched by name, so a missing answer does not shift the others
+            values = {}
+            for res in answers:
+                match = regex.search(res)
+                if match and match.group(1) in names and match.group(2).lstrip("-").isdigit():
+                    values[match.group(1)] = int(match.group(2))
+            for name in names:
+                if name not in values:
+                    _log.error("No valid response to %s", name)
+            return values
+        else:
+            return None
+
     def setMode(self, mode):
         cmd = 'Mode = "%d"' % mode
         ans = self._SendCommand(cmd)
@@ -189,7 +310,8 @@ class TriggerUnit():
         return ans
 
     def readStatus(self):
-        self.io_enabled = bool(self.readSettings("IOs_enabled"))
-        self.laser_ready = bool(self.readSettings("Laser_Ready_I"))
-        self.interlock = bool(self.readSettings("Interlock"))
+        values = self.readSettingsBlock(["IOs_enabled", "Laser_Ready_I", "Interlock"]) or {}
+        self.io_enabled = bool(values.get("IOs_enabled"))
+        self.laser_ready = bool(values.get("Laser_Ready_I"))
+        self.interlock = bool(values.get("Interlock"))
         return self.io_enabled, self.laser_ready, self.interlock
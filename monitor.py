@@ -0,0 +1,209 @@
+"""
+    monitor.py
+    ----------
+    Background polling of the status of the instruments and detection of
+    the trigger of a shot.
+"""
+
+import logging
+import threading
+import time
+from collections import namedtuple
+from PyQt5 import QtCore
+
+_log = logging.getLogger(__name__)
+
+# Status snapshots published to the UI. They are immutable, so they can be
+# handed over from the polling threads to the GUI thread as they are.
+LaserStatus = namedtuple("LaserStatus", "connected error voltages")
+TriggerStatus = namedtuple("TriggerStatus", "connected io_enabled laser_ready interlock")
+OphirStatus = namedtuple("OphirStatus", "connected head1 head2")
+I2PSStatus = namedtuple("I2PSStatus", "connected voltages currents errors ps_enabled pulse_enabled")
+
+
+def readLaserStatus(laserPS):
+    """Read the status of the laser power supply. error is None when there is no status answer
+    and voltages is None if the voltages of the banks could not be read."""
+    with laserPS.lock:
+        if not laserPS.isConnected():
+            return LaserStatus(False, None, None)
+        error = laserPS.getPowerErrorStr() if laserPS.getLaserStatus() else None
+        try:
+            voltages = tuple(laserPS.getVoltageBanksAll()[:4])
+        except:
+            voltages = None
+    return LaserStatus(True, error, voltages)
+
+
+def readTriggerStatus(cRio):
+    """Read the status flags of the CompactRio."""
+    with cRio.lock:
+        if not cRio.isConnected():
+            return TriggerStatus(False, False, False, False)
+        io_enabled, laser_ready, interlock = cRio.readStatus()
+    return TriggerStatus(True, io_enabled, laser_ready, interlock)
+
+
+def readOphirStatus(ophir):
+    """Read the energy of both heads of the power meter (0 if there is no measurement)."""
+    with ophir.lock:
+        if not ophir.isConnected():
+            return OphirStatus(False, 0, 0)
+        head1, head2 = ophir.getData()
+    return OphirStatus(True, max(head1, 0), max(head2, 0))
+
+
+def readI2PSStatus(i2ps):
+    """Read the voltages (PP/MCP, MCP, PC high side, PC low side), the currents (PP, MCP,
+    PC high side, PC low side), the error flags and the enable state of the image
+    intensifier power supply."""
+    with i2ps.lock:
+        if not i2ps.isConnected():
+            return I2PSStatus(False, None, None, None, False, False)
+        voltages, currents, errors, ps_enabled, pulse_enabled = i2ps.getSnapshot()
+        return I2PSStatus(True, voltages, currents, errors, ps_enabled, pulse_enabled)
+
+
+class DevicePoller(QtCore.QObject):
+    """Poll the status of one device in a background thread.
+
+    funcRead() returns a status snapshot, which is published with the status
+    signal (delivered in the GUI thread). The device is polled every
+    armed_interval seconds while the system is armed (waiting for a trigger)
+    and every idle_interval seconds otherwise.
+    """
+
+    status = QtCore.pyqtSignal(object)
+
+    def __init__(self, name, funcRead, idle_interval=2.0, armed_interval=0.5):
+        super().__init__()
+        self.name = name
+        self.funcRead = funcRead
+        self.idle_interval = idle_interval
+        self.armed_interval = armed_interval
+        self.armed = False
+        self.enabled = True
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="poll %s" % self.name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def setArmed(self, armed):
+        """Change the poll rate. The device is polled right away when the system is armed."""
+        if armed != self.armed:
+            self.armed = armed
+            self._wake.set()
+
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+        self._wake.set()
+
+    def interval(self):
+        return self.armed_interval if self.armed else self.idle_interval
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.enabled:
+                try:
+                    self.status.emit(self.funcRead())
+                except Exception as error:
+                    _log.error("Error while polling %s: %s", self.name, error)
+            self._wake.wait(self.interval())
+            self._wake.clear()
+
+
+class StatusMonitor():
+    """Poll the status of several devices, one thread per device bus.
+
+    Every device is on its own serial port or network connection, so a slow
+    device delays only its own updates and never the GUI."""
+
+    def __init__(self):
+        self.pollers = []
+
+    def add(self, name, funcRead, slot, **kwargs):
+        """Poll funcRead() in the background and pass the snapshots to slot, in the GUI thread."""
+        poller = DevicePoller(name, funcRead, **kwargs)
+        poller.status.connect(slot)
+        self.pollers.append(poller)
+        return poller
+
+    def start(self):
+        for poller in self.pollers:
+            poller.start()
+
+    def stop(self):
+        for poller in self.pollers:
+            poller.stop()
+
+    def setArmed(self, armed):
+        for poller in self.pollers:
+            poller.setArmed(armed)
+
+    def setEnabled(self, enabled):
+        for poller in self.pollers:
+            poller.setEnabled(enabled)
+
+
+class TriggerWatcher(QtCore.QObject):
+    """Watch the instruments for the trigger of a shot in a background thread.
+
+    Each check is a function returning True once the instrument was
+    triggered, polled at its own interval: a few milliseconds for local
+    hardware (the ADC board status) and longer for checks that need a network
+    round trip (the state of a camera). The triggered signal is emitted once,
+    with the time of the trigger detection, and the watcher stops.
+    """
+
+    triggered = QtCore.pyqtSignal(float)
+
+    def __init__(self):
+        super().__init__()
+        self.checks = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, name, funcCheck, interval):
+        """Watch funcCheck(), called every interval seconds."""
+        self.checks.append((name, funcCheck, interval))
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="trigger watcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching (returns immediately, a check in progress is completed in the background)."""
+        self._stop.set()
+
+    def isWatching(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def _run(self):
+        next_check = [time.time()] * len(self.checks)
+        while self.checks and not self._stop.is_set():
+            now = time.time()
+            for i, (name, funcCheck, interval) in enumerate(self.checks):
+                if now < next_check[i]:
+                    continue
+                next_check[i] = now + interval
+                try:
+                    triggered = funcCheck()
+                except Exception as error:
+                    _log.error("Error while checking the trigger of %s: %s", name, error)
+                    triggered = False
+                if triggered and not self._stop.is_set():
+                    _log.info("Trigger detected by %s", name)
+                    self._stop.set()
+                    self.triggered.emit(now)
+                    return
+            self._stop.wait(max(0, min(next_check) - time.time()))
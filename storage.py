@@ -3,6 +3,9 @@
 """Database with MDSplus framework"""
 
 
+import sys
+from collections import namedtuple
+import numpy as np
 import MDSplus as mds
 from instruments import triggering, I2PS
 
@@ -15,7 +18,99 @@ import ssl
 ssl._create_default_https_context = ssl._create_unverified_context
 
 
+MODEL_SHOT = -1
+MODEL_VERSION = 2  # version of buildStructure, increase it whenever the structure changes
+ADC_CHANNELS = 4  # channels of the ADC boards (two boards of two channels)
+SEGMENT_SAMPLES = 65536  # samples per segment of the ADC and scope signals
+
+# Measurement of the power meter stored with a shot (see populateOphir)
+OphirData = namedtuple("OphirData", "name firmware head1 head2 coef1 coef2")
+
+
+def treeName(mode):
+    """Return the name of the MDSplus tree for the operation mode."""
+    if mode == "tokamak":
+        return "mpts"
+    elif mode == "manual":
+        return "mpts_manual"
+    else:
+        raise Exception("Incorret operation mode.")
+
+
+class segmentWriter():
+    """Write a signal node as a sequence of MDSplus segments, chunk by chunk.
+
+    Each chunk is stored as its own segment with its time base, so the data
+    never needs to be in memory as a whole and readers can fetch a part of
+    the signal (e.g. a single camera frame) without decoding all of it.
+    scale is an optional expression of $VALUE applied to the raw segments."""
+
+    def __init__(self, node, scale=None, clear=True):
+        self.node = node
+        if clear:
+            self.node.deleteData()
+        if scale is not None:
+            self.node.setSegmentScale(scale)
+        self.samples = 0
+
+    def putFrames(self, frames, times):
+        """Append frames (frames, height, width), one segment per frame at times (s)."""
+        for frame, t in zip(frames, times):
+            dim = mds.Float64Array([t]).setUnits("second")
+            self.node.makeSegment(mds.Float64(t), mds.Float64(t), dim, mds.Int16Array(frame[np.newaxis]))
+        self.samples += len(frames)
+
+    def putSamples(self, samples, x_zero, x_incr):
+        """Append a chunk of samples of a signal sampled at x_zero + i * x_incr (s)."""
+        start = x_zero + self.samples * x_incr
+        end = start + (samples.size - 1) * x_incr
+        dim = mds.Range(start, end, x_incr)
+        dim.setUnits("second")
+        self.node.makeSegment(mds.Float64(start), mds.Float64(end), dim, mds.makeArray(samples))
+        self.samples += samples.size
+
+
 class database():
+    """Access to the tree of a shot.
+
+    The nodes are looked up by tag through an index built once per tree. On a
+    tree freshly copied from the model all nodes are empty, so the data is
+    written without deleting it first."""
+
+    def __init__(self):
+        self.tree = None
+        self.nodes = {}
+        self.fresh = False
+
+    def openTree(self, tree, fresh=False):
+        """Use the tree for the populate methods and index its tags."""
+        self.tree = tree
+        self.fresh = fresh
+        self.nodes = {}
+        for node in self.tree.getNodeWild("***"):
+            tags = node.getTags()
+            if tags is not None:
+                for tag in tags:
+                    self.nodes[str(tag).split("::")[-1].lstrip("\\").upper()] = node
+
+    def getNode(self, tag):
+        """Return the node with the tag, from the tag index."""
+        key = tag.upper()
+        if key not in self.nodes:
+            self.nodes[key] = self.tree.getNode("\\" + tag)
+        return self.nodes[key]
+
+    def put(self, node, value):
+        if not self.fresh:
+            node.deleteData()
+        node.putData(value)
+
+    def populate(self, values):
+        """Write several values at once, given as a dictionary {tag: value}."""
+        if not self.tree:
+            raise Exception("No Tree Created")
+        for tag, value in values.items():
+            self.put(self.getNode(tag), value)
 
     def updateRefTree(self, mode, number):
         if mode == "tokamak":
@@ -26,17 +121,51 @@ class database():
         refnode.deleteData()
         refnode.putData(number)
 
-    def createTree(self, mode, number):
-        """Create database structure on the fly."""
+    def createModelTree(self, mode):
+        """Create the model tree (shot -1) with the structure of the database.
+
+        New shots are copies of the model tree, so it has to be created again
+        whenever the structure in buildStructure changes. The model stores
+        MODEL_VERSION, so createTree does it when the version does not match."""
+        self.tree = mds.Tree(treeName(mode), MODEL_SHOT, mode='NEW')
+        self.buildStructure()
+        self.tree.addNode("ModelVersion", usage="NUMERIC").addTag("ModelVersion")
+        self.tree.write()
+        mds.Tree(treeName(mode), MODEL_SHOT).getNode("\\ModelVersion").putData(mds.Int32(MODEL_VERSION))
+
+    def modelVersion(self, mode):
+        """Return the version of the model tree, None if it does not exist and 0 if it has no version."""
+        try:
+            return int(mds.Tree(treeName(mode), MODEL_SHOT).getNode("\\ModelVersion").getData())
+        except mds.TreeFOPENR:
+            return None
+        except (mds.TreeNNF, mds.TreeNODATA):
+            return 0
+
+    def createTree(self, mode, number, model=True):
+        """Create the tree of a new shot.
+
+        The tree is copied from the model tree, created again on the fly if it
+        does not exist yet or was built by an older version of buildStructure.
+        With model=False, the structure is built node by node."""
         if number == 1:
-            raise "Tree number cannot be one"
-        if mode == "tokamak":
-            self.tree = mds.Tree("mpts", number, mode='NEW')
-        elif mode == "manual":
-            self.tree = mds.Tree("mpts_manual", number, mode='NEW')
+            raise Exception("Tree number cannot be one")
+        name = treeName(mode)
+        if model:
+            version = self.modelVersion(mode)
+            if version != MODEL_VERSION:
+                print("Creating the model tree for the %s mode (version %s, expected %d)." % (mode, version, MODEL_VERSION))
+                self.createModelTree(mode)
+            mds.Tree(name, MODEL_SHOT).createPulse(number)
+            self.openTree(mds.Tree(name, number), fresh=True)
         else:
-            raise "Incorret operation mode."
+            self.tree = mds.Tree(name, number, mode='NEW')
+            self.buildStructure()
+            self.tree.write()
+            self.openTree(mds.Tree(name, number), fresh=True)
 
+    def buildStructure(self):
+        """Add all nodes and tags of the database to the tree open for editing."""
         self.tree.addNode("OpMode", usage="NUMERIC").addTag("OPMODE")
         self.tree.addNode("TIMESTAMP", usage="TEXT").addTag("Timestamp")
         self.tree.addNode("Operator", usage="TEXT").addTag("Operator")
@@ -110,7 +239,7 @@ class database():
         ADC_node.addNode("RecordLength", usage="NUMERIC").addTag("ADCRecordLength")
         ADC_node.addNode("SampleRate", usage="NUMERIC").addTag("ADCSampleRate")
         # For each channel
-        for i in range(1, 3):
+        for i in range(1, ADC_CHANNELS + 1):
             ADC_ch = ADC_node.addNode("CH%d" % i, usage="STRUCTURE")
             ADC_ch.addTag("ADCCH%d" % i)
             ADC_ch.addNode("name", usage="TEXT").addTag("ADCCH%dName" % i)
@@ -119,6 +248,8 @@ class database():
             ADC_ch.addNode("coupling", usage="TEXT").addTag("ADCCH%dCoupling" % i)
             ADC_ch.addNode("impedance", usage="NUMERIC").addTag("ADCCH%dImpedance" % i)
             ADC_ch.addNode("enabled", usage="NUMERIC").addTag("ADCCH%denabled" % i)
+            ADC_ch.addNode("rising", usage="NUMERIC").addTag("ADCCH%dRising" % i)
+            ADC_ch.addNode("falling", usage="NUMERIC").addTag("ADCCH%dFalling" % i)
 
         scope_node = self.tree.addNode("Scope", usage="STRUCTURE")
         scope_node.addTag("Scope")
@@ -182,223 +313,150 @@ class database():
         node.addTag("SpectrBiasCurrent")
         node.addTag("BiasCurrent")
 
-        self.tree.write()
-
     def populateSettings(self, name, value):
         """Populate all user interface settings to the MDSplus tree datafile"""
-        if not self.tree:
-            raise "No Tree Created"
-        node = self.tree.getNode("\\" + name)
-        node.deleteData()
-        node.putData(value)
+        self.populate({name: value})
 
     def populateLaser(self, wavelength=694.3e-9):
-        node = self.tree.getNode("\\LaserWavelength")
-        node.deleteData()
-        node.putData(mds.Float32(694.3e-9).setUnits("m"))
+        node = self.getNode("LaserWavelength")
+        self.put(node, mds.Float32(694.3e-9).setUnits("m"))
 
     def populateCamera(self, camera=1, enabled=0, name="", serialNumber="", ip="", FrameSync="", ImageFormat=""):
-        cam = self.tree.getNode("\\Phantom%d" % camera)
-        cam.ENABLED.deleteData()
-        cam.ENABLED.putData(enabled)
-        cam.IP.deleteData()
-        cam.IP.putData(ip)
-        cam.FRAMESYNC.deleteData()
-        cam.FRAMESYNC.putData(FrameSync)
-        cam.IMAGEFORMAT.deleteData()
-        cam.IMAGEFORMAT.putData(ImageFormat)
-
-    def populateCameraData(self, data, camera):
+        cam = self.getNode("Phantom%d" % camera)
+        self.put(cam.ENABLED, enabled)
+        self.put(cam.IP, ip)
+        self.put(cam.FRAMESYNC, FrameSync)
+        self.put(cam.IMAGEFORMAT, ImageFormat)
+
+    def populateCameraData(self, data, camera, times=None):
+        """Write the images (frames, height, width) of the camera, taken at times (s)."""
         if data is not None:
             [frames, height, width] = data.shape
-            node = self.tree.getNode("\\Phantom%d" % camera)
-
-            node = self.tree.getNode("\\Phantom%dImageHeight" % camera)
-            node.deleteData()
-            node.putData(height)
-            node = self.tree.getNode("\\Phantom%dImageWidth" % camera)
-            node.deleteData()
-            node.putData(width)
-
-            node = self.tree.getNode("\\Phantom%dSignal" % camera)
-            node.deleteData()
-            node.putData(mds.Int16Array(data))
+            if times is None:
+                times = np.arange(frames, dtype=float)
+            writer = self.cameraWriter(camera, height, width)
+            writer.putFrames(data, times)
+
+    def cameraWriter(self, camera, height, width):
+        """Return a segmentWriter for the images of the camera, to write them as they are downloaded."""
+        node = self.getNode("Phantom%dImageHeight" % camera)
+        self.put(node, height)
+        node = self.getNode("Phantom%dImageWidth" % camera)
+        self.put(node, width)
+        return segmentWriter(self.getNode("Phantom%dSignal" % camera), clear=not self.fresh)
 
     def populateADC(self, description="", enabled=0, RecordLength=0, SampleRate=0):
-        scope = self.tree.getNode("\\ADC")
-        scope.DESCRIPTION.deleteData()
-        scope.DESCRIPTION.putData(description)
-        scope.ENABLED.deleteData()
-        scope.ENABLED.putData(enabled)
-        scope.RECORDLENGTH.deleteData()
-        scope.RECORDLENGTH.putData(RecordLength)
-        scope.SAMPLERATE.deleteData()
-        scope.SAMPLERATE.putData(mds.Int32(SampleRate).setUnits("Samples/s"))
+        scope = self.getNode("ADC")
+        self.put(scope.DESCRIPTION, description)
+        self.put(scope.ENABLED, enabled)
+        self.put(scope.RECORDLENGTH, RecordLength)
+        self.put(scope.SAMPLERATE, mds.Int32(SampleRate).setUnits("Samples/s"))
 
     def populateADCChannel(self, data, ch):
         if data is None:
-            node = self.tree.getNode("\\ADCCH%d" % ch)
-            node.ENABLED.deleteData()
-            node.ENABLED.putData(0)
+            node = self.getNode("ADCCH%d" % ch)
+            self.put(node.ENABLED, 0)
             return
 
-        node = self.tree.getNode("\\ADCCH%d" % data.channel)
-        node.ENABLED.deleteData()
-        node.ENABLED.putData(1)
-        node.COUPLING.deleteData()
-        node.COUPLING.putData("DC")
-        node.IMPEDANCE.deleteData()
-        node.IMPEDANCE.putData(1e6)
+        node = self.getNode("ADCCH%d" % data.channel)
+        self.put(node.ENABLED, 1)
+        self.put(node.COUPLING, "DC")
+        self.put(node.IMPEDANCE, 1e6)
         convExpr = mds.Data.compile("($VALUE-(%s))*%s + %s" % (data.y_offset, data.y_mult, data.y_zero))
         convExpr.setUnits("volt")
-        dim = mds.Range(data.x_zero, data.x_zero + (data.signal_raw.size - 1) * data.x_incr, data.x_incr)
-        dim.setUnits("second")
-        signal = mds.Signal(convExpr, data.signal_raw, dim)
-        node.SIGNAL.deleteData()
-        node.SIGNAL.putData(signal)
-        node.INPUTRANGE.deleteData()
-        node.INPUTRANGE.putData(mds.Float32(data.input_range).setUnits("volts"))
+        writer = segmentWriter(node.SIGNAL, convExpr, clear=not self.fresh)
+        for i in range(0, data.signal_raw.size, SEGMENT_SAMPLES):
+            writer.putSamples(data.signal_raw[i:i + SEGMENT_SAMPLES], data.x_zero, data.x_incr)
+        self.put(node.INPUTRANGE, mds.Float32(data.input_range).setUnits("volts"))
+
+    def populateADCEdges(self, edges, ch):
+        """Write the times of the rising and falling edges of the pulses of an ADC channel (edges is None if not detected)."""
+        rising, falling = edges if edges is not None else ([], [])
+        node = self.getNode("ADCCH%d" % ch)
+        self.put(node.RISING, mds.Float64Array(rising).setUnits("s"))
+        self.put(node.FALLING, mds.Float64Array(falling).setUnits("s"))
 
     def populateScope(self, description="", enabled=0, RecordLength=0, SampleRate=0):
-        scope = self.tree.getNode("\\Scope")
-        scope.DESCRIPTION.deleteData()
-        scope.DESCRIPTION.putData(description)
-        scope.ENABLED.deleteData()
-        scope.ENABLED.putData(enabled)
-        scope.RECORDLENGTH.deleteData()
-        scope.RECORDLENGTH.putData(RecordLength)
-        scope.SAMPLERATE.deleteData()
-        scope.SAMPLERATE.putData(mds.Int32(SampleRate).setUnits("Samples/s"))
+        scope = self.getNode("Scope")
+        self.put(scope.DESCRIPTION, description)
+        self.put(scope.ENABLED, enabled)
+        self.put(scope.RECORDLENGTH, RecordLength)
+        self.put(scope.SAMPLERATE, mds.Int32(SampleRate).setUnits("Samples/s"))
 
     def populateScopeChannel(self, data, ch):
         if data is None:
-            node = self.tree.getNode("\\ScopeCH%d" % ch)
-            node.ENABLED.deleteData()
-            node.ENABLED.putData(0)
-
-        node = self.tree.getNode("\\ScopeCH%d" % data.channel)
-        node.ENABLED.deleteData()
-        node.ENABLED.putData(1)
-        node.COUPLING.deleteData()
-        node.COUPLING.putData("DC")
-        node.IMPEDANCE.deleteData()
-        node.IMPEDANCE.putData(1e6)
+            node = self.getNode("ScopeCH%d" % ch)
+            self.put(node.ENABLED, 0)
+            return
+
+        node = self.getNode("ScopeCH%d" % data.channel)
+        self.put(node.ENABLED, 1)
+        self.put(node.COUPLING, "DC")
+        self.put(node.IMPEDANCE, 1e6)
         convExpr = mds.Data.compile("($VALUE-%s)*%s + %s" % (data.y_offset, data.y_mult, data.y_zero))
         convExpr.setUnits("volt")
-        dim = mds.Range(data.x_zero, data.x_zero + (data.signal_raw.size - 1) * data.x_incr, data.x_incr)
-        dim.setUnits("second")
-        signal = mds.Signal(convExpr, data.signal_raw, dim)
-        node.SIGNAL.deleteData()
-        node.SIGNAL.putData(signal)
-        node.INPUTRANGE.deleteData()
-        node.INPUTRANGE.putData(mds.Float32(data.input_range).setUnits("volts/div"))
+        writer = segmentWriter(node.SIGNAL, convExpr, clear=not self.fresh)
+        for i in range(0, data.signal_raw.size, SEGMENT_SAMPLES):
+            writer.putSamples(data.signal_raw[i:i + SEGMENT_SAMPLES], data.x_zero, data.x_incr)
+        self.put(node.INPUTRANGE, mds.Float32(data.input_range).setUnits("volts/div"))
 
     def populateOphir(self, data, enabled):
-        ophir = self.tree.getNode("\\Ophir")
+        ophir = self.getNode("Ophir")
         if not enabled:
-            ophir.ENABLED.deleteData()
-            ophir.ENABLED.putData(1)
-            ophir.DESCRIPTION.deleteData()
-            ophir.DESCRIPTION.putData("")
-            ophir.HEAD1.deleteData()
-            ophir.HEAD1.putData(0)
-            ophir.HEAD2.deleteData()
-            ophir.HEAD2.putData(0)
-            ophir.COEF1.deleteData()
-            ophir.COEF1.putData(0)
-            ophir.COEF2.deleteData()
-            ophir.COEF2.putData(0)
+            self.put(ophir.ENABLED, 1)
+            self.put(ophir.DESCRIPTION, "")
+            self.put(ophir.HEAD1, 0)
+            self.put(ophir.HEAD2, 0)
+            self.put(ophir.COEF1, 0)
+            self.put(ophir.COEF2, 0)
         else:
-            ophir.ENABLED.deleteData()
-            ophir.ENABLED.putData(0)
-            ophir.DESCRIPTION.deleteData()
-            ophir.DESCRIPTION.putData("%s, ROM version: %s" % (data.name, data.firmware))
-            ophir.HEAD1.deleteData()
-            ophir.HEAD1.putData(data.head1)
-            ophir.HEAD2.deleteData()
-            ophir.HEAD2.putData(data.head2)
-            ophir.COEF1.deleteData()
-            ophir.COEF1.putData(data.coef1)
-            ophir.COEF2.deleteData()
-            ophir.COEF2.putData(data.coef2)
-
-            node = self.tree.getNode("\\OphirEnergyDirect")
-            node.deleteData()
-            node.putData(data.head1 * data.coef1)
-            node = self.tree.getNode("\\OphirEnergyReturn")
-            node.deleteData()
-            node.putData(data.head2 * data.coef2)
+            self.put(ophir.ENABLED, 0)
+            self.put(ophir.DESCRIPTION, "%s, ROM version: %s" % (data.name, data.firmware))
+            self.put(ophir.HEAD1, data.head1)
+            self.put(ophir.HEAD2, data.head2)
+            self.put(ophir.COEF1, data.coef1)
+            self.put(ophir.COEF2, data.coef2)
+
+            node = self.getNode("OphirEnergyDirect")
+            self.put(node, data.head1 * data.coef1)
+            node = self.getNode("OphirEnergyReturn")
+            self.put(node, data.head2 * data.coef2)
 
     def populateIntensifier(self, PPVoltage, MCPVoltage, PCHigh, PCLow, PulseDur, TriggerDelay, IP, Coarse, Fine, Gain, PS):
-        II = self.tree.getNode("\\II")
-        II.PS.deleteData()
-        II.PS.putData(PS)
-        II.DESCRIPTION.deleteData()
-        II.DESCRIPTION.putData("Power Supply of the 4-stage hybrid Image Intensifier.")
+        II = self.getNode("II")
+        self.put(II.PS, PS)
+        self.put(II.DESCRIPTION, "Power Supply of the 4-stage hybrid Image Intensifier.")
         if PS == "Kentech":
-            II.COARSE.deleteData()
-            II.COARSE.putData(Coarse.strip())
-            II.FINE.deleteData()
-            II.FINE.putData(Fine)
-            II.GAIN.deleteData()
-            II.GAIN.putData(Gain)
-            II.PULSEDUR.deleteData()
-            II.PULSEDUR.putData(I2PS.KentechGate(Coarse, Fine))
+            self.put(II.COARSE, Coarse.strip())
+            self.put(II.FINE, Fine)
+            self.put(II.GAIN, Gain)
+            self.put(II.PULSEDUR, I2PS.KentechGate(Coarse, Fine))
             II.PULSEDUR.setUnits("ns")
-            II.PPVOLTAGE.deleteData()
-            II.PPVOLTAGE.putData(4200)
+            self.put(II.PPVOLTAGE, 4200)
             II.PPVOLTAGE.setUnits("V")
-            II.PCHIGH.deleteData()
-            II.PCHIGH.putData(50)
+            self.put(II.PCHIGH, 50)
             II.PCHIGH.setUnits("V")
-            II.PCLOW.deleteData()
-            II.PCLOW.putData(-950)
+            self.put(II.PCLOW, -950)
             II.PCLOW.setUnits("V")
-            II.TRIGGERDELAY.deleteData()
-            II.TRIGGERDELAY.putData(50)
+            self.put(II.TRIGGERDELAY, 50)
             II.TRIGGERDELAY.setUnits("ns")
         else:
-            II.PPVOLTAGE.deleteData()
-            II.PPVOLTAGE.putData(PPVoltage)
+            self.put(II.PPVOLTAGE, PPVoltage)
             II.PPVOLTAGE.setUnits("V")
-            II.MCPVOLTAGE.deleteData()
-            II.MCPVOLTAGE.putData(MCPVoltage)
+            self.put(II.MCPVOLTAGE, MCPVoltage)
             II.MCPVOLTAGE.setUnits("V")
-            II.PCHIGH.deleteData()
-            II.PCHIGH.putData(PCHigh)
+            self.put(II.PCHIGH, PCHigh)
             II.PCHIGH.setUnits("V")
-            II.PCLOW.deleteData()
-            II.PCLOW.putData(PCLow)
+            self.put(II.PCLOW, PCLow)
             II.PCLOW.setUnits("V")
-            II.PULSEDUR.deleteData()
-            II.PULSEDUR.putData(PulseDur)
+            self.put(II.PULSEDUR, PulseDur)
             II.PULSEDUR.setUnits("ns")
-            II.TRIGGERDELAY.deleteData()
-            II.TRIGGERDELAY.putData(TriggerDelay)
+            self.put(II.TRIGGERDELAY, TriggerDelay)
             II.TRIGGERDELAY.setUnits("ns")
-            II.IP.deleteData()
-            II.IP.putData(IP)
+            self.put(II.IP, IP)
 
     def populateComments(self, timestamp="", operator="", email="", aim="", comments=""):
-        node = self.tree.getNode("\\TIMESTAMP")
-        node.deleteData()
-        node.putData(timestamp)
-
-        node = self.tree.getNode("\\Operator")
-        node.deleteData()
-        node.putData(operator)
-
-        node = self.tree.getNode("\\Email")
-        node.deleteData()
-        node.putData(email)
-
-        node = self.tree.getNode("\\Aim")
-        node.deleteData()
-        node.putData(aim)
-
-        node = self.tree.getNode("\\Comments")
-        node.deleteData()
-        node.putData(comments)
+        self.populate({"TIMESTAMP": timestamp, "Operator": operator, "Email": email, "Aim": aim, "Comments": comments})
 
 
 def getLastShot(mode):
@@ -455,6 +513,8 @@ def getLastShotAUGDate():
 
 
 if __name__ == "__main__":
+    # Create the model trees again, after changing the structure of the database
     db = database()
-    db.createTree("tokamak", 1)
-    db.populateSettings()
+    for mode in sys.argv[1:] or ["tokamak", "manual"]:
+        db.createModelTree(mode)
+        print("Model tree created for the %s mode." % mode)
@@ -0,0 +1,72 @@
+"""
+    benchmark_adc.py
+    ----------------
+    Throughput of the ADC readout (AutoDMA pipeline and readout of the
+    on-board memory) with the simulated ATSApi backend, so it can be run on
+    any computer, without the board.
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from instruments import AlazarTech  # noqa: E402
+
+
+def configure(adc, sample_rate, input_range, record_length):
+    adc.AlazarSetCaptureClock(SourceId=1, SampleRateId=AlazarTech.sample_rate_id[sample_rate])
+    for n in range(2):
+        adc.AlazarInputControl(Channel=n + 1, Coupling=2, InputRange=AlazarTech.input_range[input_range], Impedance=1)
+        adc.AlazarSetBWLimit(Channel=n + 1, enable=0)
+    adc.AlazarSetTriggerOperation(Source1=0x02, Slope1=1, Level1=180)
+    adc.AlazarSetExternalTrigger(Coupling=2, Range=2)
+    adc.AlazarSetRecordSize(0, record_length)
+    adc.AlazarSetRecordCount(1)
+
+
+def benchmarkDMA(adc, record_length, averages, records_per_buffer, workers, repeat):
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        adc.readTracesDMA(True, True, record_length, 1, records_per_buffer, nAverage=averages,
+                          timeout=5, firstTimeout=5, nWorkers=workers)
+        times.append(time.perf_counter() - t0)
+    best = min(times)
+    nbytes = 2 * 2 * record_length * averages
+    print("DMA  workers=%d records/buffer=%4d: %8.1f ms  %8.1f MB/s  %s" %
+          (workers, records_per_buffer, 1e3 * best, nbytes / best / 1e6, adc.dma_stats))
+
+
+def benchmarkRead(adc, record_length, repeat):
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        adc.readChannels([1, 2])
+        times.append(time.perf_counter() - t0)
+    best = min(times)
+    print("Read (2 channels, %d samples): %8.1f ms  %8.1f MB/s" % (record_length, 1e3 * best, 2 * 2 * record_length / best / 1e6))
+
+
+def main(argv):
+    record_length = int(argv[1]) if len(argv) > 1 else 4096
+    averages = int(argv[2]) if len(argv) > 2 else 1000
+    repeat = 3
+
+    AlazarTech.loadLibrary("simulated")
+    adc = AlazarTech.Digitizer(backend="simulated")
+    # no wait for the trigger in the benchmark
+    adc._ATS_dll.board(adc._handle).trigger_delay = 0
+    configure(adc, "125 MS/s", "2 V", record_length)
+
+    for records_per_buffer in (10, 100):
+        for workers in (1, 2, 4):
+            benchmarkDMA(adc, record_length, averages, records_per_buffer, workers, repeat)
+    adc.AlazarSetRecordSize(0, record_length)
+    benchmarkRead(adc, record_length, repeat)
+    adc.removeBuffersDMA()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))